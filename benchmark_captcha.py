@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+CAPTCHA Solver Benchmark
+Runs every CAPTCHA solver in the repo against labelled CAPTCHAs the CNN was
+not trained on (the validation split train_captcha_model.py held out of
+data/captchas, or a separate --holdout-dir) and measures exact-match and
+per-character accuracy, p50/p95 latency and throughput on CPU.
+Runs are deterministic (fixed corpus order and seeds, one OCR worker, no
+learned engine ordering) and results are saved for regression comparison.
+"""
+
+import os
+import sys
+import glob
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import builtins
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+from src.captcha_cnn import CAPTCHA_DATA_DIR, CAPTCHA_MODEL_PATH, load_labelled, model_metadata, split_labelled
+
+RESULTS_DIR = os.path.join('data', 'benchmarks')
+# Flag a regression when a solver loses this much exact-match accuracy or gets this much slower (p50)
+ACCURACY_TOLERANCE = 0.02
+LATENCY_TOLERANCE = 0.25
+
+# name -> where the implementation lives
+SOLVERS = {
+    "cnn": "src/captcha_cnn.py CaptchaCNN.solve (trained model)",
+    "ocr_service": "src/ocr_service.py OCREngines.recognize with the CNN and EasyOCR, best candidate (parallel_ip_automation and the other service clients)",
+    "trocr": "TrOCR alone, cleaned like the Playwright path in src/api_service.py",
+    "complete_full": "complete_full_automation.py CompleteFullAutomation.solve_captcha_content",
+    "download_agreements": "download_agreements.py AgreementDownloader.solve_captcha",
+    "headless_ip_switching": "headless_ip_switching.py HeadlessIPSwitching.solve_captcha_automatically",
+    "captcha_first": "captcha_first_automation.py CaptchaFirstAutomation.solve_captcha_with_ocr",
+}
+
+
+class SolverUnavailable(Exception):
+    pass
+
+
+def _no_prompt(prompt=''):
+    """Interactive solvers get the default answer, or the first OCR result when asked to pick one"""
+    if '(1-' in prompt:
+        return '1'
+    if 'default' in prompt:
+        return ''
+    raise EOFError('manual CAPTCHA input is not available in the benchmark')
+
+
+def _prepare(seed, threads):
+    """Same seeds, one OCR worker and CPU only in every solver process"""
+    random.seed(seed)
+    try:
+        import numpy as np
+        np.random.seed(seed)
+    except ImportError:
+        pass
+    try:
+        import torch
+        torch.manual_seed(seed)
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    builtins.input = _no_prompt
+
+
+def _build_solver(name, threads):
+    """solve(content, path) -> answer or None for one solver; raises SolverUnavailable"""
+    try:
+        if name == "cnn":
+            from src.captcha_cnn import get_captcha_model
+            model = get_captcha_model()
+            if model is None:
+                raise SolverUnavailable("no trained model (python train_captcha_model.py)")
+            return lambda content, path: model.solve(content)['text']
+
+        if name in ("ocr_service", "trocr"):
+            import re
+            from src.ocr_service import OCREngines
+            engines = OCREngines(["trocr"] if name == "trocr" else ["easyocr"], torch_threads=threads)
+            if name == "trocr":
+                if "trocr" not in engines.available:
+                    raise SolverUnavailable("TrOCR is not installed")
+
+                def solve(content, path):
+                    candidates = engines.recognize(content, engines=["trocr"])
+                    return re.sub(r'\W+', '', candidates[0]['raw']).strip() if candidates else None
+                return solve
+            if not engines.available:
+                raise SolverUnavailable("no OCR engine or model available")
+
+            def solve(content, path):
+                candidates = engines.recognize(content, engines=["cnn", "easyocr"])
+                return candidates[0]['text'] if candidates else None
+            return solve
+
+        if name == "complete_full":
+            from complete_full_automation import CompleteFullAutomation
+            automation = CompleteFullAutomation()
+            return lambda content, path: automation.solve_captcha_content(content)['text']
+
+        if name == "download_agreements":
+            from download_agreements import AgreementDownloader
+            downloader = AgreementDownloader()
+            return lambda content, path: downloader.solve_captcha(content)
+
+        if name == "headless_ip_switching":
+            from headless_ip_switching import HeadlessIPSwitching
+            automation = HeadlessIPSwitching()
+            return lambda content, path: automation.solve_captcha_automatically(path)
+
+        if name == "captcha_first":
+            from captcha_first_automation import CaptchaFirstAutomation
+            automation = CaptchaFirstAutomation()
+            return lambda content, path: automation.solve_captcha_with_ocr(path)
+    except ImportError as e:
+        raise SolverUnavailable(f"missing dependency: {e}")
+    raise SolverUnavailable(f"unknown solver {name!r}")
+
+
+def _cpu_seconds():
+    """CPU time of this process and its finished children (tesseract runs in subprocesses)"""
+    if not RESOURCE_AVAILABLE:
+        return time.process_time()
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def percentile(values, share):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(share * len(ordered)) - 1))]
+
+
+def score(corpus, answers):
+    """Exact-match (case-sensitive and not) and per-character accuracy against the labels"""
+    from src.captcha_ensemble import align
+
+    exact = nocase = answered = 0
+    characters = 0.0
+    for (_, label), answer in zip(corpus, answers):
+        answer = answer or ''
+        answered += int(bool(answer))
+        exact += int(answer == label)
+        nocase += int(answer.upper() == label.upper())
+        # Levenshtein alignment, so one dropped character does not shift the rest out of place
+        matched = sum(1 for want, got in zip(label, align(label, answer)) if got == want)
+        characters += matched / len(label)
+    n = len(corpus)
+    return {
+        "exact_match": round(exact / n, 4),
+        "exact_match_nocase": round(nocase / n, 4),
+        "char_accuracy": round(characters / n, 4),
+        "answered": round(answered / n, 4),
+    }
+
+
+def bench_solver(name, corpus, seed, threads):
+    """One solver over the corpus, one CAPTCHA at a time. Runs in a fresh process."""
+    _prepare(seed, threads)
+    with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+        started = time.perf_counter()
+        try:
+            solve = _build_solver(name, threads)
+        except SolverUnavailable as e:
+            return {"solver": name, "skipped": str(e)}
+        setup_seconds = time.perf_counter() - started
+
+        images = []
+        for path, _ in corpus:
+            with open(path, 'rb') as f:
+                images.append((path, f.read()))
+        # Lazy model initialisation is not part of the per-CAPTCHA cost
+        try:
+            solve(images[0][1], images[0][0])
+        except Exception:
+            pass
+
+        answers, latencies, errors = [], [], 0
+        cpu_started, wall_started = _cpu_seconds(), time.perf_counter()
+        for path, content in images:
+            timer = time.perf_counter()
+            try:
+                answer = solve(content, path)
+            except Exception:
+                answer = None
+                errors += 1
+            latencies.append((time.perf_counter() - timer) * 1000)
+            answers.append(answer if isinstance(answer, str) else None)
+        seconds = time.perf_counter() - wall_started
+        cpu_seconds = _cpu_seconds() - cpu_started
+
+    result = {
+        "solver": name,
+        "images": len(corpus),
+        "setup_seconds": round(setup_seconds, 2),
+        "seconds": round(seconds, 3),
+        "images_per_second": round(len(corpus) / seconds, 2) if seconds else None,
+        "latency_ms": {"p50": round(percentile(latencies, 0.5), 2), "p95": round(percentile(latencies, 0.95), 2),
+                       "mean": round(sum(latencies) / len(latencies), 2)},
+        "cpu_ms_per_image": round(cpu_seconds / len(corpus) * 1000, 2),
+        "errors": errors,
+        "answers": {path: answer for (path, _), answer in zip(corpus, answers)},
+    }
+    result.update(score(corpus, answers))
+    return result
+
+
+def run_isolated(function, *args):
+    """Run a benchmark in a freshly spawned process so models and caches are its own"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def corpus_fingerprint(corpus):
+    digest = hashlib.sha256()
+    for path, label in corpus:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+        digest.update(label.encode())
+    return digest.hexdigest()[:16]
+
+
+def latest_results(exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, 'captcha_*.json')) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(current, previous_path):
+    """Print per-solver deltas against a previous run; returns the regressed solvers"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    same_corpus = previous['corpus']['fingerprint'] == current['corpus']['fingerprint']
+    if not same_corpus:
+        print(f"⚠️  {previous_path} used a different corpus; deltas are not comparable")
+    before = {r['solver']: r for r in previous['results'] if not r.get('skipped')}
+    regressions = []
+    print(f"\n📈 Compared with {previous_path}")
+    for result in current['results']:
+        old = before.get(result['solver'])
+        if not old or result.get('skipped'):
+            continue
+        accuracy_delta = result['exact_match'] - old['exact_match']
+        latency_ratio = result['latency_ms']['p50'] / old['latency_ms']['p50'] if old['latency_ms']['p50'] else 1
+        regressed = accuracy_delta < -ACCURACY_TOLERANCE or latency_ratio > 1 + LATENCY_TOLERANCE
+        if regressed:
+            regressions.append(result['solver'])
+        changed = ''
+        if same_corpus:
+            changed = sum(1 for image, answer in result['answers'].items() if old['answers'].get(image) != answer)
+            changed = f", {changed} answers changed"
+        print(f"   {'❌' if regressed else '✅'} {result['solver']:<22} exact {accuracy_delta:+.3f}, "
+              f"p50 latency {(latency_ratio - 1) * 100:+.0f}%{changed}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CAPTCHA solvers on the labelled CAPTCHA corpus')
+    parser.add_argument('--data-dir', default=CAPTCHA_DATA_DIR,
+                        help='Folder with labels.csv and/or labelled/<TEXT>.png images')
+    parser.add_argument('--model', help='CNN model file (default: CAPTCHA_MODEL)')
+    parser.add_argument('--split', choices=['validation', 'all'], default='validation',
+                        help="'validation' = only the CAPTCHAs the CNN was not trained on, "
+                             "'all' = the whole corpus (inflates the cnn solver)")
+    parser.add_argument('--holdout-dir', help='Benchmark this separate labelled folder instead of --data-dir')
+    parser.add_argument('--solvers', nargs='+', choices=list(SOLVERS), help='Solvers to run (default: all)')
+    parser.add_argument('--limit', type=int, help='Benchmark a seeded sample of this many CAPTCHAs')
+    parser.add_argument('--seed', type=int, default=42, help='Sample and solver seed (same seed, same run)')
+    parser.add_argument('--threads', type=int, default=1, help='Torch threads per solver')
+    parser.add_argument('--compare', help="Previous results file, or 'latest'")
+    parser.add_argument('--output', help='Results file')
+    args = parser.parse_args()
+
+    # Inherited by the solver processes: no learned engine order, no writes to the
+    # live statistics or training data, jobs finish in submission order, CPU only
+    os.environ.update({
+        'CAPTCHA_STATS_DB': '',
+        'CAPTCHA_LABEL_ACCEPTED': 'false',
+        'CAPTCHA_DEBUG': 'false',
+        'CAPTCHA_OCR_WORKERS': '1',
+        'CUDA_VISIBLE_DEVICES': '',
+        'OMP_NUM_THREADS': str(args.threads),
+    })
+    if args.model:
+        os.environ['CAPTCHA_MODEL'] = args.model
+
+    # The cnn solver must not be scored on its own training images: use the
+    # validation split recorded with the model (or a separate held-out folder)
+    if args.holdout_dir:
+        data_dir = args.holdout_dir
+        corpus = load_labelled(data_dir)
+        split = {"name": "holdout"}
+    else:
+        data_dir = args.data_dir
+        corpus = load_labelled(data_dir)
+        split = {"name": args.split}
+        if args.split == 'validation':
+            metadata = model_metadata(args.model or CAPTCHA_MODEL_PATH)
+            split.update(seed=metadata.get('seed', 0), share=metadata.get('validation_share', 0.1),
+                         trained_on=metadata.get('data_dir'))
+            if not metadata:
+                print("⚠️  No training metadata saved with the model; assuming the trainer defaults "
+                      f"(seed {split['seed']}, validation {split['share']})")
+            corpus = split_labelled(corpus, split['share'], split['seed'])[1]
+    if not corpus:
+        print(f"❌ No labelled CAPTCHAs in {data_dir} ({split['name']} split)")
+        print("   Add labels.csv (file,label) or images named labelled/<TEXT>.png")
+        sys.exit(1)
+    if args.limit and args.limit < len(corpus):
+        corpus = sorted(random.Random(args.seed).sample(corpus, args.limit))
+
+    print("🧪 CAPTCHA SOLVER BENCHMARK")
+    print("=" * 70)
+    print(f"   Corpus: {len(corpus)} CAPTCHAs from {data_dir} ({split['name']} split), seed {args.seed}")
+    print("=" * 70)
+
+    results = []
+    for name in args.solvers or list(SOLVERS):
+        print(f"\n▶️  {name}: {SOLVERS[name]}")
+        result = run_isolated(bench_solver, name, corpus, args.seed, args.threads)
+        results.append(result)
+        if result.get('skipped'):
+            print(f"   ⏭️  Skipped: {result['skipped']}")
+            continue
+        print(f"   ✅ Exact: {result['exact_match']} (ignoring case {result['exact_match_nocase']}), "
+              f"characters: {result['char_accuracy']}, answered: {result['answered']}")
+        print(f"   ⚡ p50 {result['latency_ms']['p50']} ms, p95 {result['latency_ms']['p95']} ms, "
+              f"{result['images_per_second']} CAPTCHA/s, {result['cpu_ms_per_image']} CPU ms each")
+
+    current = {
+        "timestamp": datetime.now().isoformat(),
+        "corpus": {"data_dir": data_dir, "split": split, "images": len(corpus),
+                   "fingerprint": corpus_fingerprint(corpus)},
+        "config": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"captcha_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    regressions = []
+    previous = latest_results(exclude=output) if args.compare == 'latest' else args.compare
+    if previous:
+        regressions = compare(current, previous)
+
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"\n📁 Results saved to: {output}")
+    if regressions:
+        print(f"❌ Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
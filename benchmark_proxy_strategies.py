@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Proxy Rotation Strategy Benchmark
+Replays a search/CAPTCHA/document workload against the local proxy simulator
+and compares rotation, pooling and retry strategies for throughput and cost
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from src.proxy_simulator import ProxySimulator
+from src.enhanced_proxy_manager import EnhancedProxyManager
+from src.bandwidth_tracker import BandwidthTracker
+from src.proxy_router import looks_blocked
+
+TARGET = "http://pay2igr.igrmaharashtra.gov.in"
+
+
+def build_workload(jobs, documents_per_job):
+    """One search job = load form, fetch CAPTCHA, submit, download documents"""
+    workload = []
+    for job in range(jobs):
+        steps = [
+            ("search", "GET", f"{TARGET}/eDisplay/Propertydetails/index"),
+            ("captcha", "GET", f"{TARGET}/captcha?job={job}"),
+            ("search", "POST", f"{TARGET}/eDisplay/Propertydetails/index"),
+        ]
+        for doc in range(documents_per_job):
+            steps.append(("document", "GET", f"{TARGET}/document/{job}-{doc}"))
+        workload.append(steps)
+    return workload
+
+
+class RotationStrategy(ABC):
+    """Decides which proxy session each request uses"""
+    name = "base"
+
+    def __init__(self, proxy_manager):
+        self.proxy_manager = proxy_manager
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def session_for(self, worker_id):
+        """Proxy session ID for the next request of a worker"""
+
+    def report(self, worker_id, session_id, success):
+        pass
+
+
+class RotatePerRequest(RotationStrategy):
+    name = "rotate_per_request"
+
+    def session_for(self, worker_id):
+        return self.proxy_manager.generate_session_id()
+
+
+class StickyPerWorker(RotationStrategy):
+    name = "sticky_rotate_on_block"
+
+    def __init__(self, proxy_manager):
+        super().__init__(proxy_manager)
+        self.sessions = {}
+
+    def session_for(self, worker_id):
+        with self.lock:
+            if worker_id not in self.sessions:
+                self.sessions[worker_id] = self.proxy_manager.generate_session_id()
+            return self.sessions[worker_id]
+
+    def report(self, worker_id, session_id, success):
+        if not success:
+            with self.lock:
+                self.sessions[worker_id] = self.proxy_manager.generate_session_id()
+
+
+class SessionPool(RotationStrategy):
+    name = "session_pool"
+
+    def __init__(self, proxy_manager, size=8, max_uses=30):
+        super().__init__(proxy_manager)
+        self.size = size
+        self.max_uses = max_uses
+        self.pool = [self.proxy_manager.generate_session_id() for _ in range(size)]
+        self.uses = {s: 0 for s in self.pool}
+        self.next_index = 0
+
+    def _replace(self, session_id):
+        if session_id in self.uses:
+            index = self.pool.index(session_id)
+            del self.uses[session_id]
+            new_session = self.proxy_manager.generate_session_id()
+            self.pool[index] = new_session
+            self.uses[new_session] = 0
+
+    def session_for(self, worker_id):
+        with self.lock:
+            session_id = self.pool[self.next_index % self.size]
+            self.next_index += 1
+            self.uses[session_id] += 1
+            # Retire sessions before the site's per-IP threshold
+            if self.uses[session_id] >= self.max_uses:
+                self._replace(session_id)
+            return session_id
+
+    def report(self, worker_id, session_id, success):
+        if not success:
+            with self.lock:
+                self._replace(session_id)
+
+
+STRATEGIES = {
+    RotatePerRequest.name: RotatePerRequest,
+    StickyPerWorker.name: StickyPerWorker,
+    SessionPool.name: SessionPool,
+}
+
+
+def run_strategy(strategy_name, args):
+    """Run one strategy against a fresh simulator with the same seed"""
+    simulator = ProxySimulator(
+        latency_ms=args.latency_ms,
+        failure_rate=args.failure_rate,
+        rate_limit_per_minute=args.rate_limit,
+        block_after_requests=args.block_after,
+        block_probability=args.block_probability,
+        document_bytes=args.document_kb * 1024,
+        log_path=args.log,
+        seed=args.seed,
+    )
+    simulator.start()
+    random.seed(args.seed)
+
+    proxy_manager = EnhancedProxyManager(simulator.proxy_config())
+    strategy = STRATEGIES[strategy_name](proxy_manager)
+    bandwidth = BandwidthTracker(budgets=[], cost_per_gb=args.cost_per_gb)
+    workload = build_workload(args.jobs, args.documents)
+
+    counters = {"requests": 0, "succeeded": 0, "failed": 0, "retries": 0, "jobs_completed": 0}
+    counters_lock = threading.Lock()
+
+    def run_job(worker_index, steps):
+        worker_id = worker_index % args.workers
+        for stage, method, url in steps:
+            for attempt in range(args.retries + 1):
+                session_id = strategy.session_for(worker_id)
+                proxies = proxy_manager.get_sticky_proxy(session_id)
+                success = False
+                try:
+                    response = requests.request(
+                        method, url, proxies=proxies, timeout=10,
+                        hooks=bandwidth.hooks(stage, session_id=session_id)
+                    )
+                    text = response.text if 'html' in response.headers.get('Content-Type', '') else ''
+                    success = response.status_code == 200 and not looks_blocked(response.status_code, text)
+                except requests.RequestException:
+                    success = False
+                strategy.report(worker_id, session_id, success)
+                with counters_lock:
+                    counters["requests"] += 1
+                    if attempt:
+                        counters["retries"] += 1
+                if success:
+                    break
+                if attempt < args.retries:
+                    time.sleep(args.backoff * (2 ** attempt))
+            with counters_lock:
+                counters["succeeded" if success else "failed"] += 1
+            if not success:
+                # The rest of the job depends on this step
+                return
+        with counters_lock:
+            counters["jobs_completed"] += 1
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(run_job, range(len(workload)), workload))
+    elapsed = time.time() - start
+    simulator.stop()
+
+    totals = bandwidth.get_stats()["total"]
+    return {
+        "strategy": strategy_name,
+        "elapsed_seconds": round(elapsed, 2),
+        "jobs_completed": counters["jobs_completed"],
+        "jobs_per_minute": round(counters["jobs_completed"] / elapsed * 60, 2) if elapsed else 0,
+        "steps_succeeded": counters["succeeded"],
+        "steps_failed": counters["failed"],
+        "requests_sent": counters["requests"],
+        "retries": counters["retries"],
+        "total_bytes": totals["total_bytes"],
+        "bytes_per_completed_job": totals["total_bytes"] // max(counters["jobs_completed"], 1),
+        "estimated_cost": totals.get("estimated_cost"),
+        "simulator": simulator.get_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark proxy rotation strategies against a simulated proxy')
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument('--jobs', type=int, default=40, help='Search jobs to replay')
+    parser.add_argument('--documents', type=int, default=3, help='Documents downloaded per job')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent workers')
+    parser.add_argument('--retries', type=int, default=2, help='Retries per step')
+    parser.add_argument('--backoff', type=float, default=0.2, help='Base retry backoff in seconds')
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--failure-rate', type=float, default=0.02)
+    parser.add_argument('--rate-limit', type=int, default=30, help='Requests per exit IP per minute')
+    parser.add_argument('--block-after', type=int, default=40, help='Requests per exit IP before blocking')
+    parser.add_argument('--block-probability', type=float, default=0.005)
+    parser.add_argument('--document-kb', type=int, default=200)
+    parser.add_argument('--cost-per-gb', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--log', type=str, default=None, help='NDJSON request log path')
+    parser.add_argument('--output', type=str, default=None, help='Results JSON path')
+    args = parser.parse_args()
+
+    print("🧪 PROXY STRATEGY BENCHMARK")
+    print("=" * 70)
+    print(f"   Jobs: {args.jobs} x (3 + {args.documents} docs), workers: {args.workers}, retries: {args.retries}")
+    print("=" * 70)
+
+    results = []
+    for name in args.strategies:
+        print(f"\n▶️  {name}")
+        result = run_strategy(name, args)
+        results.append(result)
+        print(f"   ✅ Jobs completed: {result['jobs_completed']}/{args.jobs} "
+              f"({result['jobs_per_minute']} jobs/min)")
+        print(f"   📨 Requests: {result['requests_sent']} (retries: {result['retries']})")
+        print(f"   📶 Bytes/job: {result['bytes_per_completed_job'] / 1024:.1f} KB, "
+              f"cost: {result['estimated_cost']}")
+        print(f"   🚫 Blocked: {result['simulator']['blocked']}, "
+              f"429s: {result['simulator']['rate_limited']}, failed: {result['simulator']['failed']}")
+
+    output = args.output or os.path.join(
+        'data', 'benchmarks', f"proxy_strategies_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"\n📁 Results saved to: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+QR Decode Benchmark
+Generates a deterministic corpus of document-like QR images and measures
+throughput, hit rate and memory of every decode path: the individual cascade
+stages, the full cascade, the finder-pattern pre-filter, the worker decode
+function and QRScraper end to end. Results are saved for regression comparison.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import defaultdict
+from datetime import datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+from src.qr_corpus import generate_corpus
+
+RESULTS_DIR = os.path.join('data', 'benchmarks')
+# Flag a regression when a path loses this much hit rate or throughput
+HIT_RATE_TOLERANCE = 0.02
+THROUGHPUT_TOLERANCE = 0.25
+BREAKDOWN_FACTORS = ['version', 'level', 'module_pixels', 'rotation', 'noise', 'format', 'quality']
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def peak_rss_mb(who=None):
+    if not RESOURCE_AVAILABLE:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def load_corpus(directory, manifest):
+    corpus = []
+    for entry in manifest:
+        with open(os.path.join(directory, entry['file']), 'rb') as f:
+            corpus.append((entry, f.read()))
+    return corpus
+
+
+def score(manifest, decoded):
+    """Hit rate on QR images, false positives on the blank ones, per-factor breakdown"""
+    hits = wrong = false_positives = positives = 0
+    breakdown = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for entry, qr_contents in zip(manifest, decoded):
+        if not entry['qr_contents']:
+            false_positives += int(bool(qr_contents))
+            continue
+        positives += 1
+        hit = set(entry['qr_contents']) <= set(qr_contents)
+        hits += int(hit)
+        wrong += int(bool(qr_contents) and not hit)
+        for factor in BREAKDOWN_FACTORS:
+            counts = breakdown[factor][str(entry.get(factor))]
+            counts[0] += int(hit)
+            counts[1] += 1
+    return {
+        "hit_rate": round(hits / positives, 3) if positives else None,
+        "wrong": wrong,
+        "false_positives": false_positives,
+        "breakdown": {factor: {value: round(h / n, 3) for value, (h, n) in sorted(values.items())}
+                      for factor, values in breakdown.items()},
+    }
+
+
+def bench_in_process(path, directory, manifest):
+    """One decode path over the corpus, single-threaded. Runs in a fresh process."""
+    from src.image_loader import load_grayscale
+    from src.qr_cascade import run_cascade
+    from src.qr_pipeline import decode_qr_bytes
+    from src.qr_prefilter import may_contain_qr
+
+    corpus = load_corpus(directory, manifest)
+    baseline = peak_rss_mb()
+    decoded = []
+    start = time.perf_counter()
+    for entry, content in corpus:
+        if path == 'decode_qr_bytes':
+            decoded.append(decode_qr_bytes(content)['qr_contents'])
+            continue
+        image, _ = load_grayscale(content)
+        if path == 'prefilter':
+            decoded.append(may_contain_qr(image))
+        elif path == 'cascade':
+            decoded.append(run_cascade(image)[0])
+        else:
+            decoded.append(run_cascade(image, [path.split(':', 1)[1]])[0])
+    seconds = time.perf_counter() - start
+
+    result = {"path": path, "images": len(corpus), "seconds": round(seconds, 3),
+              "images_per_second": round(len(corpus) / seconds, 2) if seconds else None,
+              "baseline_rss_mb": baseline, "peak_rss_mb": peak_rss_mb()}
+    if path == 'prefilter':
+        positives = [passed for entry, passed in zip(manifest, decoded) if entry['qr_contents']]
+        negatives = [passed for entry, passed in zip(manifest, decoded) if not entry['qr_contents']]
+        result["recall"] = round(sum(positives) / len(positives), 3) if positives else None
+        result["rejected_blank"] = round(1 - sum(negatives) / len(negatives), 3) if negatives else None
+    else:
+        result.update(score(manifest, decoded))
+    return result
+
+
+def bench_qr_scraper(directory, manifest, workers):
+    """QRScraper over a local HTTP server: fetch threads, pre-filter, process pool, fresh cache"""
+    from bs4 import BeautifulSoup
+    from src.qr_cache import QRDecodeCache
+    from src.qr_pipeline import QRPipeline
+    from src.qr_scraper import QRScraper
+    from src.rate_governor import RateGovernor
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    page = BeautifulSoup(''.join(f'<img src="{entry["file"]}">' for entry in manifest), 'html.parser')
+
+    governor = RateGovernor(state_dir=tempfile.mkdtemp(prefix='qr_bench_'), limits={'127.0.0.1': (1e6, 1000000)})
+    scraper = QRScraper(rate_governor=governor)
+    baseline = peak_rss_mb()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        scraper.qr_pipeline = QRPipeline(scraper.fetch_image, decode_pool=pool, cache=QRDecodeCache(db_path=''))
+        # Start the workers before timing
+        list(pool.map(abs, range(workers)))
+        start = time.perf_counter()
+        found = {r['image_url']: r['qr_contents'] for r in scraper.qr_pipeline.run_page(page, base_url)}
+        seconds = time.perf_counter() - start
+    server.shutdown()
+
+    decoded = [found.get(base_url + entry['file'], []) for entry in manifest]
+    result = {"path": "qr_scraper", "images": len(manifest), "seconds": round(seconds, 3),
+              "images_per_second": round(len(manifest) / seconds, 2) if seconds else None,
+              "workers": workers, "baseline_rss_mb": baseline, "peak_rss_mb": peak_rss_mb(),
+              "worker_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if RESOURCE_AVAILABLE else None,
+              "pipeline": {key: scraper.qr_pipeline.last_stats.get(key) for key in ('prefilter', 'fetch', 'decode')}}
+    result.update(score(manifest, decoded))
+    return result
+
+
+def run_isolated(function, *args):
+    """Run a benchmark in a freshly spawned process so peak memory is its own"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(function, *args).result()
+
+
+def latest_results(exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, 'qr_decode_*.json')) if p != exclude)
+    return paths[-1] if paths else None
+
+
+def compare(current, previous_path):
+    """Print per-path deltas against a previous run; returns the regressed paths"""
+    with open(previous_path) as f:
+        previous = json.load(f)
+    if previous['corpus'] != current['corpus']:
+        print(f"⚠️  {previous_path} used a different corpus ({previous['corpus']}); deltas are not comparable")
+    before = {r['path']: r for r in previous['results']}
+    regressions = []
+    print(f"\n📈 Compared with {previous_path}")
+    for result in current['results']:
+        old = before.get(result['path'])
+        if not old:
+            continue
+        metric = 'recall' if result['path'] == 'prefilter' else 'hit_rate'
+        hit_delta = (result.get(metric) or 0) - (old.get(metric) or 0)
+        speed_ratio = (result['images_per_second'] or 0) / old['images_per_second'] if old.get('images_per_second') else 1
+        regressed = hit_delta < -HIT_RATE_TOLERANCE or speed_ratio < 1 - THROUGHPUT_TOLERANCE
+        if regressed:
+            regressions.append(result['path'])
+        print(f"   {'❌' if regressed else '✅'} {result['path']:<24} {metric} {hit_delta:+.3f}, "
+              f"throughput {(speed_ratio - 1) * 100:+.0f}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark QR decode paths on a generated corpus')
+    parser.add_argument('--images', type=int, default=200, help='Corpus size')
+    parser.add_argument('--seed', type=int, default=42, help='Corpus seed (same seed, same corpus)')
+    parser.add_argument('--negatives', type=float, default=0.2, help='Share of images without a QR code')
+    parser.add_argument('--paths', nargs='+', help='Decode paths to run (default: all)')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help='Decode processes for the QRScraper path')
+    parser.add_argument('--compare', help="Previous results file, or 'latest'")
+    parser.add_argument('--output', help='Results file')
+    args = parser.parse_args()
+
+    # Corpus QR positions are random; learned template regions would only add noise
+    # (and must not end up in the real template database)
+    os.environ['QR_ROI_CACHE'] = 'false'
+
+    from src.qr_cascade import DEFAULT_ORDER
+    all_paths = [f"stage:{name}" for name in DEFAULT_ORDER] + ['cascade', 'prefilter', 'decode_qr_bytes', 'qr_scraper']
+    paths = args.paths or all_paths
+
+    corpus_dir = os.path.join(RESULTS_DIR, 'qr_corpus', f"seed{args.seed}_n{args.images}")
+    manifest = generate_corpus(corpus_dir, count=args.images, seed=args.seed, negative_ratio=args.negatives)
+
+    print("🧪 QR DECODE BENCHMARK")
+    print("=" * 70)
+    print(f"   Corpus: {len(manifest)} images ({sum(1 for e in manifest if e['qr_contents'])} with QR), "
+          f"seed {args.seed}")
+    print("=" * 70)
+
+    results = []
+    for path in paths:
+        print(f"\n▶️  {path}")
+        if path == 'qr_scraper':
+            result = run_isolated(bench_qr_scraper, corpus_dir, manifest, args.workers)
+        else:
+            result = run_isolated(bench_in_process, path, corpus_dir, manifest)
+        results.append(result)
+        if path == 'prefilter':
+            print(f"   ✅ Recall: {result['recall']}, blank images rejected: {result['rejected_blank']}")
+        else:
+            print(f"   ✅ Hit rate: {result['hit_rate']} (wrong: {result['wrong']}, "
+                  f"false positives: {result['false_positives']})")
+        print(f"   ⚡ {result['images_per_second']} img/s, 💾 peak RSS {result['peak_rss_mb']} MB")
+
+    current = {
+        "timestamp": datetime.now().isoformat(),
+        "corpus": {"seed": args.seed, "images": args.images, "negatives": args.negatives},
+        "config": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"qr_decode_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+    regressions = []
+    previous = latest_results(exclude=output) if args.compare == 'latest' else args.compare
+    if previous:
+        regressions = compare(current, previous)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"\n📁 Results saved to: {output}")
+    if regressions:
+        print(f"❌ Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,11 @@ import urllib3
 import json
 import base64
 import io
+from src.captcha_cnn import CNN_ACCEPT_CONFIDENCE, get_captcha_model
+from src.captcha_ensemble import SUBMIT_CONFIDENCE, vote
+from src.captcha_ocr import ACCEPT_CONFIDENCE, VariantEvaluator, tesseract_jobs
+from src.captcha_preprocess import CAPTCHA_DEBUG, captcha_variants, save_captcha_debug, to_pil
+from src.captcha_stats import captcha_outcome, get_captcha_stats
 
 # Try to import OCR libraries
 try:
@@ -53,6 +58,10 @@ class CompleteFullAutomation:
         self.max_captcha_attempts = 10
         self.download_count = 0
         
+        # Outcome of every submitted CAPTCHA; decides which engines/variants/configs go first
+        self.captcha_stats = get_captcha_stats()
+        self.captcha_attempt_id = None
+        
         # Initialize OCR engines
         self.setup_ocr()
         self.print_header()
@@ -122,7 +131,7 @@ class CompleteFullAutomation:
             return False
 
     def download_captcha_image(self, driver):
-        """Download CAPTCHA image with multiple methods"""
+        """Download CAPTCHA image with multiple methods; returns the image bytes"""
         try:
             # Method 1: Find by common CAPTCHA selectors
             selectors = [
@@ -155,129 +164,76 @@ class CompleteFullAutomation:
             if not captcha_url.startswith('http'):
                 captcha_url = f"{self.base_url}{captcha_url}"
             
-            # Download image
+            # Download image (kept in memory; written to disk only with CAPTCHA_DEBUG)
             response = requests.get(captcha_url, verify=False, timeout=10)
             
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
-            filename = f'captcha_{timestamp}.png'
-            filepath = os.path.join(self.captcha_dir, filename)
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
-            print(f"   📷 CAPTCHA downloaded: {filename}")
-            return filepath
+            print(f"   📷 CAPTCHA downloaded ({len(response.content)} bytes)")
+            return response.content
             
         except Exception as e:
             print(f"   ❌ CAPTCHA download failed: {e}")
             return None
 
-    def preprocess_captcha_advanced(self, image_path):
-        """Advanced image preprocessing for better OCR"""
+    def preprocess_captcha_advanced(self, captcha_content):
+        """Advanced image preprocessing for better OCR (threshold, adaptive, OTSU, morphology, contrast/sharpen)"""
         try:
-            # Read image
-            img = cv2.imread(image_path)
-            if img is None:
-                return image_path
-            
-            # Convert to PIL for advanced processing
-            pil_img = Image.open(image_path)
-            
-            # Multiple preprocessing techniques
-            processed_images = []
-            
-            # Technique 1: Basic threshold
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            _, thresh1 = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
-            processed_images.append(thresh1)
-            
-            # Technique 2: Adaptive threshold
-            thresh2 = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
-            processed_images.append(thresh2)
-            
-            # Technique 3: OTSU threshold
-            _, thresh3 = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            processed_images.append(thresh3)
-            
-            # Technique 4: Morphological operations
-            kernel = np.ones((2,2), np.uint8)
-            morph = cv2.morphologyEx(thresh1, cv2.MORPH_CLOSE, kernel)
-            morph = cv2.morphologyEx(morph, cv2.MORPH_OPEN, kernel)
-            processed_images.append(morph)
-            
-            # Technique 5: PIL enhancements
-            enhanced = pil_img.convert('L')  # Grayscale
-            enhanced = ImageEnhance.Contrast(enhanced).enhance(2.0)  # Increase contrast
-            enhanced = ImageEnhance.Sharpness(enhanced).enhance(2.0)  # Increase sharpness
-            enhanced_array = np.array(enhanced)
-            processed_images.append(enhanced_array)
-            
-            # Save all processed versions
-            processed_paths = []
-            base_name = image_path.replace('.png', '')
-            
-            for i, processed in enumerate(processed_images):
-                processed_path = f"{base_name}_processed_{i+1}.png"
-                cv2.imwrite(processed_path, processed)
-                processed_paths.append(processed_path)
-            
-            return processed_paths
+            # All variants from one decode, in memory
+            variants = captcha_variants(captcha_content)
+            
+            if CAPTCHA_DEBUG:
+                saved = save_captcha_debug(self.captcha_dir, captcha_content, variants)
+                print(f"   🐞 CAPTCHA variants saved: {os.path.basename(saved)}")
+            
+            return variants
             
         except Exception as e:
             print(f"   ⚠️ Advanced preprocessing failed: {e}")
-            return [image_path]
+            return [("raw", to_pil(captcha_content))]
 
-    def solve_captcha_tesseract(self, image_paths):
-        """Solve CAPTCHA using Tesseract with multiple configurations"""
+    def solve_captcha_tesseract(self, variants):
+        """Tesseract candidates over all variants and configurations"""
         if not TESSERACT_AVAILABLE:
-            return None
+            return []
         
-        configs = [
-            '--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
-            '--psm 7 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
-            '--psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz',
-            '--psm 13',
-            '--psm 8',
-            '--psm 7',
-            '--psm 6',
-            '--psm 10',
-            '--psm 9'
-        ]
+        # Every variant x config runs concurrently (block modes batched into one
+        # tesseract process), historically best combinations first; stops at the
+        # first high-confidence answer
+        evaluator = VariantEvaluator(min_length=3, max_length=8)
+        jobs = tesseract_jobs([image for _, image in variants], names=[name for name, _ in variants],
+                              scores=self.captcha_stats.tesseract_scores())
+        candidates = evaluator.evaluate(jobs)
+        stats = evaluator.last_stats
         
-        for image_path in image_paths:
-            for config in configs:
-                try:
-                    image = Image.open(image_path)
-                    text = pytesseract.image_to_string(image, config=config).strip()
-                    text = ''.join(c for c in text if c.isalnum())
-                    
-                    if text and len(text) >= 3 and len(text) <= 8:
-                        print(f"   🔍 Tesseract solved: '{text}' (config: {config[:15]}...)")
-                        return text
-                except:
-                    continue
+        if candidates:
+            best = candidates[0]
+            print(f"   🔍 Tesseract: '{best['text']}' (confidence: {best['confidence']:.2f}, "
+                  f"config: {best['config'][:15]}..., {stats['completed']}/{stats['jobs']} runs in {stats['seconds']}s)")
         
-        return None
+        return candidates
 
-    def solve_captcha_easyocr(self, image_paths):
-        """Solve CAPTCHA using EasyOCR"""
+    def solve_captcha_easyocr(self, variants):
+        """EasyOCR candidates over all variants"""
         if not EASYOCR_AVAILABLE:
-            return None
+            return []
         
-        for image_path in image_paths:
+        candidates = []
+        for name, image in variants:
             try:
-                results = self.easyocr_reader.readtext(image_path)
+                results = self.easyocr_reader.readtext(np.asarray(image))
                 for (bbox, text, confidence) in results:
                     text = ''.join(c for c in text if c.isalnum())
-                    if text and len(text) >= 3 and len(text) <= 8 and confidence > 0.5:
-                        print(f"   🔍 EasyOCR solved: '{text}' (confidence: {confidence:.2f})")
-                        return text
+                    if text and len(text) >= 3 and len(text) <= 8:
+                        candidates.append({"text": text, "confidence": float(confidence), "engine": "easyocr",
+                                           "variant": name})
             except:
                 continue
         
-        return None
+        if candidates:
+            best = max(candidates, key=lambda c: c["confidence"])
+            print(f"   🔍 EasyOCR: '{best['text']}' (confidence: {best['confidence']:.2f})")
+        return candidates
 
-    def solve_captcha_basic(self, image_paths):
+    def solve_captcha_basic(self, variants):
         """Basic CAPTCHA solving using simple techniques"""
         try:
             # This is a placeholder for basic pattern recognition
@@ -291,41 +247,90 @@ class CompleteFullAutomation:
         except:
             return None
 
-    def solve_captcha_complete(self, driver):
-        """Complete CAPTCHA solving with all available methods"""
-        print("🤖 Starting automatic CAPTCHA solving...")
-        
-        self.captcha_attempts += 1
-        if self.captcha_attempts > self.max_captcha_attempts:
-            print(f"❌ Maximum CAPTCHA attempts ({self.max_captcha_attempts}) reached")
-            return False
-        
-        # Download CAPTCHA image
-        captcha_path = self.download_captcha_image(driver)
-        if not captcha_path:
-            return False
+    def solve_captcha_content(self, captcha_content):
+        """
+        Best answer for one CAPTCHA image from the model and the OCR engines
         
+        Returns {"text", "engine", "confidence", "candidates", "low_confidence"}; text is
+        None when nothing was read, or (low_confidence) nothing is worth submitting
+        """
         # Advanced preprocessing
-        processed_paths = self.preprocess_captcha_advanced(captcha_path)
+        processed_images = self.preprocess_captcha_advanced(captcha_content)
         
-        # Try all OCR engines
-        captcha_solution = None
+        # Collect candidates from all OCR engines and variants
+        candidates = []
+        captcha_solution, solution_engine = None, None
         
-        for engine in self.ocr_engines:
+        # First choice: the trained CAPTCHA model (milliseconds); OCR engines only when it is unsure
+        model = get_captcha_model()
+        if model:
+            guess = model.solve(captcha_content)
+            print(f"   🧠 CAPTCHA model: '{guess['text']}' (confidence: {guess['confidence']:.2f})")
+            candidates.append(guess)
+            if guess['confidence'] >= CNN_ACCEPT_CONFIDENCE:
+                return {"text": guess['text'], "engine": "cnn", "confidence": guess['confidence'],
+                        "candidates": candidates, "low_confidence": False}
+        
+        # Historically most successful engine first; the rest only if it is unsure
+        for engine in self.captcha_stats.order_engines(self.ocr_engines):
             if engine == "tesseract":
-                captcha_solution = self.solve_captcha_tesseract(processed_paths)
+                candidates.extend(self.solve_captcha_tesseract(processed_images))
             elif engine == "easyocr":
-                captcha_solution = self.solve_captcha_easyocr(processed_paths)
-            elif engine == "basic":
-                captcha_solution = self.solve_captcha_basic(processed_paths)
-            
-            if captcha_solution:
+                candidates.extend(self.solve_captcha_easyocr(processed_images))
+            elif engine == "basic" and not candidates:
+                captcha_solution = self.solve_captcha_basic(processed_images)
+                solution_engine = "basic"
+            if any(c["confidence"] >= ACCEPT_CONFIDENCE for c in candidates):
                 break
         
-        if not captcha_solution:
+        # Confidence-weighted vote per character position
+        ensemble = vote(candidates, min_length=3, max_length=8)
+        if ensemble:
+            print(f"   🗳️  Ensemble: '{ensemble['text']}' (confidence: {ensemble['confidence']:.2f}, "
+                  f"{ensemble['agreeing']}/{ensemble['candidates']} candidates agree)")
+            confident = ensemble['confidence'] >= SUBMIT_CONFIDENCE
+            return {"text": ensemble['text'] if confident else None, "engine": "ensemble",
+                    "confidence": ensemble['confidence'], "candidates": candidates, "low_confidence": not confident}
+        
+        return {"text": captcha_solution, "engine": solution_engine, "confidence": None,
+                "candidates": candidates, "low_confidence": False}
+
+    def solve_captcha_complete(self, driver):
+        """Complete CAPTCHA solving with all available methods"""
+        print("🤖 Starting automatic CAPTCHA solving...")
+        
+        while True:
+            self.captcha_attempts += 1
+            if self.captcha_attempts > self.max_captcha_attempts:
+                print(f"❌ Maximum CAPTCHA attempts ({self.max_captcha_attempts}) reached")
+                return False
+            
+            # Download CAPTCHA image
+            captcha_content = self.download_captcha_image(driver)
+            if not captcha_content:
+                return False
+            started = time.time()
+            
+            solution = self.solve_captcha_content(captcha_content)
+            if solution["text"]:
+                break
+            
+            if solution["low_confidence"]:
+                # A wrong answer costs a full submit round trip; a new CAPTCHA is cheaper
+                print(f"   🔄 Confidence below {SUBMIT_CONFIDENCE:.2f}, fetching a new CAPTCHA "
+                      f"(attempt {self.captcha_attempts})")
+                continue
+            
             print(f"   ❌ All OCR methods failed (attempt {self.captcha_attempts})")
             return False
         
+        # Logged now, judged after the form is submitted (record_captcha_outcome)
+        captcha_solution = solution["text"]
+        self.captcha_attempt_id = self.captcha_stats.log_attempt(
+            captcha_content, solution["candidates"], captcha_solution, engine=solution["engine"],
+            confidence=solution["confidence"], latency=time.time() - started, source="complete_full_automation"
+        )
+        
         # Enter CAPTCHA solution
         try:
             captcha_selectors = [
@@ -362,6 +367,19 @@ class CompleteFullAutomation:
             print(f"   ❌ Failed to enter CAPTCHA: {e}")
             return False
 
+    def record_captcha_outcome(self, driver):
+        """Tell the CAPTCHA statistics whether the site accepted the last answer"""
+        try:
+            accepted = captcha_outcome(driver.page_source)
+        except Exception:
+            return
+        if accepted is False:
+            print("   ❌ CAPTCHA was rejected by the site")
+        labelled = self.captcha_stats.record_outcome(self.captcha_attempt_id, accepted)
+        if labelled:
+            print(f"   🏷️  CAPTCHA added to training data: {os.path.basename(labelled)}")
+        self.captcha_attempt_id = None
+
     def submit_form_and_wait(self, driver):
         """Submit form and wait for results"""
         try:
@@ -599,6 +617,8 @@ class CompleteFullAutomation:
                 if self.solve_captcha_complete(driver):
                     # Submit form
                     if self.submit_form_and_wait(driver):
+                        self.record_captcha_outcome(driver)
+                        
                         # Download documents
                         downloaded = self.download_documents_advanced(driver)
                         
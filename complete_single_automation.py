@@ -2,7 +2,7 @@
 """
 COMPLETE SINGLE AUTOMATION SCRIPT - DUAL BROWSER VERSION
 Everything automated in one script:
-- Chrome for Thordata proxy requests (CAPTCHA downloads, etc.)
+- Local proxy relay injecting Thordata session auth (no second browser)
 - Firefox for website automation (form filling, submission)
 - IP switching for each search
 - CAPTCHA solving with OCR
@@ -18,9 +18,11 @@ from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 import urllib3
+from src.captcha_ensemble import SUBMIT_CONFIDENCE, vote
+from src.captcha_stats import captcha_outcome, get_captcha_stats
+from src.local_proxy import UpstreamProxy, configure_firefox_proxy, get_local_proxy_relay
 urllib3.disable_warnings()
 
 # Try to import OCR libraries
@@ -46,7 +48,7 @@ class DualBrowserAutomation:
         self.data_dir = "data/dual_browser_automation"
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Thordata proxy configuration for Chrome requests
+        # Thordata proxy configuration (served to Firefox through the local relay)
         self.proxy_config = {
             'host': '42q6t9rp.pr.thordata.net',
             'port': '9999',
@@ -63,9 +65,15 @@ class DualBrowserAutomation:
             except:
                 print("⚠️ EasyOCR initialization failed")
         
+        # Outcome of every submitted CAPTCHA (accepted answers become training data)
+        self.captcha_stats = get_captcha_stats()
+        self.last_captcha_path = None
+        self.last_captcha_candidates = []
+        self.last_captcha_engine = "manual"
+        
         # Browser instances
         self.firefox_driver = None  # For website automation
-        self.chrome_driver = None   # For Thordata proxy requests
+        self.local_proxy_port = None  # Local relay port for the current Thordata session
         self.wait = None
         self.session_counter = 0
         
@@ -78,41 +86,27 @@ class DualBrowserAutomation:
             {"year_db": 2, "reg_year": 2020, "village": "Kandivali"},
         ]
 
-    def setup_chrome_for_thordata(self, session_id):
-        """Setup Chrome browser specifically for Thordata proxy requests"""
+    def setup_local_proxy(self, session_id):
+        """Open a local relay port that forwards to the Thordata session with auth"""
         try:
-            # Close existing Chrome if any
-            if self.chrome_driver:
-                self.chrome_driver.quit()
-                time.sleep(1)
-            
-            # Chrome options for Thordata proxy
-            chrome_options = ChromeOptions()
+            relay = get_local_proxy_relay()
+            if self.local_proxy_port:
+                relay.remove_port(self.local_proxy_port)
             
             # Thordata proxy setup
-            proxy_host = self.proxy_config['host']
-            proxy_port = self.proxy_config['port']
             full_username = f"{self.proxy_config['username']}-sessid-{session_id}"
-            proxy_password = self.proxy_config['password']
-            
-            # Configure proxy for Chrome
-            proxy_url = f"http://{full_username}:{proxy_password}@{proxy_host}:{proxy_port}"
-            chrome_options.add_argument(f'--proxy-server={proxy_url}')
-            
-            # Chrome-specific settings
-            chrome_options.add_argument('--headless')  # Chrome runs headless for proxy requests
-            chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-            chrome_options.add_argument('--disable-web-security')
-            chrome_options.add_argument('--ignore-certificate-errors')
-            chrome_options.add_argument('--log-level=3')
-            chrome_options.add_argument('--silent')
-            
-            self.chrome_driver = webdriver.Chrome(options=chrome_options)
-            print(f"🚗 Chrome setup for Thordata proxy (session: {session_id})")
+            upstream = UpstreamProxy(
+                self.proxy_config['host'],
+                self.proxy_config['port'],
+                full_username,
+                self.proxy_config['password']
+            )
+            self.local_proxy_port = relay.add_upstream(upstream)
+            print(f"🔌 Local proxy 127.0.0.1:{self.local_proxy_port} -> Thordata (session: {session_id})")
             return True
             
         except Exception as e:
-            print(f"❌ Chrome setup failed: {e}")
+            print(f"❌ Local proxy setup failed: {e}")
             return False
 
     def setup_firefox_for_website(self):
@@ -130,6 +124,10 @@ class DualBrowserAutomation:
             firefox_options.set_preference("dom.webdriver.enabled", False)
             firefox_options.set_preference("useAutomationExtension", False)
             
+            # Route Firefox through the authenticated local relay
+            if self.local_proxy_port:
+                configure_firefox_proxy(firefox_options, self.local_proxy_port)
+            
             # Visible Firefox (you can see what's happening)
             # firefox_options.add_argument('--headless')  # Uncomment for headless
             
@@ -152,8 +150,8 @@ class DualBrowserAutomation:
             
             print(f"\n🔄 SETTING UP DUAL BROWSERS (Session: {session_id})")
             
-            # Setup Chrome for Thordata proxy requests
-            if not self.setup_chrome_for_thordata(session_id):
+            # Setup local relay for Thordata proxy auth
+            if not self.setup_local_proxy(session_id):
                 return None
             
             # Setup Firefox for website automation
@@ -167,10 +165,13 @@ class DualBrowserAutomation:
             print(f"❌ Dual browser setup failed: {e}")
             return None
 
-    def solve_captcha_with_chrome_thordata(self, session_id):
-        """Solve CAPTCHA using Chrome with Thordata proxy - SIMPLIFIED & RELIABLE VERSION"""
+    def solve_captcha_with_thordata(self, session_id):
+        """Solve CAPTCHA via the Thordata session - SIMPLIFIED & RELIABLE VERSION"""
         try:
             print("🤖 Solving CAPTCHA with simplified approach...")
+            self.last_captcha_path = None
+            self.last_captcha_candidates = []
+            self.last_captcha_engine = "manual"
             
             # Get CAPTCHA image URL from Firefox
             captcha_img = self.wait.until(
@@ -200,19 +201,18 @@ class DualBrowserAutomation:
                     
             except Exception as e:
                 print(f"   ⚠️ Direct download failed: {e}")
-                print("   🚗 Trying Chrome screenshot method...")
+                print("   🦊 Trying Firefox element screenshot method...")
                 
                 try:
-                    self.chrome_driver.get(captcha_src)
-                    time.sleep(2)
-                    self.chrome_driver.save_screenshot(captcha_path)
-                    print(f"   ✅ Chrome screenshot saved: {captcha_path}")
+                    captcha_img.screenshot(captcha_path)
+                    print(f"   ✅ Firefox screenshot saved: {captcha_path}")
                 except Exception as e2:
-                    print(f"   ❌ Chrome screenshot failed: {e2}")
+                    print(f"   ❌ Firefox screenshot failed: {e2}")
                     return self.get_manual_captcha_input()
             
             # Show the CAPTCHA image path to user
             print(f"   📁 CAPTCHA saved at: {captcha_path}")
+            self.last_captcha_path = captcha_path
             
             # Try OCR methods
             ocr_results = []
@@ -273,14 +273,20 @@ class DualBrowserAutomation:
                 for i, (text, conf, method) in enumerate(ocr_results):
                     print(f"      {i+1}. '{text}' from {method} (confidence: {conf:.2f})")
                 
-                # If we have a high-confidence result, offer it as default
-                best_result = max(ocr_results, key=lambda x: x[1])
-                if best_result[1] > 0.8:
-                    print(f"\n   🎯 Best result: '{best_result[0]}' (confidence: {best_result[1]:.2f})")
+                # Confidence-weighted vote across engines and configs; offer it as default if confident
+                self.last_captcha_candidates = [
+                    {"text": text, "confidence": conf, "engine": method.split('-')[0].lower(), "config": method}
+                    for text, conf, method in ocr_results
+                ]
+                ensemble = vote(self.last_captcha_candidates, min_length=4, max_length=8, case_sensitive=False)
+                if ensemble and ensemble['confidence'] >= SUBMIT_CONFIDENCE:
+                    print(f"\n   🎯 Best result: '{ensemble['text']}' (confidence: {ensemble['confidence']:.2f}, "
+                          f"{ensemble['agreeing']}/{ensemble['candidates']} results agree)")
                     use_ocr = input(f"   ✅ Use this result? (y/n, default y): ").strip().lower()
                     if use_ocr != 'n':
-                        print(f"   ✅ Using OCR result: '{best_result[0]}'")
-                        return best_result[0]
+                        print(f"   ✅ Using OCR result: '{ensemble['text']}'")
+                        self.last_captcha_engine = "ensemble"
+                        return ensemble['text']
                 
                 # Show options to user
                 print(f"\n   👀 Please check the Firefox browser to see the actual CAPTCHA")
@@ -294,6 +300,7 @@ class DualBrowserAutomation:
                     elif choice.isdigit() and 1 <= int(choice) <= len(ocr_results):
                         selected = ocr_results[int(choice)-1]
                         print(f"   ✅ Using selected result: '{selected[0]}'")
+                        self.last_captcha_engine = selected[2].split('-')[0].lower()
                         return selected[0]
                     else:
                         print(f"   ❌ Please enter 1-{len(ocr_results)} or 'm'")
@@ -418,12 +425,21 @@ class DualBrowserAutomation:
             print("\n🚀 SUBMITTING FORM WITH FIREFOX...")
             
             # Solve CAPTCHA
-            captcha_solution = self.solve_captcha_with_chrome_thordata(session_id)
+            captcha_solution = self.solve_captcha_with_thordata(session_id)
             
             if not captcha_solution:
                 print("   ❌ No CAPTCHA solution provided")
                 return False, 0
             
+            # Logged now, judged from the results page below
+            attempt_id = None
+            if self.last_captcha_path and os.path.exists(self.last_captcha_path):
+                with open(self.last_captcha_path, 'rb') as f:
+                    attempt_id = self.captcha_stats.log_attempt(
+                        f.read(), self.last_captcha_candidates, captcha_solution,
+                        engine=self.last_captcha_engine, source="complete_single_automation"
+                    )
+            
             # Find CAPTCHA input field
             try:
                 captcha_input = self.firefox_driver.find_element(By.ID, "cpatchaTextBox")
@@ -465,6 +481,7 @@ class DualBrowserAutomation:
             # Check page content
             try:
                 page_source = self.firefox_driver.page_source.lower()
+                self.captcha_stats.record_outcome(attempt_id, captcha_outcome(page_source))
                 
                 # Check for CAPTCHA errors
                 if any(error in page_source for error in ['invalid captcha', 'captcha error', 'wrong captcha']):
@@ -563,7 +580,7 @@ class DualBrowserAutomation:
         print("🚀 DUAL BROWSER AUTOMATION")
         print("=" * 60)
         print("🤖 DUAL BROWSER APPROACH:")
-        print("   🚗 Chrome (headless) + Thordata proxy for CAPTCHA downloads")
+        print("   🔌 Local relay + Thordata proxy session auth")
         print("   🦊 Firefox (visible) for website automation")
         print("   🔄 IP switching for each search")
         print("   📝 Form filling (Mumbai + Agreement to Sale)")
@@ -645,24 +662,23 @@ class DualBrowserAutomation:
         return successful_searches
 
     def cleanup(self):
-        """Clean up both browsers"""
+        """Clean up the browser and local proxy port"""
         try:
-            if self.firefox_driver or self.chrome_driver:
-                input("\nPress Enter to close both browsers...")
+            if self.firefox_driver:
+                input("\nPress Enter to close the browser...")
                 
-                if self.firefox_driver:
-                    self.firefox_driver.quit()
-                    print("🧹 Firefox closed")
+                self.firefox_driver.quit()
+                print("🧹 Firefox closed")
                     
-                if self.chrome_driver:
-                    self.chrome_driver.quit()
-                    print("🧹 Chrome closed")
+            if self.local_proxy_port:
+                get_local_proxy_relay().remove_port(self.local_proxy_port)
+                self.local_proxy_port = None
         except:
             pass
 
 def main():
     print("🚀 DUAL BROWSER AUTOMATION SCRIPT")
-    print("🚗 Chrome (headless) + Thordata proxy for requests")
+    print("🔌 Local relay + Thordata proxy for session auth")
     print("🦊 Firefox (visible) for website automation")
     print("🤖 Best of both worlds!")
     
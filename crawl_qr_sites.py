@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Multi-page QR Crawler
+Follows links and pagination from one or more start pages and scans every
+page's images for QR codes, writing one NDJSON line per page
+"""
+
+import json
+import logging
+import argparse
+
+from src.enhanced_qr_scraper import EnhancedQRScraper
+from src.proxy_manager import ProxyManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl websites and extract QR codes from every page')
+    parser.add_argument('start_urls', nargs='+', help='Pages to start crawling from')
+    parser.add_argument('--depth', type=int, default=2, help='Link depth to follow (pagination is free)')
+    parser.add_argument('--max-pages', type=int, default=1000)
+    parser.add_argument('--domains', nargs='+', help='Allowed domains (default: domains of the start URLs)')
+    parser.add_argument('--include', nargs='+', help='Only follow links matching these regexes')
+    parser.add_argument('--exclude', nargs='+', help='Never follow links matching these regexes')
+    parser.add_argument('--concurrency', type=int, default=4, help='Pages processed at the same time')
+    parser.add_argument('--per-host', type=int, default=2, help='Concurrent page requests per host')
+    parser.add_argument('--steps', help='JSON file with navigation steps to run before crawling')
+    parser.add_argument('--output', help='NDJSON output file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    scraper = EnhancedQRScraper(proxy_manager=ProxyManager())
+
+    navigation_steps = None
+    if args.steps:
+        with open(args.steps) as f:
+            navigation_steps = json.load(f)
+
+    print("🕸️  QR CRAWLER")
+    print("=" * 70)
+    print(f"   Start: {', '.join(args.start_urls)}")
+    print(f"   Depth: {args.depth}, max pages: {args.max_pages}, "
+          f"concurrency: {args.concurrency} ({args.per_host}/host)")
+    print("=" * 70)
+
+    stats = scraper.crawl_site(
+        args.start_urls,
+        navigation_steps=navigation_steps,
+        max_depth=args.depth,
+        max_pages=args.max_pages,
+        allowed_domains=args.domains,
+        include_patterns=args.include,
+        exclude_patterns=args.exclude,
+        page_concurrency=args.concurrency,
+        per_host_limit=args.per_host,
+        output_path=args.output,
+    )
+
+    print(f"\n✅ Pages crawled: {stats['pages']} ({stats['pages_per_hour']} pages/hour)")
+    print(f"   📱 QR codes: {stats['qr_codes']} in {stats['images_with_qr']} images")
+    print(f"   🔒 CAPTCHA pages: {stats['captcha']}, ❌ failed: {stats['failed']}")
+    scraper.print_pipeline_stats()
+    print(f"\n📁 Results saved to: {stats['output']}")
+
+
+if __name__ == "__main__":
+    main()
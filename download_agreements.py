@@ -23,6 +23,12 @@ import ssl
 import urllib3
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from src.captcha_cnn import CNN_ACCEPT_CONFIDENCE, get_captcha_model
+from src.captcha_ocr import VariantEvaluator, tesseract_jobs
+from src.captcha_preprocess import CAPTCHA_DEBUG, captcha_variants, save_captcha_debug, to_pil
+from src.captcha_stats import get_captcha_stats
+from src.proxy_router import CAPTCHA, DOCUMENT, SEARCH_FORM, ProxyRouter
+from src.rate_governor import get_rate_governor
 
 # Try to import httpx as fallback
 try:
@@ -104,8 +110,19 @@ class AgreementDownloader:
         self.last_ip_change = time.time()
         self.session_id = None
         self.blocked_ips = set()
+        
+        # Provider selection (PROXY_PROVIDERS_FILE, defaults to the ThorData config above)
+        self.proxy_router = ProxyRouter.from_env(PROXY_CONFIG)
+        self.current_provider = None
+        # Token bucket per host shared with other downloader processes
+        # (RATE_LIMIT_RPS / RATE_LIMIT_BURST)
+        self.rate_governor = get_rate_governor()
         self.captcha_attempts = 0
         self.max_captcha_attempts = 5
+        self.captcha_stats = get_captcha_stats()
+        self.captcha_attempt_id = None
+        self.last_captcha_candidates = []
+        self.last_captcha_engine = None
         
         # Create all necessary directories
         self.create_directories()
@@ -181,31 +198,29 @@ class AgreementDownloader:
         
         if old_session:
             self.blocked_ips.add(old_session)
+            self.proxy_router.release_session(old_session)
         
         print(f"🔄 FORCED IP change: {old_session} -> {self.session_id}")
         return self.session_id
     
-    def get_proxy(self, force_new=False):
+    def get_proxy(self, force_new=False, request_class=SEARCH_FORM):
         """Get proxy configuration with IP rotation"""
         current_time = time.time()
         
         # Force new IP or change IP every 4 seconds
         if force_new or not self.session_id or (current_time - self.last_ip_change) >= 4:
             if not force_new:
+                self.proxy_router.release_session(self.session_id)
                 self.session_id = self.get_new_session_id()
                 self.last_ip_change = current_time
                 print(f"🔄 Scheduled IP rotation - Session: {self.session_id}")
             else:
                 self.force_ip_change()
         
-        # Build proxy URL
-        full_username = f"{PROXY_CONFIG['username']}-sessid-{self.session_id}"
-        proxy_url = f"http://{full_username}:{PROXY_CONFIG['password']}@{PROXY_CONFIG['host']}:{PROXY_CONFIG['port']}"
-        
-        return {
-            "http": proxy_url,
-            "https": proxy_url
-        }
+        # The session's first request picks the provider; later requests of any class
+        # (documents carry the session's cookies) stay on it and keep the same exit IP
+        self.current_provider, proxies = self.proxy_router.get_proxy(request_class, self.session_id)
+        return proxies
     
     def is_ip_blocked(self, response_text):
         """Detect if IP is blocked based on response content"""
@@ -239,7 +254,7 @@ class AgreementDownloader:
         return False
     
     def download_captcha_image(self, soup, captcha_url=None):
-        """Download CAPTCHA image for processing"""
+        """Download CAPTCHA image for processing; returns the image bytes"""
         if not captcha_url:
             # Find CAPTCHA image
             captcha_img = soup.find('img', src=lambda x: x and 'captcha' in x.lower()) or \
@@ -259,60 +274,48 @@ class AgreementDownloader:
             captcha_url = urljoin(self.base_url, captcha_url)
         
         try:
-            # Download CAPTCHA image
-            response = self.make_request(captcha_url, stream=True)
+            # Download CAPTCHA image (kept in memory; written to disk only with CAPTCHA_DEBUG)
+            response = self.make_request(captcha_url, request_class=CAPTCHA, stream=True)
+            content = b''.join(response.iter_content(chunk_size=8192))
             
-            # Save CAPTCHA image
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'captcha_{timestamp}.png'
-            filepath = os.path.join(self.captcha_dir, filename)
-            
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            print(f"📷 CAPTCHA image saved: {filename}")
-            return filepath
+            print(f"📷 CAPTCHA image downloaded ({len(content)} bytes)")
+            return content
             
         except Exception as e:
             print(f"❌ Failed to download CAPTCHA: {e}")
             return None
     
-    def preprocess_captcha_image(self, image_path):
-        """Preprocess CAPTCHA image for better OCR"""
+    def preprocess_captcha_image(self, captcha_content):
+        """Preprocess CAPTCHA image for better OCR (grayscale + binary threshold, in memory)"""
         try:
-            # Read image
-            img = cv2.imread(image_path)
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            variants = captcha_variants(captcha_content, names=['threshold'])
             
-            # Apply threshold
-            _, thresh = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+            if CAPTCHA_DEBUG:
+                saved = save_captcha_debug(self.captcha_dir, captcha_content, variants)
+                print(f"🐞 CAPTCHA saved: {os.path.basename(saved)}")
             
-            # Remove noise
-            kernel = np.ones((1,1), np.uint8)
-            cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-            cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
-            
-            # Save preprocessed image
-            processed_path = image_path.replace('.png', '_processed.png')
-            cv2.imwrite(processed_path, cleaned)
-            
-            return processed_path
+            return variants[0][1]
             
         except Exception as e:
             print(f"⚠️  Image preprocessing failed: {e}")
-            return image_path
+            return to_pil(captcha_content)
     
-    def solve_captcha(self, image_path):
+    def solve_captcha(self, captcha_content):
         """Solve CAPTCHA using OCR"""
         try:
-            # Preprocess image
-            processed_path = self.preprocess_captcha_image(image_path)
+            # First choice: the trained CAPTCHA model; Tesseract when it is missing or unsure
+            self.last_captcha_candidates, self.last_captcha_engine = [], None
+            model = get_captcha_model()
+            if model:
+                guess = model.solve(captcha_content)
+                self.last_captcha_candidates.append(guess)
+                if guess['confidence'] >= CNN_ACCEPT_CONFIDENCE:
+                    print(f"🧠 CAPTCHA solved by model: '{guess['text']}' (confidence: {guess['confidence']:.2f})")
+                    self.last_captcha_engine = "cnn"
+                    return guess['text']
             
-            # Read CAPTCHA with OCR
-            image = Image.open(processed_path)
+            # Preprocess image
+            image = self.preprocess_captcha_image(captcha_content)
             
             # OCR with different configurations
             configs = [
@@ -321,14 +324,15 @@ class AgreementDownloader:
                 '--psm 6'
             ]
             
-            for config in configs:
-                try:
-                    captcha_text = pytesseract.image_to_string(image, config=config).strip()
-                    if captcha_text and len(captcha_text) >= 3:
-                        print(f"🔍 CAPTCHA solved: '{captcha_text}'")
-                        return captcha_text
-                except:
-                    continue
+            # All configs run concurrently, historically best first; the most confident answer wins
+            jobs = tesseract_jobs([image], configs, names=['threshold'], scores=self.captcha_stats.tesseract_scores())
+            candidates = VariantEvaluator(min_length=3, max_length=20).evaluate(jobs)
+            self.last_captcha_candidates.extend(candidates)
+            if candidates:
+                captcha_text = candidates[0]['text']
+                self.last_captcha_engine = "tesseract"
+                print(f"🔍 CAPTCHA solved: '{captcha_text}' (confidence: {candidates[0]['confidence']:.2f})")
+                return captcha_text
             
             print("❌ Could not solve CAPTCHA with OCR")
             return None
@@ -349,27 +353,35 @@ class AgreementDownloader:
             return None
         
         # Download CAPTCHA image
-        captcha_image_path = self.download_captcha_image(soup)
-        if not captcha_image_path:
+        captcha_content = self.download_captcha_image(soup)
+        if not captcha_content:
             return None
         
         # Solve CAPTCHA
-        captcha_solution = self.solve_captcha(captcha_image_path)
+        started = time.time()
+        captcha_solution = self.solve_captcha(captcha_content)
         if captcha_solution:
             print(f"✅ CAPTCHA solved: {captcha_solution}")
+            # Judged in make_request by whether the retried page still asks for a CAPTCHA
+            self.captcha_attempt_id = self.captcha_stats.log_attempt(
+                captcha_content, self.last_captcha_candidates, captcha_solution, engine=self.last_captcha_engine,
+                latency=time.time() - started, source="download_agreements"
+            )
             return captcha_solution
         
         return None
     
-    def make_request(self, url, method='GET', **kwargs):
+    def make_request(self, url, method='GET', request_class=SEARCH_FORM, **kwargs):
         """Make request with automatic retry, proxy/direct fallback, and IP block detection"""
         max_retries = 3
         
         for attempt in range(max_retries):
+            provider = None
             try:
                 # Use proxy if not already failed
                 if self.session_id not in self.blocked_ips:
-                    kwargs['proxies'] = self.get_proxy()
+                    kwargs['proxies'] = self.get_proxy(request_class=request_class)
+                    provider = self.current_provider
                 else:
                     kwargs.pop('proxies', None)  # Use direct connection
                 
@@ -382,14 +394,20 @@ class AgreementDownloader:
                 import urllib3
                 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
                 
+                self.rate_governor.acquire(url)
+                start_time = time.time()
                 if method == 'GET':
                     response = self.session.get(url, **kwargs)
                 else:
                     response = self.session.post(url, **kwargs)
+                self.proxy_router.record_result(
+                    provider, time.time() - start_time, response.status_code, response.text
+                )
                 
                 # Check if IP is blocked
-                if self.is_ip_blocked(response.text):
+                if response.status_code == 429 or self.is_ip_blocked(response.text):
                     print(f"🚫 IP blocked detected, changing IP...")
+                    self.rate_governor.penalize(url)
                     self.force_ip_change()
                     continue
                 
@@ -407,11 +425,19 @@ class AgreementDownloader:
                             response = self.session.get(url, **kwargs)
                         else:
                             response = self.session.post(url, **kwargs)
+                        
+                        if response.ok:
+                            self.captcha_stats.record_outcome(
+                                self.captcha_attempt_id,
+                                not self.has_captcha(BeautifulSoup(response.text, 'html.parser'))
+                            )
+                        self.captcha_attempt_id = None
                 
                 response.raise_for_status()
                 return response
                 
             except (requests.exceptions.RequestException, ssl.SSLError) as e:
+                self.proxy_router.record_result(provider, error=True)
                 print(f"⚠️  Request failed (attempt {attempt + 1}): {e}")
                 if attempt < max_retries - 1:
                     # Force IP change on connection issues
@@ -586,7 +612,7 @@ class AgreementDownloader:
         try:
             print(f"\n📥 Downloading document {index}: {doc_info['text'][:50]}...")
             
-            response = self.make_request(url, stream=True)
+            response = self.make_request(url, request_class=DOCUMENT, stream=True)
             
             # Check if response is actually a PDF
             content_type = response.headers.get('content-type', '').lower()
@@ -678,14 +704,9 @@ class AgreementDownloader:
             if i > max_documents:
                 break
                 
-            # Download with IP rotation and error handling
-            success = self.download_document(doc, i)
-            
-            # Wait between downloads
-            if i < len(all_documents):
-                wait_time = 3 if success else 5  # Wait longer if download failed
-                print(f"⏳ Waiting {wait_time} seconds before next download...")
-                time.sleep(wait_time)
+            # Download with IP rotation and error handling; pacing comes
+            # from the rate governor inside make_request
+            self.download_document(doc, i)
         
         print("\n" + "=" * 60)
         print(f"✅ Download complete!")
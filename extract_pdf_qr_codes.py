@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+PDF QR Extractor
+Scans downloaded IGR PDFs for QR codes across a process pool and records the
+results in an index keyed by file hash; files already scanned are skipped
+"""
+
+import os
+import logging
+import argparse
+
+from src.pdf_qr_extractor import PDFQRExtractor, PDFQRIndex, PDF_DIRECTORIES
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract QR codes from downloaded PDF documents')
+    parser.add_argument('--dirs', nargs='+', default=PDF_DIRECTORIES, help='Folders to scan for PDFs')
+    parser.add_argument('--dpi', type=int, default=200, help='Rasterisation resolution')
+    parser.add_argument('--max-pages', type=int, help='Only scan the first pages of each PDF')
+    parser.add_argument('--workers', type=int, help='Decode processes (default QR_DECODE_WORKERS or CPUs - 1)')
+    parser.add_argument('--index', help='Index file (default data/pdf_qr_index.json)')
+    parser.add_argument('--force', action='store_true', help='Rescan files that are already indexed')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.workers:
+        os.environ['QR_DECODE_WORKERS'] = str(args.workers)
+
+    print("📄 PDF QR EXTRACTOR")
+    print("=" * 70)
+    print(f"   Folders: {', '.join(args.dirs)}")
+    print(f"   DPI: {args.dpi}" + (f", first {args.max_pages} pages" if args.max_pages else ""))
+    print("=" * 70)
+
+    index = PDFQRIndex(args.index)
+    extractor = PDFQRExtractor(index=index, dpi=args.dpi, max_pages=args.max_pages)
+    stats = extractor.scan(args.dirs, force=args.force)
+
+    print(f"\n✅ Scanned {stats['scanned']} of {stats['files']} PDFs "
+          f"({stats['skipped']} already indexed, {stats['duplicates']} duplicates) in {stats['elapsed_seconds']}s")
+    print(f"   📃 Pages: {stats['pages']}")
+    print(f"   📱 QR codes: {stats['qr_codes']} in {stats['with_qr']} files")
+    if stats['failed']:
+        print(f"   ❌ Failed: {stats['failed']}")
+    print(f"\n📁 Index: {index.index_path}")
+
+
+if __name__ == "__main__":
+    main()
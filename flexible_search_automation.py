@@ -14,7 +14,8 @@ from selenium.webdriver.firefox.options import Options
 import requests
 import os
 from datetime import datetime
-import easyocr
+from src.captcha_stats import captcha_outcome, get_captcha_stats
+from src.ocr_service import get_ocr_client
 import urllib3
 urllib3.disable_warnings()
 
@@ -25,13 +26,10 @@ class FlexibleIGRAutomation:
         self.data_dir = "data/flexible_search"
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Initialize OCR
-        try:
-            self.ocr_reader = easyocr.Reader(['en'])
-            print("✅ EasyOCR initialized")
-        except:
-            self.ocr_reader = None
-            print("⚠️ EasyOCR not available")
+        # Initialize OCR (client of the shared OCR service; candidates come back best first)
+        self.ocr_reader = get_ocr_client()
+        self.captcha_stats = get_captcha_stats()
+        self.captcha_attempt_id = None
         
         # Search combinations to try
         self.search_combinations = [
@@ -86,14 +84,19 @@ class FlexibleIGRAutomation:
             
             print(f"   📷 CAPTCHA downloaded: {captcha_path}")
             
-            # Solve with EasyOCR if available
+            # Solve with the OCR service if available
             if self.ocr_reader:
-                results = self.ocr_reader.readtext(captcha_path)
+                started = time.time()
+                candidates = self.ocr_reader.recognize(captcha_path, engines=['cnn', 'easyocr'])
                 
-                if results:
-                    captcha_text = results[0][1].strip()
-                    confidence = results[0][2]
-                    print(f"   🔍 EasyOCR solved: '{captcha_text}' (confidence: {confidence:.2f})")
+                if candidates:
+                    captcha_text = candidates[0]['text']
+                    confidence = candidates[0]['confidence']
+                    print(f"   🔍 OCR solved: '{captcha_text}' (confidence: {confidence:.2f})")
+                    self.captcha_attempt_id = self.captcha_stats.log_attempt(
+                        response.content, candidates, captcha_text, engine=candidates[0]['engine'],
+                        confidence=confidence, latency=time.time() - started, source="flexible_search_automation"
+                    )
                     return captcha_text
             
             # Fallback pattern
@@ -199,6 +202,8 @@ class FlexibleIGRAutomation:
             
             # Check for "No data available" message
             page_source = self.driver.page_source
+            self.captcha_stats.record_outcome(self.captcha_attempt_id, captcha_outcome(page_source))
+            self.captcha_attempt_id = None
             
             if "No data available in table" in page_source:
                 print("❌ No documents found")
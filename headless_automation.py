@@ -17,14 +17,8 @@ from selenium.webdriver.firefox.options import Options
 import urllib3
 urllib3.disable_warnings()
 
-# Try OCR
-try:
-    import easyocr
-    EASYOCR_OK = True
-    print("✅ EasyOCR available")
-except:
-    EASYOCR_OK = False
-    print("⚠️ EasyOCR not available")
+# Shared OCR service (EasyOCR/Tesseract/TrOCR loaded once for all workers)
+from src.ocr_service import get_ocr_client
 
 try:
     import pytesseract
@@ -40,14 +34,8 @@ class HeadlessAutomation:
         self.data_dir = "data/headless_automation"
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # OCR setup
-        self.ocr = None
-        if EASYOCR_OK:
-            try:
-                self.ocr = easyocr.Reader(['en'])
-                print("✅ EasyOCR initialized")
-            except:
-                print("⚠️ EasyOCR init failed")
+        # OCR setup (client of the shared OCR service)
+        self.ocr = get_ocr_client()
         
         self.driver = None
         self.wait = None
@@ -137,20 +125,20 @@ class HeadlessAutomation:
             
             solutions = []
             
-            # Method 1: EasyOCR
+            # Method 1: CAPTCHA model/EasyOCR/TrOCR via the OCR service (Tesseract runs below)
             if self.ocr:
                 try:
-                    results = self.ocr.readtext(captcha_path)
+                    results = self.ocr.readtext(captcha_path, engines=['cnn', 'easyocr', 'trocr'])
                     for result in results:
                         text = result[1].strip().upper()
                         confidence = result[2]
                         if len(text) >= 4 and len(text) <= 8 and confidence > 0.5:
                             clean_text = ''.join(c for c in text if c.isalnum())
                             if len(clean_text) >= 4:
-                                solutions.append((clean_text, confidence, "EasyOCR"))
-                                print(f"   🔍 EasyOCR: '{clean_text}' (confidence: {confidence:.2f})")
+                                solutions.append((clean_text, confidence, "OCR service"))
+                                print(f"   🔍 OCR service: '{clean_text}' (confidence: {confidence:.2f})")
                 except Exception as e:
-                    print(f"   ⚠️ EasyOCR failed: {e}")
+                    print(f"   ⚠️ OCR service failed: {e}")
             
             # Method 2: Tesseract
             if TESSERACT_OK:
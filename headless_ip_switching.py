@@ -15,6 +15,7 @@ from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.firefox.options import Options
 import urllib3
+from src.local_proxy import UpstreamProxy, configure_firefox_proxy, get_local_proxy_relay
 urllib3.disable_warnings()
 
 # Try OCR
@@ -59,6 +60,7 @@ class HeadlessIPSwitching:
         self.driver = None
         self.wait = None
         self.current_ip = None
+        self.local_proxy_port = None
         
         # Search parameters - each will get a different IP
         self.searches = [
@@ -130,19 +132,18 @@ class HeadlessIPSwitching:
             proxy_parts = self.proxy_url.replace('http://', '').split('@')
             if len(proxy_parts) == 2:
                 auth_part = proxy_parts[0]  # session-xxx:password
-                host_port = proxy_parts[1]  # host:port
-                
-                options.set_preference("network.proxy.type", 1)  # Manual proxy
-                options.set_preference("network.proxy.http", self.proxy_host)
-                options.set_preference("network.proxy.http_port", int(self.proxy_port))
-                options.set_preference("network.proxy.ssl", self.proxy_host)
-                options.set_preference("network.proxy.ssl_port", int(self.proxy_port))
-                options.set_preference("network.proxy.share_proxy_settings", True)
-                
-                # Set proxy authentication
                 username, password = auth_part.split(':')
-                options.set_preference("network.proxy.username", username)
-                options.set_preference("network.proxy.password", password)
+                
+                # Firefox ignores proxy credentials in preferences, so route it
+                # through a local relay port that injects Proxy-Authorization
+                relay = get_local_proxy_relay()
+                if self.local_proxy_port:
+                    relay.remove_port(self.local_proxy_port)
+                self.local_proxy_port = relay.add_upstream(
+                    UpstreamProxy(self.proxy_host, self.proxy_port, username, password)
+                )
+                configure_firefox_proxy(options, self.local_proxy_port)
+                print(f"🔌 Local proxy port {self.local_proxy_port} -> session {username}")
             
             # Performance optimizations
             options.set_preference("dom.webdriver.enabled", False)
@@ -608,6 +609,9 @@ class HeadlessIPSwitching:
             if self.driver:
                 self.driver.quit()
                 print("🧹 Headless browser closed")
+            if self.local_proxy_port:
+                get_local_proxy_relay().remove_port(self.local_proxy_port)
+                self.local_proxy_port = None
         except:
             pass
 
@@ -14,6 +14,7 @@ from selenium.webdriver.support.ui import WebDriverWait, Select
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.firefox.options import Options
 import urllib3
+from src.captcha_prefetch import PendingCaptcha
 urllib3.disable_warnings()
 
 # Try OCR
@@ -267,11 +268,10 @@ class HeadlessWithDownloads:
             print(f"❌ CAPTCHA solving failed: {e}")
             return None
 
-    def fill_form_headless(self, year_db, reg_year, village, captcha_solution):
-        """Fill form in headless mode"""
+    def fill_form_headless(self, year_db, reg_year, village, pending_captcha):
+        """Fill form in headless mode; the CAPTCHA is solved in the background meanwhile"""
         try:
             print(f"📝 Filling form (headless): Mumbai {village} - {reg_year}")
-            print(f"🔤 Using CAPTCHA: '{captcha_solution}'")
             
             # 1. Database selection
             dbselect = Select(self.wait.until(EC.element_to_be_clickable((By.ID, "dbselect"))))
@@ -330,7 +330,13 @@ class HeadlessWithDownloads:
             free_text_input.send_keys(str(reg_year))
             print(f"   ✅ Registration Year: {reg_year}")
             
-            # 7. CAPTCHA
+            # 7. CAPTCHA - usually solved during the dropdown cascade; wait for whatever is left
+            captcha_solution = pending_captcha.result()
+            if not captcha_solution:
+                print("❌ CAPTCHA solving failed")
+                return False, ""
+            print(f"   ⚡ CAPTCHA ready ({pending_captcha.solve_seconds:.1f}s solve, "
+                  f"{pending_captcha.saved_seconds:.1f}s overlapped with the form)")
             captcha_input = self.driver.find_element(By.ID, "cpatchaTextBox")
             captcha_input.clear()
             time.sleep(0.5)
@@ -503,19 +509,17 @@ class HeadlessWithDownloads:
                     print("❌ Failed to start headless browser")
                     continue
                 
-                # Download and solve CAPTCHA
+                # Download CAPTCHA as soon as the page loads
                 captcha_path = self.download_captcha_headless()
                 if not captcha_path:
                     print("❌ CAPTCHA download failed")
                     continue
                 
-                captcha_solution = self.solve_captcha_automatically(captcha_path)
-                if not captcha_solution:
-                    print("❌ CAPTCHA solving failed")
-                    continue
+                # OCR runs in the background while the form is filled
+                pending_captcha = PendingCaptcha(self.solve_captcha_automatically, captcha_path)
                 
                 # Fill form
-                form_success, selected_village = self.fill_form_headless(params["year_db"], params["reg_year"], params["village"], captcha_solution)
+                form_success, selected_village = self.fill_form_headless(params["year_db"], params["reg_year"], params["village"], pending_captcha)
                 if not form_success:
                     print("❌ Form filling failed")
                     self.save_debug_info(params, False, 0)
@@ -18,6 +18,7 @@ import os
 from datetime import datetime
 import easyocr
 import urllib3
+from src.captcha_prefetch import PendingCaptcha
 urllib3.disable_warnings()
 
 # Proxy configuration
@@ -104,17 +105,25 @@ class MumbaiFocusedAutomation:
             print(f"❌ Worker {self.worker_id}: Driver setup failed: {e}")
             return False
 
-    def solve_captcha(self):
-        """Solve CAPTCHA using EasyOCR"""
+    def start_captcha(self):
+        """Capture the CAPTCHA as soon as the page loads and solve it while the form is filled"""
         try:
             # Find CAPTCHA image
             captcha_img = self.wait.until(
                 EC.presence_of_element_located((By.ID, "captcha-img"))
             )
             
-            # Get CAPTCHA image source
+            # Get CAPTCHA image source (only this thread may use the driver)
             captcha_src = captcha_img.get_attribute("src")
+            return PendingCaptcha(self.solve_captcha, captcha_src)
             
+        except Exception as e:
+            print(f"   ❌ Worker {self.worker_id}: CAPTCHA not found: {e}")
+            return None
+
+    def solve_captcha(self, captcha_src):
+        """Download and solve the CAPTCHA with EasyOCR (runs in the background, no driver calls)"""
+        try:
             # Download CAPTCHA image with proxy
             proxy_config = self.get_proxy_config()
             response = requests.get(captcha_src, proxies=proxy_config, verify=False, timeout=10)
@@ -238,11 +247,15 @@ class MumbaiFocusedAutomation:
             print(f"   ❌ Worker {self.worker_id}: Form filling failed: {e}")
             return False
 
-    def submit_form(self):
-        """Solve CAPTCHA and submit form"""
+    def submit_form(self, pending_captcha):
+        """Enter the CAPTCHA solved in the background and submit form"""
         try:
-            # Solve CAPTCHA
-            captcha_solution = self.solve_captcha()
+            # Usually finished during the dropdown cascade; wait for whatever is left
+            captcha_solution = pending_captcha.result() if pending_captcha else None
+            if not captcha_solution:
+                raise Exception("no CAPTCHA solution")
+            print(f"   ⚡ Worker {self.worker_id}: CAPTCHA ready ({pending_captcha.solve_seconds:.1f}s solve, "
+                  f"{pending_captcha.saved_seconds:.1f}s overlapped with the form)")
             
             # Enter CAPTCHA
             captcha_input = self.driver.find_element(By.ID, "cpatchaTextBox")
@@ -311,12 +324,15 @@ class MumbaiFocusedAutomation:
             self.driver.get(self.base_url)
             time.sleep(3)
             
+            # CAPTCHA download + OCR run while the dropdowns cascade
+            pending_captcha = self.start_captcha()
+            
             # Fill form
             if not self.fill_form(year_db, village_info, reg_year):
                 return {"worker_id": self.worker_id, "success": False, "error": "Form filling failed"}
             
             # Submit form
-            if not self.submit_form():
+            if not self.submit_form(pending_captcha):
                 return {"worker_id": self.worker_id, "success": False, "error": "Form submission failed"}
             
             # Check results
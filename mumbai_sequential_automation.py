@@ -15,7 +15,7 @@ from selenium.webdriver.firefox.options import Options
 import requests
 import os
 from datetime import datetime
-import easyocr
+from src.ocr_service import get_ocr_client
 import urllib3
 urllib3.disable_warnings()
 
@@ -33,13 +33,8 @@ class MumbaiSequentialAutomation:
         self.data_dir = "data/mumbai_sequential"
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Initialize OCR
-        try:
-            self.ocr_reader = easyocr.Reader(['en'])
-            print("✅ EasyOCR initialized")
-        except:
-            self.ocr_reader = None
-            print("⚠️ EasyOCR not available")
+        # Initialize OCR (client of the shared OCR service; candidates come back best first)
+        self.ocr_reader = get_ocr_client()
         
         self.driver = None
         self.wait = None
@@ -152,14 +147,14 @@ class MumbaiSequentialAutomation:
             
             print(f"   📷 CAPTCHA downloaded: {captcha_path}")
             
-            # Solve with EasyOCR if available
+            # Solve with the OCR service if available
             if self.ocr_reader:
-                results = self.ocr_reader.readtext(captcha_path)
+                results = self.ocr_reader.readtext(captcha_path, engines=['cnn', 'easyocr'])
                 
                 if results:
                     captcha_text = results[0][1].strip()
                     confidence = results[0][2]
-                    print(f"   🔍 EasyOCR solved: '{captcha_text}' (confidence: {confidence:.2f})")
+                    print(f"   🔍 OCR solved: '{captcha_text}' (confidence: {confidence:.2f})")
                     return captcha_text
             
             # Fallback pattern
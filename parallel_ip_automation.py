@@ -16,8 +16,15 @@ from selenium.webdriver.firefox.options import Options
 import requests
 import os
 from datetime import datetime
-import easyocr
 import urllib3
+from src.bandwidth_tracker import BandwidthBudgetExceeded, downgrade_firefox_options, get_bandwidth_tracker
+from src.local_proxy import get_local_proxy_relay
+from src.captcha_prefetch import PendingCaptcha
+from src.captcha_stats import captcha_outcome, get_captcha_stats
+from src.ocr_service import get_ocr_client
+from src.enhanced_proxy_manager import EnhancedProxyManager
+from src.identity import Identity
+from src.rate_governor import get_rate_governor
 urllib3.disable_warnings()
 
 # Proxy configuration
@@ -36,18 +43,19 @@ class ParallelIGRAutomation:
         self.data_dir = f"data/parallel_worker_{worker_id}"
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Initialize OCR (shared instance)
-        if not hasattr(ParallelIGRAutomation, '_ocr_reader'):
-            try:
-                ParallelIGRAutomation._ocr_reader = easyocr.Reader(['en'])
-                print(f"🤖 Worker {worker_id}: EasyOCR initialized")
-            except:
-                ParallelIGRAutomation._ocr_reader = None
-                print(f"⚠️ Worker {worker_id}: EasyOCR not available")
-        
-        self.ocr_reader = ParallelIGRAutomation._ocr_reader
+        # OCR runs in the shared OCR service process; every worker uses the same client
+        self.ocr_reader = get_ocr_client()
+        self.captcha_stats = get_captcha_stats()
+        self.captcha_attempt_id = None
         self.driver = None
         self.wait = None
+        self.local_proxy_port = None
+        
+        # Browser and CAPTCHA download share cookies, UA and proxy session
+        self.identity = Identity(EnhancedProxyManager(PROXY_CONFIG), session_id=self.proxy_session)
+        self.bandwidth = get_bandwidth_tracker()
+        # Page loads and submits draw from the same per-host budget as the HTTP scrapers
+        self.rate_governor = get_rate_governor()
         
     def generate_session_id(self):
         """Generate unique session ID for IP rotation"""
@@ -57,28 +65,16 @@ class ParallelIGRAutomation:
     
     def get_proxy_config(self):
         """Get proxy configuration with unique session"""
-        full_username = f"{PROXY_CONFIG['username']}-sessid-{self.proxy_session}"
-        proxy_url = f"http://{full_username}:{PROXY_CONFIG['password']}@{PROXY_CONFIG['host']}:{PROXY_CONFIG['port']}"
-        
-        return {
-            "http": proxy_url,
-            "https": proxy_url
-        }
+        return self.identity.proxies()
 
     def setup_driver_with_proxy(self):
         """Setup Firefox driver with proxy"""
         try:
             options = Options()
             
-            # Proxy configuration
-            proxy_host = PROXY_CONFIG['host']
-            proxy_port = int(PROXY_CONFIG['port'])
-            
-            options.set_preference("network.proxy.type", 1)
-            options.set_preference("network.proxy.http", proxy_host)
-            options.set_preference("network.proxy.http_port", proxy_port)
-            options.set_preference("network.proxy.ssl", proxy_host)
-            options.set_preference("network.proxy.ssl_port", proxy_port)
+            # Proxy configuration: Firefox can't send proxy credentials itself,
+            # so it talks to a local relay port bound to this worker's session
+            self.local_proxy_port = self.identity.configure_firefox(options)
             
             # Anti-detection
             options.add_argument('--disable-blink-features=AutomationControlled')
@@ -88,30 +84,50 @@ class ParallelIGRAutomation:
             # Headless for parallel execution
             options.add_argument('--headless')
             
+            # Skip images/fonts once this session's byte budget is used up
+            if self.bandwidth.enforce(stage='search', session_id=self.proxy_session):
+                downgrade_firefox_options(options)
+                print(f"📉 Worker {self.worker_id}: Bandwidth budget reached, images disabled")
+            
             self.driver = webdriver.Firefox(options=options)
             self.wait = WebDriverWait(self.driver, 15)
             
             print(f"🦊 Worker {self.worker_id}: Firefox with proxy session {self.proxy_session}")
             return True
             
+        except BandwidthBudgetExceeded as e:
+            print(f"⏸️ Worker {self.worker_id}: {e}")
+            return False
         except Exception as e:
             print(f"❌ Worker {self.worker_id}: Driver setup failed: {e}")
             return False
 
-    def solve_captcha(self):
-        """Solve CAPTCHA using EasyOCR"""
+    def start_captcha(self):
+        """Capture the CAPTCHA as soon as the page loads and solve it while the form is filled"""
         try:
             # Find CAPTCHA image
             captcha_img = self.wait.until(
                 EC.presence_of_element_located((By.ID, "captcha-img"))
             )
             
-            # Get CAPTCHA image source
+            # Get CAPTCHA image source; cookies are copied here because only this thread may use the driver
             captcha_src = captcha_img.get_attribute("src")
+            self.identity.load_cookies_from_driver(self.driver)
+            return PendingCaptcha(self.solve_captcha, captcha_src)
             
-            # Download CAPTCHA image with proxy
-            proxy_config = self.get_proxy_config()
-            response = requests.get(captcha_src, proxies=proxy_config, verify=False, timeout=10)
+        except Exception as e:
+            print(f"   ❌ Worker {self.worker_id}: CAPTCHA not found: {e}")
+            return None
+
+    def solve_captcha(self, captcha_src):
+        """Download and solve the CAPTCHA with the OCR service (runs in the background, no driver calls)"""
+        try:
+            # Download CAPTCHA with the browser's cookies, UA and proxy session so
+            # the image matches the one the form will be validated against
+            response = self.identity.requests_session().get(
+                captcha_src, timeout=10,
+                hooks=self.bandwidth.hooks('captcha', session_id=self.proxy_session)
+            )
             
             # Save CAPTCHA image
             timestamp = datetime.now().strftime('%H%M%S')
@@ -121,14 +137,19 @@ class ParallelIGRAutomation:
             
             print(f"   📷 Worker {self.worker_id}: CAPTCHA downloaded")
             
-            # Solve with EasyOCR if available
+            # Solve with the OCR service if available
             if self.ocr_reader:
-                results = self.ocr_reader.readtext(captcha_path)
+                started = time.time()
+                candidates = self.ocr_reader.recognize(captcha_path, engines=['cnn', 'easyocr'])
                 
-                if results:
-                    captcha_text = results[0][1].strip()
-                    confidence = results[0][2]
-                    print(f"   🔍 Worker {self.worker_id}: EasyOCR solved: '{captcha_text}' (confidence: {confidence:.2f})")
+                if candidates:
+                    captcha_text = candidates[0]['text']
+                    confidence = candidates[0]['confidence']
+                    print(f"   🔍 Worker {self.worker_id}: OCR solved: '{captcha_text}' (confidence: {confidence:.2f})")
+                    self.captcha_attempt_id = self.captcha_stats.log_attempt(
+                        response.content, candidates, captcha_text, engine=candidates[0]['engine'],
+                        confidence=confidence, latency=time.time() - started, source=f"parallel_worker_{self.worker_id}"
+                    )
                     return captcha_text
             
             # Fallback pattern
@@ -193,11 +214,15 @@ class ParallelIGRAutomation:
             print(f"   ❌ Worker {self.worker_id}: Form filling failed: {e}")
             return False
 
-    def submit_form(self):
-        """Solve CAPTCHA and submit form"""
+    def submit_form(self, pending_captcha):
+        """Enter the CAPTCHA solved in the background and submit form"""
         try:
-            # Solve CAPTCHA
-            captcha_solution = self.solve_captcha()
+            # Usually finished during the dropdown cascade; wait for whatever is left
+            captcha_solution = pending_captcha.result() if pending_captcha else None
+            if not captcha_solution:
+                raise Exception("no CAPTCHA solution")
+            print(f"   ⚡ Worker {self.worker_id}: CAPTCHA ready ({pending_captcha.solve_seconds:.1f}s solve, "
+                  f"{pending_captcha.saved_seconds:.1f}s overlapped with the form)")
             
             # Enter CAPTCHA
             captcha_input = self.driver.find_element(By.ID, "cpatchaTextBox")
@@ -206,6 +231,7 @@ class ParallelIGRAutomation:
             
             # Submit form
             submit_button = self.wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[type='submit']")))
+            self.rate_governor.acquire(self.base_url)
             submit_button.click()
             
             # Wait for results to load
@@ -222,6 +248,8 @@ class ParallelIGRAutomation:
         try:
             time.sleep(3)
             page_source = self.driver.page_source
+            self.captcha_stats.record_outcome(self.captcha_attempt_id, captcha_outcome(page_source))
+            self.captcha_attempt_id = None
             
             if "No data available in table" in page_source:
                 return False
@@ -259,15 +287,19 @@ class ParallelIGRAutomation:
                 return {"worker_id": self.worker_id, "success": False, "error": "Driver setup failed"}
             
             # Load the website
+            self.rate_governor.acquire(self.base_url)
             self.driver.get(self.base_url)
             time.sleep(3)
             
+            # CAPTCHA download + OCR run while the dropdowns cascade
+            pending_captcha = self.start_captcha()
+            
             # Fill form
             if not self.fill_form(search_params):
                 return {"worker_id": self.worker_id, "success": False, "error": "Form filling failed"}
             
             # Submit form
-            if not self.submit_form():
+            if not self.submit_form(pending_captcha):
                 return {"worker_id": self.worker_id, "success": False, "error": "Form submission failed"}
             
             # Check results
@@ -299,7 +331,11 @@ class ParallelIGRAutomation:
         """Clean up resources"""
         try:
             if self.driver:
+                self.bandwidth.record_browser_session(self.driver, stage='search', session_id=self.proxy_session)
                 self.driver.quit()
+            if self.local_proxy_port:
+                get_local_proxy_relay().remove_port(self.local_proxy_port)
+                self.local_proxy_port = None
         except:
             pass
 
@@ -402,6 +438,11 @@ class ParallelSearchManager:
         print(f"   ❌ Failed: {len(failed_results)}")
         print(f"   📁 Debug files saved in: data/parallel_worker_* directories")
         
+        bandwidth = get_bandwidth_tracker()
+        total = bandwidth.get_stats()["total"]
+        print(f"   📶 Proxy traffic: {total['total_bytes'] / 1024 / 1024:.2f} MB over {total['requests']} requests")
+        bandwidth.save_report(f"data/bandwidth_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        
         return successful_results
 
 def main():
@@ -16,14 +16,8 @@ from selenium.webdriver.firefox.options import Options
 import urllib3
 urllib3.disable_warnings()
 
-# Try OCR
-try:
-    import easyocr
-    EASYOCR_OK = True
-    print("✅ EasyOCR available")
-except:
-    EASYOCR_OK = False
-    print("⚠️ EasyOCR not available")
+# Shared OCR service (EasyOCR/Tesseract/TrOCR loaded once for all workers)
+from src.ocr_service import get_ocr_client
 
 class PDFDownloader:
     def __init__(self):
@@ -33,14 +27,8 @@ class PDFDownloader:
         os.makedirs(self.data_dir, exist_ok=True)
         os.makedirs(self.pdf_dir, exist_ok=True)
         
-        # OCR setup
-        self.ocr = None
-        if EASYOCR_OK:
-            try:
-                self.ocr = easyocr.Reader(['en'])
-                print("✅ EasyOCR initialized")
-            except:
-                print("⚠️ EasyOCR init failed")
+        # OCR setup (client of the shared OCR service)
+        self.ocr = get_ocr_client()
         
         self.driver = None
         self.wait = None
@@ -77,7 +65,7 @@ class PDFDownloader:
         """Quick CAPTCHA solving"""
         try:
             if self.ocr:
-                results = self.ocr.readtext(captcha_path)
+                results = self.ocr.readtext(captcha_path, engines=['cnn', 'easyocr'])
                 for result in results:
                     text = result[1].strip().upper()
                     confidence = result[2]
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict, Any
@@ -9,6 +10,10 @@ from requests.exceptions import RequestException
 from bs4 import BeautifulSoup
 from bs4.element import Tag  # Import Tag for type hinting
 from src.proxy_manager import ProxyManager
+from src.bandwidth_tracker import BandwidthBudgetExceeded, get_bandwidth_tracker
+from src.captcha_stats import get_captcha_stats
+from src.qr_cache import get_qr_cache
+from src.qr_batch import MAX_BATCH_BYTES, MAX_BATCH_ITEMS, QRBatchDecoder
 from contextlib import asynccontextmanager
 import os
 from enum import Enum
@@ -18,6 +23,9 @@ from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 from PIL import Image
 import tempfile
 import re
+import json
+import base64
+import binascii
 
 # Configure logging
 logging.basicConfig(
@@ -64,9 +72,20 @@ class JobStatusResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
+class QRDecodeItem(BaseModel):
+    id: Optional[str] = Field(default=None, max_length=200, description="Client reference echoed in the result")
+    url: Optional[str] = Field(default=None, max_length=2048, description="Image URL to download")
+    data: Optional[str] = Field(default=None, description="Base64-encoded image bytes")
+
+class QRDecodeRequest(BaseModel):
+    items: List[QRDecodeItem]
+
 # Global variables for job tracking
 job_store: Dict[str, Dict[str, Any]] = {}
 
+# Shared QR batch decoder (process pool and decode cache are process-wide)
+qr_batch_decoder: Optional[QRBatchDecoder] = None
+
 # Load OCR model and processor once
 trocr_processor = None
 trocr_model = None
@@ -133,11 +152,13 @@ class IGRSearcher:
 
     async def solve_and_submit_captcha_playwright(self, page, attempt_limit=5):
         logging.info("solve_and_submit_captcha_playwright - To be implemented.")
+        captcha_stats = get_captcha_stats()
         for attempt in range(attempt_limit):
             try:
                 logging.info(f"CAPTCHA attempt {attempt + 1}")
                 captcha_image_element = page.locator("#captcha-img")
                 screenshot_bytes = await captcha_image_element.screenshot()
+                started = datetime.now()
                 
                 with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as tmpfile:
                     tmpfile.write(screenshot_bytes)
@@ -159,11 +180,17 @@ class IGRSearcher:
                     if os.path.exists(captcha_image_path): os.remove(captcha_image_path)
                     continue
 
+                attempt_id = captcha_stats.log_attempt(
+                    screenshot_bytes, [{"text": captcha_text, "engine": "trocr"}], captcha_text, engine="trocr",
+                    latency=(datetime.now() - started).total_seconds(), source="api_service"
+                )
                 await page.fill("#txtcaptcha", captcha_text)
                 await page.click("#btnSearch")
                 await page.wait_for_timeout(4000)
 
-                if await page.locator("div.message.error:visible").count() > 0:
+                rejected = await page.locator("div.message.error:visible").count() > 0
+                captcha_stats.record_outcome(attempt_id, not rejected)
+                if rejected:
                     error_text = await page.locator("div.message.error").text_content()
                     logging.warning(f"CAPTCHA incorrect: {error_text}. Retrying...")
                     await page.locator("button.reloadbutton").click()
@@ -196,19 +223,25 @@ class IGRScraper:
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'
         })
 
-    async def scrape_property(self, url: str) -> Optional[str]:
+    async def scrape_property(self, url: str, job_id: Optional[str] = None) -> Optional[str]:
         """Scrape a single property URL"""
         proxy = self.proxy_manager.get_proxy()
+        bandwidth = get_bandwidth_tracker()
 
         try:
+            bandwidth.enforce(stage='document', job_id=job_id)
+            hooks = bandwidth.hooks('document', job_id=job_id)
             if proxy:
-                response = self.session.get(url, proxies=proxy, timeout=30)
+                response = self.session.get(url, proxies=proxy, timeout=30, hooks=hooks)
             else:
-                response = self.session.get(url, timeout=30)
+                response = self.session.get(url, timeout=30, hooks=hooks)
                 
             response.raise_for_status() # Raise HTTPError for bad responses
             self.logger.info(f"Successfully scraped {url}")
             return response.text
+        except BandwidthBudgetExceeded as e:
+            self.logger.warning(f"Skipping {url}: {e}")
+            return None
         except RequestException as e:
             self.logger.error(f"Error scraping {url}: {e}")
             return None
@@ -223,7 +256,7 @@ class IGRScraper:
             os.makedirs(data_dir)
 
         for url in urls:
-            html_content = await self.scrape_property(url)
+            html_content = await self.scrape_property(url, job_id=job_id)
             if html_content:
                 try:
                     # Generate a unique filename based on URL or a hash
@@ -423,6 +456,72 @@ async def get_job_status_endpoint(job_id: str):
         )
     raise HTTPException(status_code=404, detail="Job not found")
 
+@app.get("/api/v1/bandwidth")
+async def bandwidth_stats():
+    """Proxy byte usage per stage, job and session"""
+    return get_bandwidth_tracker().get_stats()
+
+@app.get("/api/v1/qr/cache")
+async def qr_cache_stats():
+    """QR decode cache hit rates"""
+    return get_qr_cache().get_stats()
+
+def get_qr_batch_decoder() -> QRBatchDecoder:
+    global qr_batch_decoder
+    if qr_batch_decoder is None:
+        qr_batch_decoder = QRBatchDecoder()
+    return qr_batch_decoder
+
+@app.post("/api/v1/qr/decode")
+async def decode_qr_batch(request: Request):
+    """
+    Decode QR codes from a batch of images: {"items": [{"url": ...} | {"data": base64}, ...]}.
+    Streams one JSON line per item as it finishes, then a {"done": true} summary.
+    """
+    # Read the body ourselves so an oversized request is refused before it is buffered
+    max_body = MAX_BATCH_BYTES * 4 // 3 + MAX_BATCH_ITEMS * 4096
+    if int(request.headers.get('content-length') or 0) > max_body:
+        raise HTTPException(status_code=413, detail=f"Request body exceeds {max_body} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_body:
+            raise HTTPException(status_code=413, detail=f"Request body exceeds {max_body} bytes")
+
+    try:
+        batch = QRDecodeRequest(**json.loads(body))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request: {e}")
+    if not batch.items:
+        raise HTTPException(status_code=422, detail="No items to decode")
+    if len(batch.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ITEMS} items per request")
+
+    items = []
+    for index, item in enumerate(batch.items):
+        if (item.url is None) == (item.data is None):
+            raise HTTPException(status_code=422, detail=f"Item {index}: give exactly one of url or data")
+        if item.url is not None:
+            if not item.url.startswith(('http://', 'https://')):
+                raise HTTPException(status_code=422, detail=f"Item {index}: only http(s) URLs are supported")
+            items.append({"id": item.id, "url": item.url})
+            continue
+        try:
+            content = base64.b64decode(item.data, validate=True)
+        except (binascii.Error, ValueError):
+            raise HTTPException(status_code=422, detail=f"Item {index}: data is not valid base64")
+        items.append({"id": item.id, "content": content})
+    if sum(len(item.get("content", b"")) for item in items) > MAX_BATCH_BYTES:
+        raise HTTPException(status_code=413, detail=f"Uploaded images exceed {MAX_BATCH_BYTES} bytes")
+
+    decoder = get_qr_batch_decoder()
+
+    async def stream_results():
+        async for result in decoder.decode_stream(items):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 @app.get("/api/v1/jobs", response_model=List[JobStatusResponse])
 async def list_jobs():
     """List all jobs"""
@@ -0,0 +1,345 @@
+import os
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Budget actions
+ACTION_OK = "ok"
+ACTION_DOWNGRADE = "downgrade"
+ACTION_PAUSE = "pause"
+
+
+class BandwidthBudgetExceeded(Exception):
+    """Raised when a byte budget with the 'pause' action has been used up"""
+
+    def __init__(self, budget: "ByteBudget", used_bytes: int):
+        self.budget = budget
+        self.used_bytes = used_bytes
+        super().__init__(
+            f"Bandwidth budget exceeded for {budget.scope} '{budget.key or '*'}': "
+            f"{used_bytes} / {budget.max_bytes} bytes"
+        )
+
+
+class ByteBudget:
+    def __init__(self, max_bytes: int, scope: str = "job", key: Optional[str] = None,
+                 action: str = ACTION_PAUSE):
+        """
+        Byte budget for one aggregation scope
+
+        Args:
+            max_bytes: Total wire bytes (request + response) allowed
+            scope: One of 'stage', 'job', 'session' or 'total'
+            key: Specific stage/job/session name, or None to apply to each one
+            action: 'pause' (raise) or 'downgrade' (callers switch to cheaper mode)
+        """
+        if scope not in ("stage", "job", "session", "total"):
+            raise ValueError(f"Unknown budget scope: {scope}")
+        if action not in (ACTION_PAUSE, ACTION_DOWNGRADE):
+            raise ValueError(f"Unknown budget action: {action}")
+        self.max_bytes = int(max_bytes)
+        self.scope = scope
+        self.key = key
+        self.action = action
+
+    def applies_to(self, scope: str, key: Optional[str]) -> bool:
+        return self.scope == scope and (self.key is None or self.key == key)
+
+
+class BandwidthTracker:
+    def __init__(self, budgets: Optional[List[ByteBudget]] = None,
+                 cost_per_gb: Optional[float] = None):
+        """
+        Byte-level accounting for proxied HTTP requests and browser sessions
+
+        Args:
+            budgets: Optional list of ByteBudget limits
+            cost_per_gb: Proxy price per GB used for cost estimates (PROXY_COST_PER_GB)
+        """
+        self.budgets = budgets if budgets is not None else self._budgets_from_env()
+        if cost_per_gb is None:
+            cost_per_gb = float(os.getenv('PROXY_COST_PER_GB', '0') or 0)
+        self.cost_per_gb = cost_per_gb
+        self._lock = threading.Lock()
+        self._totals = self._empty_bucket()
+        self._by_scope: Dict[str, Dict[str, Dict[str, int]]] = {
+            "stage": {}, "job": {}, "session": {}
+        }
+
+    @staticmethod
+    def _budgets_from_env() -> List[ByteBudget]:
+        """Build default budgets from BANDWIDTH_*_BUDGET_MB environment variables"""
+        budgets = []
+        action = os.getenv('BANDWIDTH_BUDGET_ACTION', ACTION_PAUSE)
+        for scope in ("job", "session", "total"):
+            value = os.getenv(f'BANDWIDTH_{scope.upper()}_BUDGET_MB')
+            if value:
+                budgets.append(ByteBudget(int(float(value) * 1024 * 1024), scope=scope, action=action))
+        return budgets
+
+    @staticmethod
+    def _empty_bucket() -> Dict[str, int]:
+        return {
+            "requests": 0,
+            "request_bytes": 0,
+            "response_bytes": 0,
+            "decoded_bytes": 0,
+        }
+
+    def record(self, stage: str, request_bytes: int, response_bytes: int,
+               decoded_bytes: Optional[int] = None, job_id: Optional[str] = None,
+               session_id: Optional[str] = None, requests_count: int = 1):
+        """
+        Record the bytes of one (or several) transfers
+
+        Args:
+            stage: Logical stage, e.g. 'search', 'captcha', 'document', 'qr_image'
+            request_bytes: Bytes sent upstream (request line, headers and body)
+            response_bytes: Bytes received on the wire (headers and encoded body)
+            decoded_bytes: Body size after content decoding, for compression ratio
+        """
+        if decoded_bytes is None:
+            decoded_bytes = response_bytes
+        keys = {"stage": stage, "job": job_id, "session": session_id}
+        with self._lock:
+            buckets = [self._totals]
+            for scope, key in keys.items():
+                if key is not None:
+                    buckets.append(self._by_scope[scope].setdefault(key, self._empty_bucket()))
+            for bucket in buckets:
+                bucket["requests"] += requests_count
+                bucket["request_bytes"] += request_bytes
+                bucket["response_bytes"] += response_bytes
+                bucket["decoded_bytes"] += decoded_bytes
+
+    @staticmethod
+    def _headers_size(headers) -> int:
+        return sum(len(str(k)) + len(str(v)) + 4 for k, v in headers.items()) + 2
+
+    def measure_response(self, response, streamed: bool = False) -> Dict[str, int]:
+        """
+        Estimate request/response wire sizes for a requests.Response
+
+        Args:
+            streamed: Body was read (possibly only partly) through iter_content/raw,
+                so only the bytes pulled off the socket are counted
+        """
+        request = response.request
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        request_bytes = (len(request.method or "") + len(request.url or "") + 12
+                         + self._headers_size(request.headers) + len(body))
+
+        decoded_bytes = None if streamed else len(response.content)
+        encoded_bytes = None
+        raw = getattr(response, 'raw', None)
+        if raw is not None and hasattr(raw, 'tell'):
+            try:
+                # urllib3 counts bytes pulled off the socket before decoding
+                encoded_bytes = raw.tell() or None
+            except Exception:
+                encoded_bytes = None
+        if encoded_bytes is None:
+            content_length = response.headers.get('Content-Length')
+            encoded_bytes = int(content_length) if content_length and content_length.isdigit() else decoded_bytes
+        if decoded_bytes is None:
+            decoded_bytes = encoded_bytes or 0
+            encoded_bytes = encoded_bytes or 0
+
+        response_bytes = 15 + len(response.reason or "") + self._headers_size(response.headers) + encoded_bytes
+        return {
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+            "decoded_bytes": decoded_bytes + (response_bytes - encoded_bytes),
+        }
+
+    def hook(self, stage: str, job_id: Optional[str] = None,
+             session_id: Optional[str] = None) -> Callable:
+        """Build a requests response hook that records every response"""
+        def _record_response(response, *args, **kwargs):
+            if kwargs.get('stream'):
+                # Body not read yet; measure when the caller closes the response
+                self._record_on_close(response, stage, job_id, session_id)
+                return response
+            try:
+                sizes = self.measure_response(response)
+                self.record(stage, job_id=job_id, session_id=session_id, **sizes)
+            except Exception as e:
+                logger.debug(f"Could not measure response size: {e}")
+            return response
+        return _record_response
+
+    def _record_on_close(self, response, stage: str, job_id: Optional[str], session_id: Optional[str]):
+        close = response.close
+
+        def close_and_record():
+            if not getattr(response, '_bandwidth_recorded', False):
+                response._bandwidth_recorded = True
+                try:
+                    self.record(stage, job_id=job_id, session_id=session_id,
+                                **self.measure_response(response, streamed=True))
+                except Exception as e:
+                    logger.debug(f"Could not measure streamed response size: {e}")
+            close()
+
+        response.close = close_and_record
+
+    def hooks(self, stage: str, job_id: Optional[str] = None,
+              session_id: Optional[str] = None) -> Dict[str, List[Callable]]:
+        """Hooks dict suitable for the ``hooks=`` argument of requests calls"""
+        return {"response": [self.hook(stage, job_id, session_id)]}
+
+    def record_browser_session(self, driver, stage: str = "browser",
+                               job_id: Optional[str] = None,
+                               session_id: Optional[str] = None) -> Dict[str, int]:
+        """
+        Record page and subresource bytes for a Selenium driver via the
+        Resource Timing API. Call before navigating away or quitting.
+
+        Cross-origin resources without Timing-Allow-Origin report zero sizes,
+        so this is a lower bound for third-party content.
+        """
+        script = """
+            var entries = performance.getEntriesByType('navigation')
+                .concat(performance.getEntriesByType('resource'));
+            return entries.map(function(e) {
+                return [e.transferSize || 0, e.encodedBodySize || 0, e.decodedBodySize || 0];
+            });
+        """
+        try:
+            entries = driver.execute_script(script) or []
+        except Exception as e:
+            logger.warning(f"Could not read browser resource timings: {e}")
+            return self._empty_bucket()
+
+        transfer = sum(int(e[0]) for e in entries)
+        encoded = sum(int(e[1]) for e in entries)
+        decoded = sum(int(e[2]) for e in entries)
+        # Approximate request size from the number of requests (headers only)
+        request_bytes = 500 * len(entries)
+        self.record(stage, request_bytes, transfer, decoded + (transfer - encoded),
+                    job_id=job_id, session_id=session_id, requests_count=len(entries))
+        return {
+            "requests": len(entries),
+            "request_bytes": request_bytes,
+            "response_bytes": transfer,
+            "decoded_bytes": decoded + (transfer - encoded),
+        }
+
+    def _used(self, scope: str, key: Optional[str]) -> int:
+        if scope == "total":
+            bucket = self._totals
+        else:
+            bucket = self._by_scope[scope].get(key)
+        if not bucket:
+            return 0
+        return bucket["request_bytes"] + bucket["response_bytes"]
+
+    def check_budget(self, stage: Optional[str] = None, job_id: Optional[str] = None,
+                     session_id: Optional[str] = None) -> str:
+        """
+        Check the budgets that apply to a unit of work
+
+        Returns:
+            'ok', 'downgrade' or 'pause' (the most restrictive exceeded budget)
+        """
+        result = ACTION_OK
+        keys = {"stage": stage, "job": job_id, "session": session_id, "total": None}
+        with self._lock:
+            for budget in self.budgets:
+                key = keys[budget.scope]
+                if budget.scope != "total" and key is None:
+                    continue
+                if not budget.applies_to(budget.scope, key):
+                    continue
+                if self._used(budget.scope, key) >= budget.max_bytes:
+                    if budget.action == ACTION_PAUSE:
+                        return ACTION_PAUSE
+                    result = ACTION_DOWNGRADE
+        return result
+
+    def enforce(self, stage: Optional[str] = None, job_id: Optional[str] = None,
+                session_id: Optional[str] = None) -> bool:
+        """
+        Raise BandwidthBudgetExceeded if a 'pause' budget is used up
+
+        Returns:
+            True if work should continue in downgraded (cheaper) mode
+        """
+        keys = {"stage": stage, "job": job_id, "session": session_id, "total": None}
+        downgrade = False
+        with self._lock:
+            for budget in self.budgets:
+                key = keys[budget.scope]
+                if budget.scope != "total" and key is None:
+                    continue
+                if not budget.applies_to(budget.scope, key):
+                    continue
+                used = self._used(budget.scope, key)
+                if used >= budget.max_bytes:
+                    if budget.action == ACTION_PAUSE:
+                        raise BandwidthBudgetExceeded(budget, used)
+                    downgrade = True
+        return downgrade
+
+    def _summarize(self, bucket: Dict[str, int]) -> Dict[str, Any]:
+        wire = bucket["request_bytes"] + bucket["response_bytes"]
+        summary = dict(bucket)
+        summary["total_bytes"] = wire
+        summary["compression_ratio"] = (
+            round(bucket["decoded_bytes"] / bucket["response_bytes"], 3)
+            if bucket["response_bytes"] else None
+        )
+        summary["avg_bytes_per_request"] = wire // bucket["requests"] if bucket["requests"] else 0
+        if self.cost_per_gb:
+            summary["estimated_cost"] = round(wire / (1024 ** 3) * self.cost_per_gb, 6)
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Aggregated byte counts per stage, job and session"""
+        with self._lock:
+            return {
+                "total": self._summarize(self._totals),
+                "stages": {k: self._summarize(v) for k, v in self._by_scope["stage"].items()},
+                "jobs": {k: self._summarize(v) for k, v in self._by_scope["job"].items()},
+                "sessions": {k: self._summarize(v) for k, v in self._by_scope["session"].items()},
+            }
+
+    def save_report(self, path: str) -> str:
+        """Write the current stats to a JSON file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        report = self.get_stats()
+        report["generated_at"] = datetime.now().isoformat()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Bandwidth report saved to {path}")
+        return path
+
+
+def downgrade_firefox_options(options):
+    """Configure Firefox options to skip images, fonts and media to save proxy bytes"""
+    options.set_preference("permissions.default.image", 2)
+    options.set_preference("browser.display.use_document_fonts", 0)
+    options.set_preference("media.autoplay.default", 5)
+    options.set_preference("media.play-stand-alone", False)
+    return options
+
+
+_default_tracker: Optional[BandwidthTracker] = None
+_default_lock = threading.Lock()
+
+
+def get_bandwidth_tracker() -> BandwidthTracker:
+    """Process-wide tracker shared by scrapers that are not given one explicitly"""
+    global _default_tracker
+    with _default_lock:
+        if _default_tracker is None:
+            _default_tracker = BandwidthTracker()
+        return _default_tracker
@@ -0,0 +1,426 @@
+import os
+import csv
+import hashlib
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .captcha_preprocess import load_captcha
+
+logger = logging.getLogger(__name__)
+
+CAPTCHA_DATA_DIR = os.getenv('CAPTCHA_DATA_DIR', os.path.join('data', 'captchas'))
+CAPTCHA_MODEL_PATH = os.getenv('CAPTCHA_MODEL', os.path.join('data', 'models', 'captcha_cnn.npz'))
+# A model answer at or above this confidence is used without running the OCR engines
+CNN_ACCEPT_CONFIDENCE = float(os.getenv('CAPTCHA_CNN_ACCEPT', '0.7'))
+
+INPUT_HEIGHT = 32
+INPUT_WIDTH = 96
+CHANNELS = (16, 32, 64)
+# Height shrinks 8x, width 4x: the model reads 24 columns
+POOLS = ((2, 2), (2, 2), (2, 1))
+HIDDEN = 128
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+def prepare(source: Any) -> np.ndarray:
+    """CAPTCHA (anything load_captcha() accepts) -> normalised float32 (H, W) model input"""
+    gray = cv2.resize(load_captcha(source), (INPUT_WIDTH, INPUT_HEIGHT), interpolation=cv2.INTER_AREA)
+    x = gray.astype(np.float32) / 255.0
+    return (x - x.mean()) / (x.std() + 1e-3)
+
+
+def load_labelled(directory: str = CAPTCHA_DATA_DIR) -> List[Tuple[str, str]]:
+    """
+    Labelled CAPTCHAs as [(image path, text)]
+
+    Labels come from <directory>/labels.csv (file,label; file relative to the
+    directory) and from hand-labelled images named <TEXT>.png or <TEXT>_<n>.png
+    in <directory>/labelled.
+    """
+    samples = {}
+    labels_path = os.path.join(directory, 'labels.csv')
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='') as f:
+            for row in csv.DictReader(f):
+                path = os.path.join(directory, row['file'])
+                if row.get('label') and os.path.exists(path):
+                    samples[path] = row['label']
+    labelled_dir = os.path.join(directory, 'labelled')
+    if os.path.isdir(labelled_dir):
+        for name in sorted(os.listdir(labelled_dir)):
+            stem, extension = os.path.splitext(name)
+            if extension.lower() in IMAGE_EXTENSIONS:
+                samples[os.path.join(labelled_dir, name)] = stem.split('_')[0]
+    return sorted(samples.items())
+
+
+def split_labelled(labelled: List[Tuple[str, str]], validation: float = 0.1,
+                   seed: int = 0) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """
+    Split load_labelled() output into (training, validation).
+
+    Each CAPTCHA's side is decided by a seeded hash of its file name and label,
+    so a CAPTCHA stays on the same side when the corpus grows and the benchmark
+    can score the model on exactly the CAPTCHAs it was not trained on.
+    """
+    training, held_out = [], []
+    for path, text in labelled:
+        digest = hashlib.sha1(f"{seed}:{os.path.basename(path)}:{text}".encode()).digest()
+        share = int.from_bytes(digest[:8], 'big') / 2.0 ** 64
+        (held_out if share < validation else training).append((path, text))
+    return training, held_out
+
+
+def model_metadata(path: str = CAPTCHA_MODEL_PATH) -> Dict[str, Any]:
+    """Metadata saved with a trained model (empty if there is no model or none was saved)"""
+    try:
+        with np.load(path) as data:
+            return json.loads(str(data["metadata"]))
+    except (OSError, KeyError, ValueError):
+        return {}
+
+
+# ----- layers (NHWC, float32) -----
+
+def _conv_forward(x: np.ndarray, weights: np.ndarray, bias: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """3x3 'same' convolution as one matmul over the 9 shifted copies (im2col)"""
+    n, h, w, _ = x.shape
+    padded = np.pad(x, ((0, 0), (1, 1), (1, 1), (0, 0)))
+    cols = np.concatenate([padded[:, i:i + h, j:j + w, :] for i in range(3) for j in range(3)], axis=-1)
+    return cols @ weights + bias, cols
+
+
+def _conv_backward(grad: np.ndarray, cols: np.ndarray, weights: np.ndarray,
+                   need_input: bool = True) -> Tuple[Optional[np.ndarray], np.ndarray, np.ndarray]:
+    n, h, w, out_channels = grad.shape
+    in_channels = weights.shape[0] // 9
+    grad_weights = cols.reshape(-1, cols.shape[-1]).T @ grad.reshape(-1, out_channels)
+    grad_bias = grad.sum(axis=(0, 1, 2))
+    if not need_input:
+        return None, grad_weights, grad_bias
+    grad_cols = grad @ weights.T
+    grad_padded = np.zeros((n, h + 2, w + 2, in_channels), dtype=grad.dtype)
+    for k in range(9):
+        i, j = divmod(k, 3)
+        grad_padded[:, i:i + h, j:j + w, :] += grad_cols[..., k * in_channels:(k + 1) * in_channels]
+    return grad_padded[:, 1:-1, 1:-1, :], grad_weights, grad_bias
+
+
+def _pool_forward(x: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    n, h, w, c = x.shape
+    ph, pw = size
+    return x.reshape(n, h // ph, ph, w // pw, pw, c).max(axis=(2, 4))
+
+
+def _pool_backward(grad: np.ndarray, x: np.ndarray, pooled: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    ph, pw = size
+    upsampled = pooled.repeat(ph, axis=1).repeat(pw, axis=2)
+    return (x == upsampled) * grad.repeat(ph, axis=1).repeat(pw, axis=2)
+
+
+def _neighbours(columns: np.ndarray) -> np.ndarray:
+    """(N, T, F) -> (N, T, 3F): each column with its left and right neighbour"""
+    padded = np.pad(columns, ((0, 0), (1, 1), (0, 0)))
+    return np.concatenate([padded[:, :-2], padded[:, 1:-1], padded[:, 2:]], axis=-1)
+
+
+def _neighbours_backward(grad: np.ndarray) -> np.ndarray:
+    features = grad.shape[-1] // 3
+    padded = np.zeros((grad.shape[0], grad.shape[1] + 2, features), dtype=grad.dtype)
+    padded[:, :-2] += grad[..., :features]
+    padded[:, 1:-1] += grad[..., features:2 * features]
+    padded[:, 2:] += grad[..., 2 * features:]
+    return padded[:, 1:-1]
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=-1, keepdims=True))
+
+
+def ctc_loss(log_probs: np.ndarray, targets: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CTC negative log-likelihood and its gradient w.r.t. the logits, batched
+
+    Args:
+        log_probs: (N, T, K) log-softmax outputs, class 0 = blank
+        targets: Label indices (1..K-1) per sample
+
+    Returns:
+        (loss per sample (N,), gradient (N, T, K))
+    """
+    n, steps, classes = log_probs.shape
+    states = 2 * max(len(t) for t in targets) + 1
+    extended = np.zeros((n, states), dtype=np.int64)
+    lengths = np.array([2 * len(t) + 1 for t in targets])
+    for index, target in enumerate(targets):
+        extended[index, 1:2 * len(target):2] = target
+    valid = np.arange(states)[None, :] < lengths[:, None]
+    skip = np.zeros((n, states), dtype=bool)
+    skip[:, 2:] = (extended[:, 2:] != 0) & (extended[:, 2:] != extended[:, :-2])
+    emit = np.take_along_axis(log_probs, np.broadcast_to(extended[:, None, :], (n, steps, states)), axis=2)
+    emit = np.where(valid[:, None, :], emit, -np.inf)
+
+    # Forward (alpha includes the emission at t)
+    alpha = np.full((n, steps, states), -np.inf)
+    alpha[:, 0, 0] = emit[:, 0, 0]
+    alpha[:, 0, 1] = np.where(lengths > 1, emit[:, 0, 1], -np.inf)
+    for t in range(1, steps):
+        previous = alpha[:, t - 1]
+        stay = previous
+        step_one = np.concatenate([np.full((n, 1), -np.inf), previous[:, :-1]], axis=1)
+        step_two = np.where(skip, np.concatenate([np.full((n, 2), -np.inf), previous[:, :-2]], axis=1), -np.inf)
+        alpha[:, t] = np.logaddexp(np.logaddexp(stay, step_one), step_two) + emit[:, t]
+
+    rows = np.arange(n)
+    log_likelihood = np.logaddexp(alpha[rows, -1, lengths - 1],
+                                  np.where(lengths > 1, alpha[rows, -1, np.maximum(lengths - 2, 0)], -np.inf))
+
+    # Backward (beta excludes the emission at t)
+    beta = np.full((n, steps, states), -np.inf)
+    beta[rows, -1, lengths - 1] = 0.0
+    beta[rows[lengths > 1], -1, lengths[lengths > 1] - 2] = 0.0
+    skip_into = np.concatenate([skip[:, 2:], np.zeros((n, 2), dtype=bool)], axis=1)
+    for t in range(steps - 2, -1, -1):
+        following = beta[:, t + 1] + emit[:, t + 1]
+        stay = following
+        step_one = np.concatenate([following[:, 1:], np.full((n, 1), -np.inf)], axis=1)
+        step_two = np.where(skip_into, np.concatenate([following[:, 2:], np.full((n, 2), -np.inf)], axis=1), -np.inf)
+        beta[:, t] = np.logaddexp(np.logaddexp(stay, step_one), step_two)
+
+    with np.errstate(invalid='ignore'):
+        occupancy = np.exp(alpha + beta - log_likelihood[:, None, None])
+    occupancy = np.nan_to_num(occupancy)
+    expected = np.zeros((n, steps, classes))
+    for state in range(states):
+        np.add.at(expected, (rows, slice(None), extended[:, state]), occupancy[:, :, state])
+    grad = np.exp(log_probs) - expected
+    return -log_likelihood, grad
+
+
+class CaptchaCNN:
+    def __init__(self, alphabet: str, seed: int = 0):
+        """
+        Small CNN read column by column with CTC (class 0 = blank), so
+        CAPTCHAs of any length up to ~COLUMNS/2 characters work. NumPy only,
+        for training and inference.
+
+        Args:
+            alphabet: Characters the model can output
+            seed: Weight initialisation seed
+        """
+        self.alphabet = alphabet
+        self.classes = len(alphabet) + 1
+        rng = np.random.default_rng(seed)
+        self.params: Dict[str, np.ndarray] = {}
+        in_channels = 1
+        for index, out_channels in enumerate(CHANNELS):
+            fan_in = 9 * in_channels
+            self.params[f"conv{index}_w"] = (rng.standard_normal((fan_in, out_channels)) *
+                                             np.sqrt(2.0 / fan_in)).astype(np.float32)
+            self.params[f"conv{index}_b"] = np.zeros(out_channels, dtype=np.float32)
+            in_channels = out_channels
+        features = 3 * (INPUT_HEIGHT // 8) * CHANNELS[-1]
+        self.params["dense_w"] = (rng.standard_normal((features, HIDDEN)) * np.sqrt(2.0 / features)).astype(np.float32)
+        self.params["dense_b"] = np.zeros(HIDDEN, dtype=np.float32)
+        self.params["head_w"] = (rng.standard_normal((HIDDEN, self.classes)) *
+                                 np.sqrt(1.0 / HIDDEN)).astype(np.float32)
+        self.params["head_b"] = np.zeros(self.classes, dtype=np.float32)
+
+    # ----- forward / backward -----
+
+    def _forward(self, x: np.ndarray, keep: bool = False) -> Tuple[np.ndarray, List[Any]]:
+        """(N, H, W) inputs -> (N, COLUMNS, classes) logits"""
+        cache: List[Any] = []
+        out = x[..., None]
+        for index, pool in enumerate(POOLS):
+            conv, cols = _conv_forward(out, self.params[f"conv{index}_w"], self.params[f"conv{index}_b"])
+            relu = np.maximum(conv, 0)
+            pooled = _pool_forward(relu, pool)
+            if keep:
+                cache.append((cols, conv, relu, pooled))
+            out = pooled
+        # One column per horizontal step: stack the rows' channels as its features
+        columns = out.transpose(0, 2, 1, 3).reshape(len(x), out.shape[2], -1)
+        context = _neighbours(columns)
+        hidden_pre = context @ self.params["dense_w"] + self.params["dense_b"]
+        hidden = np.maximum(hidden_pre, 0)
+        logits = hidden @ self.params["head_w"] + self.params["head_b"]
+        if keep:
+            cache.append((out.shape, context, hidden_pre, hidden))
+        return logits, cache
+
+    def _backward(self, grad_logits: np.ndarray, cache: List[Any]) -> Dict[str, np.ndarray]:
+        grads: Dict[str, np.ndarray] = {}
+        pooled_shape, context, hidden_pre, hidden = cache[-1]
+        features = hidden.shape[-1]
+        grads["head_w"] = hidden.reshape(-1, features).T @ grad_logits.reshape(-1, grad_logits.shape[-1])
+        grads["head_b"] = grad_logits.sum(axis=(0, 1))
+        grad_hidden = (grad_logits @ self.params["head_w"].T) * (hidden_pre > 0)
+        grads["dense_w"] = context.reshape(-1, context.shape[-1]).T @ grad_hidden.reshape(-1, features)
+        grads["dense_b"] = grad_hidden.sum(axis=(0, 1))
+        grad_columns = _neighbours_backward(grad_hidden @ self.params["dense_w"].T)
+        n, h, w, c = pooled_shape
+        grad = grad_columns.reshape(n, w, h, c).transpose(0, 2, 1, 3)
+        for index in reversed(range(len(CHANNELS))):
+            cols, conv, relu, pooled = cache[index]
+            grad = _pool_backward(grad, relu, pooled, POOLS[index]) * (conv > 0)
+            grad, grads[f"conv{index}_w"], grads[f"conv{index}_b"] = _conv_backward(
+                grad, cols, self.params[f"conv{index}_w"], need_input=index > 0)
+        return grads
+
+    # ----- labels -----
+
+    def encode(self, text: str) -> List[int]:
+        return [self.alphabet.index(char) + 1 for char in text]
+
+    def decode(self, probabilities: np.ndarray) -> Tuple[str, float]:
+        """
+        Greedy CTC decode of (COLUMNS, classes) probabilities: best class per
+        column, repeats merged, blanks dropped. The confidence is the
+        probability of that best path.
+        """
+        best = probabilities.argmax(axis=-1)
+        chars = [self.alphabet[k - 1] for index, k in enumerate(best)
+                 if k > 0 and (index == 0 or k != best[index - 1])]
+        return ''.join(chars), float(np.prod(probabilities.max(axis=-1)))
+
+    # ----- inference -----
+
+    def predict(self, sources: List[Any]) -> List[Tuple[str, float]]:
+        """[(text, confidence)] per CAPTCHA"""
+        if not sources:
+            return []
+        x = np.stack([prepare(source) for source in sources])
+        logits, _ = self._forward(x)
+        return [self.decode(p) for p in np.exp(_log_softmax(logits))]
+
+    def solve(self, source: Any) -> Dict[str, Any]:
+        text, confidence = self.predict([source])[0]
+        return {"text": text, "confidence": round(confidence, 4), "engine": "cnn"}
+
+    # ----- training -----
+
+    def fit(self, samples: List[Tuple[np.ndarray, str]], epochs: int = 40, batch_size: int = 32,
+            learning_rate: float = 1e-3, validation: Optional[List[Tuple[np.ndarray, str]]] = None,
+            seed: int = 0, augment: bool = True, log=print) -> Dict[str, Any]:
+        """
+        Train with Adam on CTC loss; keeps the weights of the best validation epoch
+
+        Args:
+            samples: [(prepare()d image, text)]
+            validation: Held-out samples for exact-match accuracy per epoch
+            augment: Random shifts and noise on every batch
+
+        Returns:
+            {"epochs": [...], "best_accuracy", "best_epoch"}
+        """
+        rng = np.random.default_rng(seed)
+        x = np.stack([image for image, _ in samples])
+        y = [self.encode(text) for _, text in samples]
+        moments = {k: (np.zeros_like(v), np.zeros_like(v)) for k, v in self.params.items()}
+        step = 0
+        history = []
+        best = {"accuracy": -1.0, "epoch": 0, "params": None}
+        for epoch in range(1, epochs + 1):
+            started = time.time()
+            order = rng.permutation(len(x))
+            losses = []
+            for offset in range(0, len(x), batch_size):
+                batch = order[offset:offset + batch_size]
+                inputs = _augment(x[batch], rng) if augment else x[batch]
+                logits, cache = self._forward(inputs, keep=True)
+                loss, grad = ctc_loss(_log_softmax(logits.astype(np.float64)), [y[i] for i in batch])
+                losses.append(float(loss.mean()))
+                grads = self._backward((grad / len(batch)).astype(np.float32), cache)
+
+                step += 1
+                for name, value in grads.items():
+                    m, v = moments[name]
+                    m *= 0.9
+                    m += 0.1 * value
+                    v *= 0.999
+                    v += 0.001 * value * value
+                    m_hat = m / (1 - 0.9 ** step)
+                    v_hat = v / (1 - 0.999 ** step)
+                    self.params[name] -= (learning_rate * m_hat / (np.sqrt(v_hat) + 1e-8)).astype(np.float32)
+
+            entry = {"epoch": epoch, "loss": round(float(np.mean(losses)), 4), "seconds": round(time.time() - started, 1)}
+            if validation:
+                entry["accuracy"] = self.accuracy(validation)
+                if entry["accuracy"] > best["accuracy"]:
+                    best = {"accuracy": entry["accuracy"], "epoch": epoch,
+                            "params": {k: v.copy() for k, v in self.params.items()}}
+            history.append(entry)
+            log(f"   epoch {epoch:3d}: loss {entry['loss']:.3f}"
+                + (f", validation accuracy {entry['accuracy']:.3f}" if validation else "")
+                + f" ({entry['seconds']}s)")
+        if best["params"] is not None:
+            self.params = best["params"]
+        return {"epochs": history, "best_accuracy": best["accuracy"] if validation else None,
+                "best_epoch": best["epoch"] if validation else epochs}
+
+    def accuracy(self, samples: List[Tuple[np.ndarray, str]], batch_size: int = 128) -> float:
+        correct = 0
+        for offset in range(0, len(samples), batch_size):
+            chunk = samples[offset:offset + batch_size]
+            logits, _ = self._forward(np.stack([image for image, _ in chunk]))
+            for probabilities, (_, text) in zip(np.exp(_log_softmax(logits)), chunk):
+                correct += int(self.decode(probabilities)[0] == text)
+        return round(correct / len(samples), 4) if samples else 0.0
+
+    # ----- persistence -----
+
+    def save(self, path: str = CAPTCHA_MODEL_PATH, metadata: Optional[Dict[str, Any]] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(tmp_path, alphabet=np.array(self.alphabet),
+                            metadata=np.array(json.dumps(metadata or {})), **self.params)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = CAPTCHA_MODEL_PATH) -> 'CaptchaCNN':
+        with np.load(path) as data:
+            model = cls(str(data["alphabet"]))
+            model.params = {name: data[name].astype(np.float32) for name in model.params}
+        return model
+
+
+def _augment(batch: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Shift each image by up to 3 px horizontally / 2 px vertically and add a little noise"""
+    out = np.empty_like(batch)
+    for index, image in enumerate(batch):
+        dx, dy = int(rng.integers(-3, 4)), int(rng.integers(-2, 3))
+        out[index] = np.roll(np.roll(image, dy, axis=0), dx, axis=1)
+    return out + rng.normal(0, 0.1, out.shape).astype(np.float32)
+
+
+_default_model: Optional[CaptchaCNN] = None
+_default_loaded_at = 0.0
+_default_lock = threading.Lock()
+
+
+def get_captcha_model() -> Optional[CaptchaCNN]:
+    """Trained CAPTCHA model from CAPTCHA_MODEL, reloaded when the file changes; None if not trained yet"""
+    global _default_model, _default_loaded_at
+    with _default_lock:
+        try:
+            modified = os.path.getmtime(CAPTCHA_MODEL_PATH)
+        except OSError:
+            return None
+        if _default_model is None or modified > _default_loaded_at:
+            try:
+                _default_model = CaptchaCNN.load(CAPTCHA_MODEL_PATH)
+                _default_loaded_at = modified
+            except Exception as e:
+                logger.warning(f"Could not load CAPTCHA model {CAPTCHA_MODEL_PATH}: {e}")
+                return _default_model
+        return _default_model
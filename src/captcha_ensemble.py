@@ -0,0 +1,131 @@
+import os
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Below this ensemble confidence a fresh CAPTCHA is usually cheaper than a failed submit
+SUBMIT_CONFIDENCE = float(os.getenv('CAPTCHA_SUBMIT_CONFIDENCE', '0.15'))
+
+# Relative trust per engine; unknown engines count 1.0
+ENGINE_WEIGHTS: Dict[str, float] = {}
+
+
+def align(reference: str, other: str) -> List[Optional[str]]:
+    """
+    Levenshtein alignment of other onto reference
+
+    Returns:
+        For each reference position, the character of other aligned to it, or
+        None where other has a gap. Extra characters in other are dropped.
+    """
+    rows, cols = len(reference) + 1, len(other) + 1
+    cost = [[0] * cols for _ in range(rows)]
+    for i in range(rows):
+        cost[i][0] = i
+    for j in range(cols):
+        cost[0][j] = j
+    for i in range(1, rows):
+        for j in range(1, cols):
+            cost[i][j] = min(cost[i - 1][j] + 1, cost[i][j - 1] + 1,
+                             cost[i - 1][j - 1] + (reference[i - 1] != other[j - 1]))
+
+    aligned: List[Optional[str]] = [None] * len(reference)
+    i, j = len(reference), len(other)
+    while i > 0 and j > 0:
+        if cost[i][j] == cost[i - 1][j - 1] + (reference[i - 1] != other[j - 1]):
+            aligned[i - 1] = other[j - 1]
+            i, j = i - 1, j - 1
+        elif cost[i][j] == cost[i - 1][j] + 1:
+            i -= 1
+        else:
+            j -= 1
+    return aligned
+
+
+def _weight(candidate: Dict[str, Any], engine_weights: Dict[str, float]) -> float:
+    return max(0.0, float(candidate.get("confidence") or 0.0)) * engine_weights.get(candidate.get("engine"), 1.0)
+
+
+def _vote_positions(length: int, voters: Sequence[Tuple[List[Optional[str]], float]]) -> List[Dict[str, float]]:
+    votes: List[Dict[str, float]] = [defaultdict(float) for _ in range(length)]
+    for chars, weight in voters:
+        for position, char in enumerate(chars):
+            if char is not None:
+                votes[position][char] += weight
+    return votes
+
+
+def vote(candidates: Sequence[Dict[str, Any]], min_length: int = 1, max_length: int = 12,
+         case_sensitive: bool = True, engine_weights: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Confidence-weighted vote over OCR candidates from several engines and variants
+
+    The answer length is voted first. Candidates of that length vote per
+    position directly; the others are aligned to the consensus and vote
+    where their characters line up. The overall confidence is the agreement
+    (voted share of the length times the voted share of every position)
+    scaled by the evidence for the answer: 1 - prod(1 - c) over the
+    candidates that read it exactly, or the mean candidate confidence when
+    the answer was pieced together character by character.
+
+    Args:
+        candidates: [{"text", "confidence", "engine", ...}]
+        min_length: Ignore candidates shorter than this (alphanumerics only)
+        max_length: Ignore candidates longer than this
+        case_sensitive: Fold everything to upper case when False
+        engine_weights: Relative trust per engine (default: ENGINE_WEIGHTS)
+
+    Returns:
+        {"text", "confidence", "agreement", "positions": [{"char", "share"}],
+        "length_share", "agreeing", "candidates"} or None without usable candidates
+    """
+    engine_weights = ENGINE_WEIGHTS if engine_weights is None else engine_weights
+    usable = []
+    for candidate in candidates:
+        text = ''.join(c for c in str(candidate.get("text", "")) if c.isalnum())
+        if not case_sensitive:
+            text = text.upper()
+        weight = _weight(candidate, engine_weights)
+        if min_length <= len(text) <= max_length and weight > 0:
+            usable.append((text, weight, min(1.0, float(candidate["confidence"]))))
+    if not usable:
+        return None
+
+    total = sum(weight for _, weight, _ in usable)
+    length_votes: Dict[int, float] = defaultdict(float)
+    for text, weight, _ in usable:
+        length_votes[len(text)] += weight
+    length = max(length_votes, key=lambda n: (length_votes[n], -abs(n - 6)))
+
+    exact = [(list(text), weight) for text, weight, _ in usable if len(text) == length]
+    consensus = ''.join(max(v, key=v.get) for v in _vote_positions(length, exact))
+    # Second pass with everyone: other lengths contribute where they align with the consensus
+    voters = exact + [(align(consensus, text), weight) for text, weight, _ in usable if len(text) != length]
+    positions = []
+    agreement = length_votes[length] / total
+    for position_votes in _vote_positions(length, voters):
+        char = max(position_votes, key=position_votes.get)
+        share = position_votes[char] / total
+        positions.append({"char": char, "share": round(share, 4)})
+        agreement *= share
+    text = ''.join(p["char"] for p in positions)
+
+    readers = [confidence for candidate, _, confidence in usable if candidate == text]
+    if readers:
+        doubt = 1.0
+        for confidence in readers:
+            doubt *= 1.0 - confidence
+        evidence = 1.0 - doubt
+    else:
+        evidence = sum(confidence for _, _, confidence in usable) / len(usable)
+    return {
+        "text": text,
+        "confidence": round(agreement * evidence, 4),
+        "agreement": round(agreement, 4),
+        "positions": positions,
+        "length_share": round(length_votes[length] / total, 4),
+        "agreeing": len(readers),
+        "candidates": len(usable),
+    }
@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CAPTCHA_WHITELIST = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+# An answer at or above this confidence is taken without waiting for the remaining runs
+ACCEPT_CONFIDENCE = float(os.getenv('CAPTCHA_ACCEPT_CONFIDENCE', '0.85'))
+
+TESSERACT_CONFIGS = [
+    f'--psm 8 -c tessedit_char_whitelist={CAPTCHA_WHITELIST}',
+    f'--psm 7 -c tessedit_char_whitelist={CAPTCHA_WHITELIST}',
+    f'--psm 6 -c tessedit_char_whitelist={CAPTCHA_WHITELIST}',
+    '--psm 13',
+    '--psm 8',
+    '--psm 7',
+    '--psm 6',
+    '--psm 10',
+    '--psm 9'
+]
+# Page segmentation modes that read a block of lines: all variants stacked into
+# one image go through a single tesseract process, one variant per line
+BATCHABLE_PSM = ('--psm 6',)
+STACK_GAP = 24
+
+# One OCR job: returns candidates {"text", "confidence", "engine", "variant", "config"}
+OCRJob = Callable[[], List[Dict[str, Any]]]
+
+
+def _to_gray(image: Any) -> np.ndarray:
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert('L'))
+    image = np.asarray(image)
+    return image if image.ndim == 2 else np.asarray(Image.fromarray(image).convert('L'))
+
+
+def _words(image: Any, config: str) -> List[Dict[str, Any]]:
+    data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+    words = []
+    for text, conf, left, top, height in zip(data['text'], data['conf'], data['left'], data['top'], data['height']):
+        if text.strip() and float(conf) >= 0:
+            words.append({"text": text.strip(), "conf": float(conf), "left": left, "center": top + height / 2.0})
+    return words
+
+
+def _candidate(words: List[Dict[str, Any]], variant: str, config: str) -> List[Dict[str, Any]]:
+    if not words:
+        return []
+    words = sorted(words, key=lambda w: w["left"])
+    return [{"text": ''.join(w["text"] for w in words),
+             "confidence": round(sum(w["conf"] for w in words) / len(words) / 100.0, 4),
+             "engine": "tesseract", "variant": variant, "config": config}]
+
+
+def tesseract_read(image: Any, config: str, variant: str) -> List[Dict[str, Any]]:
+    """One tesseract run on one variant"""
+    return _candidate(_words(image, config), variant, config)
+
+
+def tesseract_read_stacked(images: Sequence[Any], config: str, names: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Several variants in one tesseract process: stacked top to bottom on a white
+    page, with words assigned back to their variant by vertical position
+    """
+    grays = [_to_gray(image) for image in images]
+    width = max(g.shape[1] for g in grays)
+    height = sum(g.shape[0] for g in grays) + STACK_GAP * (len(grays) + 1)
+    page = np.full((height, width + 2 * STACK_GAP), 255, dtype=np.uint8)
+    bands = []
+    y = STACK_GAP
+    for gray in grays:
+        page[y:y + gray.shape[0], STACK_GAP:STACK_GAP + gray.shape[1]] = gray
+        bands.append((y - STACK_GAP / 2.0, y + gray.shape[0] + STACK_GAP / 2.0))
+        y += gray.shape[0] + STACK_GAP
+
+    per_variant: List[List[Dict[str, Any]]] = [[] for _ in grays]
+    for word in _words(page, config):
+        for index, (top, bottom) in enumerate(bands):
+            if top <= word["center"] < bottom:
+                per_variant[index].append(word)
+                break
+    candidates = []
+    for name, words in zip(names, per_variant):
+        candidates.extend(_candidate(words, name, config))
+    return candidates
+
+
+def tesseract_jobs(images: Sequence[Any], configs: Sequence[str] = TESSERACT_CONFIGS,
+                   names: Optional[Sequence[str]] = None,
+                   scores: Optional[Dict[Tuple[str, str], float]] = None) -> List[OCRJob]:
+    """
+    Tesseract jobs for every variant x config, block modes batched into one
+    process per config. Ordered config-first so every variant gets the most
+    reliable modes before the long tail.
+
+    Args:
+        scores: Historical success per (variant, config) (CaptchaStats.tesseract_scores());
+            jobs are reordered best first, unscored combinations counting 0.5
+    """
+    names = list(names or [f"variant_{index + 1}" for index in range(len(images))])
+    scored: List[Tuple[float, OCRJob]] = []
+    for config in configs:
+        if len(images) > 1 and config.startswith(BATCHABLE_PSM):
+            score = max((scores or {}).get((name, config), 0.5) for name in names)
+            scored.append((score, lambda config=config: tesseract_read_stacked(images, config, names)))
+            continue
+        for image, name in zip(images, names):
+            scored.append(((scores or {}).get((name, config), 0.5),
+                           lambda image=image, name=name, config=config: tesseract_read(image, config, name)))
+    if scores:
+        # Stable: equal scores keep the config-first order
+        scored.sort(key=lambda item: -item[0])
+    return [job for _, job in scored]
+
+
+_ocr_executor: Optional[ThreadPoolExecutor] = None
+_ocr_executor_lock = threading.Lock()
+
+
+def get_ocr_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all CAPTCHA solvers in this process (CAPTCHA_OCR_WORKERS).
+    Threads suffice: the work runs in tesseract processes and native code."""
+    global _ocr_executor
+    with _ocr_executor_lock:
+        if _ocr_executor is None:
+            workers = int(os.getenv('CAPTCHA_OCR_WORKERS', '0')) or (os.cpu_count() or 2)
+            _ocr_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='captcha-ocr')
+        return _ocr_executor
+
+
+class VariantEvaluator:
+    def __init__(self, executor: Optional[ThreadPoolExecutor] = None, accept_confidence: float = ACCEPT_CONFIDENCE,
+                 min_length: int = 3, max_length: int = 8):
+        """
+        Runs OCR jobs over CAPTCHA variants concurrently and stops as soon as one
+        answer is confident enough
+
+        Args:
+            executor: Pool to run jobs on (default: shared CAPTCHA OCR pool)
+            accept_confidence: Confidence at which the remaining jobs are cancelled
+            min_length: Shortest plausible answer (alphanumerics only)
+            max_length: Longest plausible answer
+        """
+        self.executor = executor or get_ocr_executor()
+        self.accept_confidence = accept_confidence
+        self.min_length = min_length
+        self.max_length = max_length
+        self.last_stats: Dict[str, Any] = {}
+
+    def _valid(self, candidate: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        text = ''.join(c for c in candidate.get("text", "") if c.isalnum())
+        if not self.min_length <= len(text) <= self.max_length:
+            return None
+        return {**candidate, "text": text}
+
+    def evaluate(self, jobs: Sequence[OCRJob]) -> List[Dict[str, Any]]:
+        """
+        Run jobs until one yields an answer at accept_confidence
+
+        Returns:
+            Plausible candidates collected so far, best first ([] if none)
+        """
+        started = time.perf_counter()
+        futures: List[Future] = [self.executor.submit(job) for job in jobs]
+        candidates: List[Dict[str, Any]] = []
+        completed = failed = 0
+        accepted = False
+        try:
+            for future in as_completed(futures):
+                completed += 1
+                try:
+                    results = future.result()
+                except Exception as e:
+                    failed += 1
+                    logger.debug(f"OCR job failed: {e}")
+                    continue
+                latency_ms = round((time.perf_counter() - started) * 1000, 1)
+                for candidate in results:
+                    candidate = self._valid(candidate)
+                    if candidate:
+                        candidate.setdefault("latency_ms", latency_ms)
+                        candidates.append(candidate)
+                        accepted = accepted or candidate["confidence"] >= self.accept_confidence
+                if accepted:
+                    break
+        finally:
+            # Jobs not started yet are dropped; running tesseract processes finish on their own
+            cancelled = sum(1 for future in futures if future.cancel())
+        candidates.sort(key=lambda c: -c["confidence"])
+        self.last_stats = {"jobs": len(futures), "completed": completed, "failed": failed,
+                           "cancelled": cancelled, "accepted": accepted,
+                           "seconds": round(time.perf_counter() - started, 3)}
+        return candidates
@@ -0,0 +1,78 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest wait for a background CAPTCHA solve once the form is ready to submit
+PREFETCH_TIMEOUT = float(os.getenv('CAPTCHA_PREFETCH_TIMEOUT', '60'))
+
+
+_prefetch_executor: Optional[ThreadPoolExecutor] = None
+_prefetch_lock = threading.Lock()
+
+
+def get_prefetch_executor() -> ThreadPoolExecutor:
+    """
+    Threads that download and solve CAPTCHAs while the form is being filled
+    (CAPTCHA_PREFETCH_WORKERS). Separate from the tesseract job pool: a solve
+    waits on that pool, and mostly on the network and the OCR service.
+    """
+    global _prefetch_executor
+    with _prefetch_lock:
+        if _prefetch_executor is None:
+            workers = int(os.getenv('CAPTCHA_PREFETCH_WORKERS', '8'))
+            _prefetch_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='captcha-prefetch')
+        return _prefetch_executor
+
+
+class PendingCaptcha:
+    def __init__(self, solve: Callable[..., Optional[str]], *args: Any,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """
+        A CAPTCHA solve started as soon as the page loads, awaited just before submit
+
+        The solve function must not touch the WebDriver (it is not thread-safe):
+        read the image URL or bytes on the driver thread and pass them in.
+
+        Args:
+            solve: Called as solve(*args) on the prefetch pool; returns the answer or None
+            executor: Pool to run on (default: shared prefetch pool)
+        """
+        self.solve_seconds: Optional[float] = None
+        self.wait_seconds: Optional[float] = None
+        self._future: Future = (executor or get_prefetch_executor()).submit(self._solve, solve, args)
+
+    def _solve(self, solve: Callable[..., Optional[str]], args: tuple) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            return solve(*args)
+        finally:
+            self.solve_seconds = time.perf_counter() - started
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = PREFETCH_TIMEOUT) -> Optional[str]:
+        """The answer, waiting only for what is left of the solve; None if it failed or timed out"""
+        waiting = time.perf_counter()
+        try:
+            return self._future.result(timeout=timeout)
+        except FutureTimeout:
+            logger.warning(f"Background CAPTCHA solve still running after {timeout}s")
+            return None
+        except Exception as e:
+            logger.warning(f"Background CAPTCHA solve failed: {e}")
+            return None
+        finally:
+            self.wait_seconds = time.perf_counter() - waiting
+
+    @property
+    def saved_seconds(self) -> float:
+        """Solve time taken off the critical path (the part that overlapped the form fill)"""
+        if self.solve_seconds is None or self.wait_seconds is None:
+            return 0.0
+        return max(0.0, self.solve_seconds - self.wait_seconds)
@@ -0,0 +1,98 @@
+import io
+import os
+import logging
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from .image_loader import load_grayscale
+
+logger = logging.getLogger(__name__)
+
+# Write the raw CAPTCHA and every variant to disk (for inspecting OCR failures)
+CAPTCHA_DEBUG = os.getenv('CAPTCHA_DEBUG', 'false').lower() == 'true'
+
+VARIANT_NAMES = ('threshold', 'adaptive', 'otsu', 'morph', 'enhanced')
+
+
+def load_captcha(source: Any) -> np.ndarray:
+    """
+    Decode a CAPTCHA to an 8-bit grayscale array
+
+    Args:
+        source: Encoded image bytes, file path, PIL image or numpy array (gray or BGR)
+    """
+    if isinstance(source, np.ndarray):
+        return source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+    if isinstance(source, Image.Image):
+        return np.asarray(source.convert('L'))
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            source = f.read()
+    image, _ = load_grayscale(bytes(source), max_side=None)
+    return np.asarray(image)
+
+
+def captcha_variants(source: Any, names: Optional[Sequence[str]] = None) -> List[Tuple[str, np.ndarray]]:
+    """
+    All preprocessing variants of a CAPTCHA from a single decode, in memory
+
+    Args:
+        source: Anything load_captcha() accepts
+        names: Variants to produce, in this order (default: VARIANT_NAMES)
+
+    Returns:
+        [(name, uint8 array)], ready to hand to pytesseract or EasyOCR
+    """
+    gray = load_captcha(source)
+    names = names or VARIANT_NAMES
+    variants = []
+    threshold = None
+    for name in names:
+        if name in ('threshold', 'morph') and threshold is None:
+            _, threshold = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+        if name == 'threshold':
+            variant = threshold
+        elif name == 'adaptive':
+            variant = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+        elif name == 'otsu':
+            _, variant = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        elif name == 'morph':
+            kernel = np.ones((2, 2), np.uint8)
+            variant = cv2.morphologyEx(threshold, cv2.MORPH_CLOSE, kernel)
+            variant = cv2.morphologyEx(variant, cv2.MORPH_OPEN, kernel)
+        elif name == 'enhanced':
+            # Contrast then sharpness x2; PIL's enhancers work on the buffer without copies through disk
+            enhanced = ImageEnhance.Contrast(Image.fromarray(gray)).enhance(2.0)
+            variant = np.asarray(ImageEnhance.Sharpness(enhanced).enhance(2.0))
+        else:
+            raise ValueError(f"Unknown CAPTCHA variant {name!r}")
+        variants.append((name, variant))
+    return variants
+
+
+def save_captcha_debug(directory: str, content: bytes, variants: Sequence[Tuple[str, np.ndarray]] = (),
+                       prefix: str = 'captcha') -> str:
+    """
+    Write the raw CAPTCHA and its variants for inspection
+
+    Returns:
+        Path of the raw image
+    """
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}")
+    with open(f"{base}.png", 'wb') as f:
+        f.write(content)
+    for name, variant in variants:
+        cv2.imwrite(f"{base}_{name}.png", variant)
+    return f"{base}.png"
+
+
+def to_pil(content: bytes) -> Image.Image:
+    """Raw CAPTCHA bytes as a PIL image (fallback when preprocessing fails)"""
+    image = Image.open(io.BytesIO(content))
+    image.load()
+    return image
@@ -0,0 +1,282 @@
+import os
+import csv
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .captcha_cnn import CAPTCHA_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Accepted answers are copied into the labelled dataset (CAPTCHA_DATA_DIR/labels.csv)
+LABEL_ACCEPTED = os.getenv('CAPTCHA_LABEL_ACCEPTED', 'true').lower() == 'true'
+
+# Page text that means the site rejected the CAPTCHA, and text that only appears once a search ran
+CAPTCHA_REJECTED_MARKERS = ('invalid captcha', 'captcha error', 'wrong captcha', 'incorrect captcha',
+                            'captcha is incorrect', 'captcha does not match')
+SEARCH_DONE_MARKERS = ('no data available in table', 'no records found')
+
+# (engine, variant, config) -> smoothed success rate
+Combo = Tuple[str, str, str]
+
+
+def captcha_outcome(page_source: str) -> Optional[bool]:
+    """
+    CAPTCHA verdict from the page after submitting
+
+    Returns:
+        False if the site rejected the CAPTCHA, True if the search ran (with or
+        without results), None if the page says neither
+    """
+    page = (page_source or '').lower()
+    if any(marker in page for marker in CAPTCHA_REJECTED_MARKERS):
+        return False
+    if any(marker in page for marker in SEARCH_DONE_MARKERS) or ('showing' in page and 'entries' in page):
+        return True
+    return None
+
+
+def _image_extension(content: bytes) -> str:
+    if content.startswith(b'\x89PNG'):
+        return '.png'
+    if content.startswith(b'\xff\xd8'):
+        return '.jpg'
+    if content[:4] == b'GIF8':
+        return '.gif'
+    if content.startswith(b'BM'):
+        return '.bmp'
+    return '.png'
+
+
+class CaptchaStats:
+    def __init__(self, db_path: Optional[str] = None, data_dir: str = CAPTCHA_DATA_DIR,
+                 label_accepted: bool = LABEL_ACCEPTED, refresh_seconds: float = 60.0, pending_images: int = 256):
+        """
+        Every CAPTCHA attempt with the candidates behind it and whether the site
+        accepted the answer. The running success rate per engine, preprocessing
+        variant and tesseract config decides what the solvers try first, and
+        accepted answers grow the labelled dataset the CNN model is trained on.
+
+        Args:
+            db_path: SQLite file (CAPTCHA_STATS_DB, "" = statistics for this process only)
+            data_dir: Labelled dataset that accepted CAPTCHAs are added to
+            label_accepted: Add accepted CAPTCHAs to the dataset
+            refresh_seconds: Re-read statistics written by other processes this often
+            pending_images: CAPTCHA images kept in memory while their outcome is unknown
+        """
+        if db_path is None:
+            db_path = os.getenv('CAPTCHA_STATS_DB', os.path.join('data', 'captcha_stats.sqlite'))
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.label_accepted = label_accepted
+        self.refresh_seconds = refresh_seconds
+        self.pending_images = pending_images
+        self._lock = threading.Lock()
+        self._pending: 'OrderedDict[int, Tuple[bytes, str]]' = OrderedDict()
+        self._scores: Dict[Combo, float] = {}
+        self._scores_at = 0.0
+        self.stats = {"attempts": 0, "accepted": 0, "rejected": 0, "labelled": 0}
+
+        if not db_path:
+            db_path = ':memory:'
+        try:
+            directory = os.path.dirname(db_path) if db_path != ':memory:' else ''
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            if db_path != ':memory:':
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS attempts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, image_hash TEXT NOT NULL, "
+                "source TEXT, engine TEXT, answer TEXT NOT NULL, confidence REAL, latency_ms REAL, "
+                "outcome INTEGER, decided REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS attempts_hash ON attempts(image_hash)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS candidates ("
+                "attempt_id INTEGER NOT NULL, engine TEXT NOT NULL, variant TEXT NOT NULL, config TEXT NOT NULL, "
+                "text TEXT NOT NULL, confidence REAL, latency_ms REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS candidates_attempt ON candidates(attempt_id)")
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"CAPTCHA statistics database unavailable ({e}), not recording outcomes")
+            self._db = None
+
+    @staticmethod
+    def hash_bytes(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    # ----- logging -----
+
+    def log_attempt(self, content: bytes, candidates: Sequence[Dict[str, Any]], answer: str,
+                    engine: Optional[str] = None, confidence: Optional[float] = None,
+                    latency: Optional[float] = None, source: Optional[str] = None) -> Optional[int]:
+        """
+        Record a CAPTCHA answer about to be submitted
+
+        Args:
+            content: Raw CAPTCHA image bytes
+            candidates: Every OCR candidate considered ({"text", "confidence", "engine", "variant", "config"})
+            answer: The text that will be submitted
+            engine: What produced the answer ("ensemble", "cnn", an OCR engine, ...)
+            confidence: Confidence of the answer
+            latency: Seconds spent solving
+            source: Script or worker submitting it
+
+        Returns:
+            Attempt id for record_outcome(), or None if nothing could be recorded
+        """
+        if not content or not answer:
+            return None
+        image_hash = self.hash_bytes(content)
+        latency_ms = round(latency * 1000, 1) if latency is not None else None
+        rows = [(c.get("engine") or "unknown", c.get("variant") or "", c.get("config") or "",
+                 str(c.get("text", "")), c.get("confidence"), c.get("latency_ms"))
+                for c in candidates if c.get("text")]
+        with self._lock:
+            attempt_id = None
+            if self._db is not None:
+                try:
+                    cursor = self._db.execute(
+                        "INSERT INTO attempts (created, image_hash, source, engine, answer, confidence, latency_ms) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (time.time(), image_hash, source, engine, answer, confidence, latency_ms)
+                    )
+                    attempt_id = cursor.lastrowid
+                    self._db.executemany(
+                        "INSERT INTO candidates (attempt_id, engine, variant, config, text, confidence, latency_ms) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(attempt_id, *row) for row in rows]
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"CAPTCHA statistics write failed: {e}")
+                    attempt_id = None
+            if attempt_id is None:
+                return None
+            self.stats["attempts"] += 1
+            self._pending[attempt_id] = (content, answer)
+            while len(self._pending) > self.pending_images:
+                self._pending.popitem(last=False)
+            return attempt_id
+
+    def record_outcome(self, attempt_id: Optional[int], accepted: Optional[bool]) -> Optional[str]:
+        """
+        Record whether the site accepted an attempt's answer (None = unknown, ignored)
+
+        Returns:
+            Path the CAPTCHA was added to the labelled dataset under, if it was
+        """
+        if attempt_id is None or accepted is None:
+            return None
+        with self._lock:
+            pending = self._pending.pop(attempt_id, None)
+            if self._db is not None:
+                try:
+                    self._db.execute("UPDATE attempts SET outcome = ?, decided = ? WHERE id = ?",
+                                     (int(accepted), time.time(), attempt_id))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"CAPTCHA statistics write failed: {e}")
+            self.stats["accepted" if accepted else "rejected"] += 1
+            # Force a re-rank on the next ordering call
+            self._scores_at = 0.0
+        if accepted and pending and self.label_accepted:
+            return self.add_labelled(*pending)
+        return None
+
+    def add_labelled(self, content: bytes, text: str) -> Optional[str]:
+        """Add a CAPTCHA with a known answer to the training data (labels.csv), once per image"""
+        if not text.isalnum():
+            # Stray spaces or punctuation would end up in the model's alphabet
+            logger.debug(f"Not labelling CAPTCHA with non-alphanumeric answer {text!r}")
+            return None
+        relative = os.path.join('accepted', self.hash_bytes(content)[:20] + _image_extension(content))
+        path = os.path.join(self.data_dir, relative)
+        if os.path.exists(path):
+            return None
+        labels_path = os.path.join(self.data_dir, 'labels.csv')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(content)
+            new_file = not os.path.exists(labels_path)
+            with open(labels_path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(['file', 'label'])
+                writer.writerow([relative.replace(os.sep, '/'), text])
+        except OSError as e:
+            logger.warning(f"Could not add CAPTCHA to the labelled dataset: {e}")
+            return None
+        with self._lock:
+            self.stats["labelled"] += 1
+        return path
+
+    # ----- ranking -----
+
+    def scores(self) -> Dict[Combo, float]:
+        """
+        Success rate per (engine, variant, config), Laplace-smoothed so untried
+        combinations start at 0.5. A candidate counts as right when its text was
+        accepted, and as wrong when it matched an answer the site rejected.
+        """
+        with self._lock:
+            if self._db is None or time.time() - self._scores_at < self.refresh_seconds:
+                return self._scores
+            try:
+                rows = self._db.execute(
+                    "SELECT c.engine, c.variant, c.config, "
+                    "SUM(a.outcome = 1 AND c.text = a.answer), "
+                    "SUM(a.outcome = 1 OR c.text = a.answer) "
+                    "FROM candidates c JOIN attempts a ON a.id = c.attempt_id "
+                    "WHERE a.outcome IS NOT NULL GROUP BY c.engine, c.variant, c.config"
+                ).fetchall()
+                self._scores = {(engine, variant, config): (right + 1.0) / (judged + 2.0)
+                                for engine, variant, config, right, judged in rows}
+            except sqlite3.Error as e:
+                logger.warning(f"CAPTCHA statistics read failed: {e}")
+            self._scores_at = time.time()
+            return self._scores
+
+    def engine_scores(self) -> Dict[str, float]:
+        """Best combination score per engine"""
+        best: Dict[str, float] = {}
+        for (engine, _, _), score in self.scores().items():
+            best[engine] = max(score, best.get(engine, 0.0))
+        return best
+
+    def order_engines(self, engines: Sequence[str]) -> List[str]:
+        """Engines by historical success, best first (untried engines keep their place among 0.5s)"""
+        scores = self.engine_scores()
+        return sorted(engines, key=lambda engine: -scores.get(engine, 0.5))
+
+    def tesseract_scores(self) -> Dict[Tuple[str, str], float]:
+        """(variant, config) -> score, for ordering tesseract_jobs()"""
+        return {(variant, config): score for (engine, variant, config), score in self.scores().items()
+                if engine == "tesseract"}
+
+    def summary(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Best-scoring combinations, for reports"""
+        ranked = sorted(self.scores().items(), key=lambda item: -item[1])[:limit]
+        return [{"engine": engine, "variant": variant, "config": config, "score": round(score, 3)}
+                for (engine, variant, config), score in ranked]
+
+
+_default_stats: Optional[CaptchaStats] = None
+_default_lock = threading.Lock()
+
+
+def get_captcha_stats() -> CaptchaStats:
+    """Per-process CAPTCHA statistics; processes share them through the SQLite file"""
+    global _default_stats
+    with _default_lock:
+        if _default_stats is None:
+            _default_stats = CaptchaStats()
+        return _default_stats
@@ -0,0 +1,173 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import DEFAULT_POOLSIZE
+
+from .identity import Identity
+from .rate_governor import RateGovernor, get_rate_governor
+
+logger = logging.getLogger(__name__)
+
+IGR_BASE_URL = "https://pay2igr.igrmaharashtra.gov.in/"
+
+
+class _Lease:
+    def __init__(self, key: str, session: requests.Session):
+        self.key = key
+        self.session = session
+        self.warmed_at = 0.0
+        self.lock = threading.Lock()
+        self.warm_count = 0
+
+
+class ConnectionWarmer:
+    def __init__(self, target_url: str = IGR_BASE_URL, idle_connections: int = 2,
+                 refresh_interval: float = 45, check_interval: float = 5, max_workers: int = 4,
+                 timeout: float = 15, rate_governor: Optional[RateGovernor] = None):
+        """
+        Keeps already-established (DNS + proxy CONNECT + TLS) connections to the
+        target host ready in the connection pool of each leased session.
+
+        Connections are opened by sending cheap HEAD requests through the
+        session itself, so requests/urllib3 set up the proxy tunnel exactly as
+        for real requests and discard connections that failed.
+
+        Args:
+            target_url: Origin to pre-connect to
+            idle_connections: Connections to keep open per session (at most the pool size)
+            refresh_interval: Re-send the HEAD requests this often (stay below the server idle timeout)
+            check_interval: How often the background thread checks the leases
+            max_workers: Leases warmed in parallel
+            timeout: Timeout of one warm-up request
+            rate_governor: Host rate limits warm-ups take tokens from (skipped when none are free)
+        """
+        self.target_url = target_url
+        self.idle_connections = max(1, min(idle_connections, DEFAULT_POOLSIZE))
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.rate_governor = rate_governor or get_rate_governor()
+        self._leases: Dict[str, _Lease] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conn-warmer")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def lease(self, identity_or_session, key: Optional[str] = None, block: bool = False) -> requests.Session:
+        """
+        Register a session (or Identity) for warming and start connecting
+
+        Args:
+            identity_or_session: Identity or requests.Session whose pool should be warmed
+            key: Lease key; defaults to the identity's proxy session ID
+            block: Wait until the first warm-up finished
+        """
+        if isinstance(identity_or_session, Identity):
+            session = identity_or_session.requests_session()
+            key = key or identity_or_session.session_id or str(id(session))
+        else:
+            session = identity_or_session
+            key = key or str(id(session))
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease.session is not session:
+                lease = _Lease(key, session)
+                self._leases[key] = lease
+        self.start()
+
+        future = self._executor.submit(self.warm, key)
+        if block:
+            future.result()
+        return session
+
+    def release(self, key: str):
+        """Stop maintaining connections for a session"""
+        with self._lock:
+            self._leases.pop(key, None)
+
+    def _head(self, lease: _Lease) -> bool:
+        """One HEAD request; the connection goes back to the pool only if it succeeded"""
+        if not self.rate_governor.try_acquire(self.target_url):
+            return False
+        start = time.time()
+        try:
+            response = lease.session.head(self.target_url, timeout=self.timeout, allow_redirects=False)
+            response.close()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Connection warm-up failed for {lease.key}: {e}")
+            return False
+        logger.debug(f"Warmed connection for {lease.key} in {time.time() - start:.2f}s")
+        return True
+
+    def warm(self, key: str) -> int:
+        """
+        Open or refresh the idle connections of one lease. The HEAD requests run
+        concurrently so each one holds its own connection. Returns requests that succeeded.
+        """
+        lease = self._leases.get(key)
+        if lease is None:
+            return 0
+        with lease.lock:
+            if key not in self._leases:
+                return 0
+            lease.warmed_at = time.time()
+            threads = []
+            results = [False] * self.idle_connections
+
+            def head(i: int):
+                results[i] = self._head(lease)
+
+            for i in range(1, self.idle_connections):
+                thread = threading.Thread(target=head, args=(i,), name=f"conn-warmer-{key}-{i}", daemon=True)
+                thread.start()
+                threads.append(thread)
+            head(0)
+            for thread in threads:
+                thread.join()
+            opened = sum(results)
+            lease.warm_count += opened
+        return opened
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            now = time.time()
+            with self._lock:
+                keys = [key for key, lease in self._leases.items()
+                        if now - lease.warmed_at >= self.refresh_interval]
+            for key in keys:
+                self._executor.submit(self.warm, key)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="conn-warmer-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.check_interval + 1)
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {key: lease.warm_count for key, lease in self._leases.items()}
+
+
+_default_warmer: Optional[ConnectionWarmer] = None
+_default_lock = threading.Lock()
+
+
+def get_connection_warmer() -> ConnectionWarmer:
+    """Process-wide warmer for the IGR host"""
+    global _default_warmer
+    with _default_lock:
+        if _default_warmer is None:
+            _default_warmer = ConnectionWarmer()
+        return _default_warmer
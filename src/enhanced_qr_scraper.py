@@ -1,13 +1,12 @@
 import requests
 from bs4 import BeautifulSoup
-from PIL import Image
-from pyzbar.pyzbar import decode
-import io
 import logging
-import time
 from typing import List, Dict, Optional
 from urllib.parse import urljoin, urlparse
 from .proxy_manager import ProxyManager
+from .bandwidth_tracker import BandwidthTracker, get_bandwidth_tracker
+from .rate_governor import RateGovernor, get_rate_governor
+from .qr_pipeline import QRPipeline
 import urllib3
 
 # Disable SSL warnings
@@ -16,9 +15,15 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
 class EnhancedQRScraper:
-    def __init__(self, proxy_manager: Optional[ProxyManager] = None):
+    def __init__(self, proxy_manager: Optional[ProxyManager] = None,
+                 bandwidth_tracker: Optional[BandwidthTracker] = None,
+                 rate_governor: Optional[RateGovernor] = None):
         self.proxy_manager = proxy_manager or ProxyManager()
+        self.bandwidth_tracker = bandwidth_tracker or get_bandwidth_tracker()
+        self.rate_governor = rate_governor or get_rate_governor()
         self.session = requests.Session()
+        # Concurrent downloads feeding a process pool of decoders
+        self.qr_pipeline = QRPipeline(self.fetch_image)
         
         # Headers to mimic a real browser
         self.headers = {
@@ -74,34 +79,30 @@ class EnhancedQRScraper:
                 return False
         return True
     
+    def fetch_image(self, image_url: str, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Download an image (runs on the pipeline's fetch threads)"""
+        # Get proxy configuration if available
+        proxies = self.proxy_manager.get_proxy()
+        self.bandwidth_tracker.enforce(stage='qr_image')
+        self.rate_governor.acquire(image_url, image=True)
+        
+        # Download the image with session for cookie persistence
+        response = self.session.get(
+            image_url, 
+            proxies=proxies,
+            headers={**self.headers, **(extra_headers or {})},
+            verify=False,
+            timeout=30,
+            stream=True,  # the pipeline may stop after the image header
+            hooks=self.bandwidth_tracker.hooks('qr_image')
+        )
+        response.raise_for_status()
+        return response
+    
     def extract_qr_from_image_url(self, image_url: str) -> List[str]:
         """Extract QR code data from an image URL"""
         try:
-            # Get proxy configuration if available
-            proxies = self.proxy_manager.get_proxy()
-            
-            # Download the image with session for cookie persistence
-            response = self.session.get(
-                image_url, 
-                proxies=proxies,
-                headers=self.headers,
-                verify=False,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            # Open the image using PIL
-            image = Image.open(io.BytesIO(response.content))
-            
-            # Convert to RGB if necessary for better QR detection
-            if image.mode not in ['RGB', 'L']:
-                image = image.convert('RGB')
-            
-            # Decode QR codes
-            decoded_objects = decode(image)
-            
-            # Extract and return QR code data
-            qr_data = [obj.data.decode('utf-8') for obj in decoded_objects]
+            qr_data = self.qr_pipeline.decode_url(image_url)
             
             if qr_data:
                 logger.info(f"Found {len(qr_data)} QR codes in image: {image_url}")
@@ -124,12 +125,14 @@ class EnhancedQRScraper:
             print(f"🌐 Fetching webpage: {url}")
             
             # Fetch the webpage with session for cookie persistence
+            self.rate_governor.acquire(url)
             response = self.session.get(
                 url, 
                 proxies=proxies,
                 headers=self.headers,
                 verify=False,
-                timeout=30
+                timeout=30,
+                hooks=self.bandwidth_tracker.hooks('page')
             )
             response.raise_for_status()
             
@@ -143,29 +146,11 @@ class EnhancedQRScraper:
                 return []
             
             # Find all image tags
-            images = soup.find_all('img')
-            print(f"🔍 Found {len(images)} images on the page")
-            
-            results = []
-            for i, img in enumerate(images, 1):
-                img_url = img.get('src', '')
-                
-                if img_url:
-                    # Use urljoin to properly handle relative URLs
-                    full_img_url = urljoin(url, img_url)
-                    
-                    print(f"📷 Checking image {i}/{len(images)}: {full_img_url}")
-                    
-                    qr_data = self.extract_qr_from_image_url(full_img_url)
-                    if qr_data:
-                        results.append({
-                            'image_url': full_img_url,
-                            'qr_contents': qr_data
-                        })
-                        print(f"✅ Found QR code in image {i}!")
-                    
-                    # Small delay to be respectful to the server
-                    time.sleep(0.5)
+            print(f"🔍 Found {len(soup.find_all('img'))} images on the page")
+            
+            # Fetch and decode plausible images concurrently; results keep page order
+            results = self.qr_pipeline.run_page(soup, url)
+            self.print_pipeline_stats()
             
             logger.info(f"Found QR codes in {len(results)} images on {url}")
             return results
@@ -174,6 +159,27 @@ class EnhancedQRScraper:
             logger.error(f"Error scraping QR codes from {url}: {str(e)}")
             return []
     
+    def print_pipeline_stats(self):
+        """Print per-stage throughput of the last pipeline run"""
+        stats = self.qr_pipeline.last_stats
+        if not stats:
+            return
+        fetch, decode = stats['fetch'], stats['decode']
+        print(f"📊 {stats['images']} images in {stats['wall_seconds']}s, {stats['with_qr']} with QR codes")
+        print(f"   📥 Fetch: {fetch['count'] - fetch['failed']}/{fetch['count']} ok, "
+              f"{fetch['bytes'] / 1024:.1f} KB, {fetch['images_per_second']} img/s")
+        print(f"   🔎 Decode: {decode['count']} images, {decode['busy_seconds']}s CPU, "
+              f"{decode['images_per_second']} img/s")
+        skipped = stats['prefilter']
+        print(f"   ⏭️  Skipped: {skipped['tag']} by tag, {skipped['dimensions']} by size, "
+              f"{skipped['finder']} without finder patterns")
+        decoders = stats['decoders']['stages']
+        print("   🧩 Decoder hit rates: " + ", ".join(
+            f"{name} {stage['hit_rate']} ({stage['avg_ms']} ms)" for name, stage in decoders.items() if stage['attempts']))
+        cache = stats['cache']
+        print(f"   🗃️  Cache: {cache['hits']}/{cache['lookups']} hits ({cache['revalidated']} revalidated by ETag), "
+              f"overall hit rate {self.qr_pipeline.cache.get_stats()['hit_rate']}")
+    
     def scrape_with_session_management(self, base_url: str, navigation_steps: List[Dict] = None) -> List[Dict[str, str]]:
         """
         Advanced scraping with session management for multi-step navigation
@@ -181,36 +187,58 @@ class EnhancedQRScraper:
         """
         try:
             if navigation_steps:
-                print("🚀 Starting multi-step navigation...")
-                
-                for i, step in enumerate(navigation_steps, 1):
-                    print(f"Step {i}: {step.get('description', 'Navigating...')}")
-                    
-                    if step.get('method', 'GET').upper() == 'POST':
-                        response = self.session.post(
-                            step['url'],
-                            data=step.get('data', {}),
-                            headers=self.headers,
-                            verify=False,
-                            timeout=30
-                        )
-                    else:
-                        response = self.session.get(
-                            step['url'],
-                            headers=self.headers,
-                            verify=False,
-                            timeout=30
-                        )
-                    
-                    response.raise_for_status()
-                    print(f"✅ Step {i} completed (Status: {response.status_code})")
-                    
-                    # Small delay between steps
-                    time.sleep(1)
+                self.run_navigation_steps(navigation_steps)
             
             # Final scraping step
             return self.scrape_qr_codes_from_webpage(base_url, handle_captcha=True)
             
         except Exception as e:
             logger.error(f"Error in session management scraping: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
+    
+    def run_navigation_steps(self, navigation_steps: List[Dict]):
+        """
+        Replay navigation steps on the session so later requests carry its cookies
+        navigation_steps: List of dicts with 'url', 'method', 'data', etc.
+        """
+        print("🚀 Starting multi-step navigation...")
+        
+        for i, step in enumerate(navigation_steps, 1):
+            print(f"Step {i}: {step.get('description', 'Navigating...')}")
+            self.rate_governor.acquire(step['url'])
+            
+            if step.get('method', 'GET').upper() == 'POST':
+                response = self.session.post(
+                    step['url'],
+                    data=step.get('data', {}),
+                    headers=self.headers,
+                    verify=False,
+                    timeout=30,
+                    hooks=self.bandwidth_tracker.hooks('navigation')
+                )
+            else:
+                response = self.session.get(
+                    step['url'],
+                    headers=self.headers,
+                    verify=False,
+                    timeout=30,
+                    hooks=self.bandwidth_tracker.hooks('navigation')
+                )
+            
+            response.raise_for_status()
+            print(f"✅ Step {i} completed (Status: {response.status_code})")
+    
+    def crawl_site(self, start_urls: List[str], navigation_steps: List[Dict] = None, **crawler_options) -> Dict:
+        """
+        Crawl many pages for QR codes instead of a single one. Navigation steps
+        run first so the crawl starts with the session they establish.
+        crawler_options: passed to QRCrawler (max_depth, max_pages, allowed_domains, ...)
+        
+        Returns:
+            Crawl statistics; per-page results are in the NDJSON file at stats['output']
+        """
+        from .qr_crawler import QRCrawler
+        
+        if navigation_steps:
+            self.run_navigation_steps(navigation_steps)
+        return QRCrawler(self, **crawler_options).run(start_urls) 
\ No newline at end of file
@@ -0,0 +1,223 @@
+import ssl
+import logging
+import random
+import string
+from typing import Dict, Optional
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar, create_cookie
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+DEFAULT_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+
+def create_igr_ssl_context() -> ssl.SSLContext:
+    """TLS context accepted by the IGR servers (lowered seclevel, no verification)"""
+    ctx = ssl.create_default_context()
+    ctx.set_ciphers('DEFAULT@SECLEVEL=1')
+    ctx.minimum_version = ssl.TLSVersion.TLSv1_2
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    return ctx
+
+
+def httpx_proxy_kwargs(proxy_url: Optional[str]) -> Dict[str, str]:
+    """Proxy argument for httpx clients (``proxies=`` was removed in httpx 0.28)"""
+    if not proxy_url:
+        return {}
+    import httpx
+
+    version = tuple(int(part) for part in httpx.__version__.split('.')[:2] if part.isdigit())
+    return {'proxy': proxy_url} if version >= (0, 26) else {'proxies': proxy_url}
+
+
+class IdentityTLSAdapter(HTTPAdapter):
+    """HTTPAdapter that applies one SSL context to direct and proxied connections"""
+
+    def __init__(self, ssl_context: Optional[ssl.SSLContext] = None, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if self.ssl_context is not None:
+            proxy_kwargs['ssl_context'] = self.ssl_context
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+
+class Identity:
+    def __init__(self, proxy_manager=None, session_id: Optional[str] = None,
+                 user_agent: str = DEFAULT_USER_AGENT, headers: Optional[Dict[str, str]] = None,
+                 verify: bool = False, ssl_context: Optional[ssl.SSLContext] = None):
+        """
+        One client identity: cookie jar, proxy session, User-Agent/headers and TLS settings.
+
+        Every request of a workflow (page load, CAPTCHA download, form submit,
+        image fetch) must use the same identity, otherwise the site sees the
+        CAPTCHA fetched by one IP/cookie set and submitted by another.
+
+        Args:
+            proxy_manager: EnhancedProxyManager (sticky sessions) or ProxyManager, or None for direct
+            session_id: Sticky proxy session ID; generated if the manager supports sessions
+            user_agent: User-Agent used by HTTP clients and browsers alike
+            headers: Extra default headers
+            verify: TLS certificate verification for HTTP clients
+            ssl_context: Optional custom SSL context (e.g. create_igr_ssl_context())
+        """
+        self.proxy_manager = proxy_manager
+        if session_id is None and proxy_manager is not None and hasattr(proxy_manager, 'generate_session_id'):
+            session_id = proxy_manager.generate_session_id()
+        self.session_id = session_id
+        self.user_agent = user_agent
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self.headers['User-Agent'] = user_agent
+        self.verify = verify
+        self.ssl_context = ssl_context
+        self.cookies = RequestsCookieJar()
+        self._session: Optional[requests.Session] = None
+
+    @staticmethod
+    def _new_session_id() -> str:
+        random_id = ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
+        return f"{random_id}-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+
+    def proxies(self) -> Optional[Dict[str, str]]:
+        """Proxy dict for requests, pinned to this identity's session"""
+        if self.proxy_manager is None:
+            return None
+        if self.session_id and hasattr(self.proxy_manager, 'get_sticky_proxy'):
+            return self.proxy_manager.get_sticky_proxy(self.session_id)
+        return self.proxy_manager.get_proxy()
+
+    def proxy_url(self) -> Optional[str]:
+        proxies = self.proxies()
+        return proxies.get('https') if proxies else None
+
+    def rotate(self) -> "Identity":
+        """Switch to a fresh proxy session; cookies from the old IP are dropped with it"""
+        if self.proxy_manager is not None and hasattr(self.proxy_manager, 'generate_session_id'):
+            self.session_id = self.proxy_manager.generate_session_id()
+        else:
+            self.session_id = self._new_session_id()
+        self.cookies.clear()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        logger.info(f"Identity rotated to session {self.session_id}")
+        return self
+
+    # ----- HTTP clients -----
+
+    def requests_session(self) -> requests.Session:
+        """requests.Session sharing this identity's cookie jar, headers, proxy and TLS settings"""
+        if self._session is None:
+            session = requests.Session()
+            session.cookies = self.cookies
+            session.headers.update(self.headers)
+            session.verify = self.verify
+            proxies = self.proxies()
+            if proxies:
+                session.proxies.update(proxies)
+            if self.ssl_context is not None:
+                adapter = IdentityTLSAdapter(ssl_context=self.ssl_context)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def request_kwargs(self) -> Dict:
+        """Keyword arguments for one-off requests.get/post calls"""
+        return {
+            'headers': dict(self.headers),
+            'cookies': self.cookies,
+            'proxies': self.proxies(),
+            'verify': self.verify,
+        }
+
+    def httpx_client(self, asynchronous: bool = False, **kwargs):
+        """httpx Client/AsyncClient bound to this identity (cookies are copied in)"""
+        import httpx
+
+        verify = self.ssl_context if self.ssl_context is not None else self.verify
+        client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+        proxy_url = self.proxy_url()
+        client_kwargs = dict(headers=self.headers, cookies=httpx.Cookies(self.cookies),
+                             verify=verify, follow_redirects=True)
+        client_kwargs.update(httpx_proxy_kwargs(proxy_url))
+        client_kwargs.update(kwargs)
+        return client_cls(**client_kwargs)
+
+    def update_from_httpx(self, client):
+        """Copy cookies set during an httpx session back into the shared jar"""
+        for cookie in client.cookies.jar:
+            self.cookies.set_cookie(cookie)
+
+    # ----- browsers -----
+
+    def configure_firefox(self, options, relay=None):
+        """Apply User-Agent and the proxy session (via the local relay) to Firefox options"""
+        options.set_preference("general.useragent.override", self.user_agent)
+        if self.proxy_manager is not None and getattr(self.proxy_manager, 'proxy_configured', False):
+            from .local_proxy import UpstreamProxy, configure_firefox_proxy, get_local_proxy_relay
+            relay = relay or get_local_proxy_relay()
+            port = relay.add_upstream(UpstreamProxy.from_proxy_manager(self.proxy_manager, self.session_id))
+            configure_firefox_proxy(options, port)
+            return port
+        return None
+
+    def load_cookies_from_driver(self, driver):
+        """Copy browser cookies into the shared jar (after the browser loaded the page)"""
+        for cookie in driver.get_cookies():
+            self.cookies.set_cookie(create_cookie(
+                name=cookie['name'],
+                value=cookie['value'],
+                domain=cookie.get('domain', ''),
+                path=cookie.get('path', '/'),
+                secure=cookie.get('secure', False),
+            ))
+        try:
+            user_agent = driver.execute_script("return navigator.userAgent")
+            if user_agent and user_agent != self.user_agent:
+                self.user_agent = user_agent
+                self.headers['User-Agent'] = user_agent
+                if self._session is not None:
+                    self._session.headers['User-Agent'] = user_agent
+        except Exception as e:
+            logger.debug(f"Could not read browser User-Agent: {e}")
+
+    def apply_cookies_to_driver(self, driver):
+        """Push the shared jar into the browser (driver must be on the cookie's domain)"""
+        for cookie in self.cookies:
+            try:
+                driver.add_cookie({
+                    'name': cookie.name,
+                    'value': cookie.value,
+                    'path': cookie.path or '/',
+                    'secure': bool(cookie.secure),
+                })
+            except Exception as e:
+                logger.debug(f"Could not set cookie {cookie.name} in browser: {e}")
+
+    def describe(self) -> Dict[str, str]:
+        return {
+            "session_id": self.session_id or "direct",
+            "user_agent": self.user_agent,
+            "cookies": str(len(self.cookies)),
+            "verify": str(self.verify),
+        }
@@ -1,14 +1,17 @@
 import requests
 from bs4 import BeautifulSoup
 from PIL import Image
-from pyzbar.pyzbar import decode
 import io
 import logging
-import time
 from typing import List, Dict, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 from .proxy_manager import ProxyManager
 from .enhanced_proxy_manager import EnhancedProxyManager
+from .bandwidth_tracker import BandwidthTracker, get_bandwidth_tracker
+from .rate_governor import RateGovernor, get_rate_governor
+from .qr_pipeline import QRPipeline, decode_document_bytes
+from .identity import Identity, create_igr_ssl_context
+from .connection_warmer import get_connection_warmer
 import urllib3
 import base64
 
@@ -18,25 +21,32 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
 class IGRSpecializedScraper:
-    def __init__(self, proxy_manager: Optional[ProxyManager] = None, use_proxy: bool = True):
+    def __init__(self, proxy_manager: Optional[ProxyManager] = None, use_proxy: bool = True,
+                 bandwidth_tracker: Optional[BandwidthTracker] = None,
+                 identity: Optional[Identity] = None,
+                 rate_governor: Optional[RateGovernor] = None):
         # Use enhanced proxy manager for better IP rotation
         if use_proxy:
             self.proxy_manager = EnhancedProxyManager()
         else:
             self.proxy_manager = proxy_manager or ProxyManager()
         
-        self.session = requests.Session()
         self.use_proxy = use_proxy
-        self.sticky_session_id = None  # For maintaining same IP during form submission
+        self.bandwidth_tracker = bandwidth_tracker or get_bandwidth_tracker()
+        # Shared with every other scraper process hitting the same host
+        self.rate_governor = rate_governor or get_rate_governor()
         
-        # Headers to mimic a real browser
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-        }
+        # One identity (cookies + sticky proxy session + headers) for the whole
+        # workflow so the CAPTCHA, form submit and result images share an IP
+        self.identity = identity or Identity(self.proxy_manager if use_proxy else None,
+                                             ssl_context=create_igr_ssl_context())
+        self.session = self.identity.requests_session()
+        self.connection_warmer = get_connection_warmer()
+        self.headers = self.identity.headers
+        # Result images are fetched concurrently on the identity's session
+        # and decoded in a process pool; they are document pages, so known
+        # templates are decoded at their learned QR regions first
+        self.qr_pipeline = QRPipeline(self.fetch_image, decoder=decode_document_bytes)
         
         # IGR Website specific selectors based on user's screenshots
         self.igr_selectors = {
@@ -51,6 +61,21 @@ class IGRSpecializedScraper:
             'submit_button': 'input[type="submit"], button[type="submit"]'
         }
         
+    @property
+    def sticky_session_id(self) -> Optional[str]:
+        """Proxy session ID of the current identity"""
+        return self.identity.session_id
+
+    def new_identity(self) -> Identity:
+        """Start over on a fresh IP with an empty cookie jar"""
+        if self.identity.session_id:
+            self.connection_warmer.release(self.identity.session_id)
+        self.identity.rotate()
+        # Pre-connect (proxy CONNECT + TLS) in the background so the first
+        # request on the new session doesn't pay the handshake
+        self.session = self.connection_warmer.lease(self.identity)
+        return self.identity
+    
     def detect_igr_captcha(self, soup: BeautifulSoup) -> bool:
         """Detect if IGR CAPTCHA is present"""
         captcha_img = soup.select(self.igr_selectors['captcha_img'])
@@ -67,20 +92,19 @@ class IGRSpecializedScraper:
     def download_and_show_captcha(self, captcha_url: str) -> bool:
         """Download CAPTCHA image and save it for user to view"""
         try:
-            # Get proxy configuration (use sticky session for captcha)
-            proxy_config = None
-            if self.use_proxy and hasattr(self.proxy_manager, 'get_sticky_proxy'):
-                if not self.sticky_session_id:
-                    self.sticky_session_id = self.proxy_manager.generate_session_id()
-                proxy_config = self.proxy_manager.get_sticky_proxy(self.sticky_session_id)
+            # Same identity (IP + cookies) that loaded the form
+            proxy_config = self.identity.proxies()
+            if proxy_config:
                 print(f"🔄 Using proxy with session: {self.sticky_session_id}")
             
+            self.rate_governor.acquire(captcha_url)
             response = self.session.get(
                 captcha_url,
                 headers=self.headers,
                 proxies=proxy_config,
                 verify=False,
-                timeout=30
+                timeout=30,
+                hooks=self.bandwidth_tracker.hooks('captcha', session_id=self.sticky_session_id)
             )
             response.raise_for_status()
             
@@ -206,24 +230,21 @@ class IGRSpecializedScraper:
             print(f"\n🚀 Submitting form to: {base_url}")
             print("Form data:", {k: v for k, v in form_data.items() if 'captcha' not in k.lower()})
             
-            # Get proxy configuration (use sticky session for form submission)
-            proxy_config = None
-            if self.use_proxy and hasattr(self.proxy_manager, 'get_sticky_proxy'):
-                if self.sticky_session_id:
-                    proxy_config = self.proxy_manager.get_sticky_proxy(self.sticky_session_id)
-                    print(f"🔄 Continuing with same IP session: {self.sticky_session_id}")
-                else:
-                    proxy_config = self.proxy_manager.get_proxy(rotate_ip=True)
-                    print("🔄 Using new IP for form submission")
+            # Submit with the identity that fetched the CAPTCHA
+            proxy_config = self.identity.proxies()
+            if proxy_config:
+                print(f"🔄 Continuing with same IP session: {self.sticky_session_id}")
             
             # Submit form
+            self.rate_governor.acquire(base_url)
             response = self.session.post(
                 base_url,
                 data=form_data,
                 headers=self.headers,
                 proxies=proxy_config,
                 verify=False,
-                timeout=30
+                timeout=30,
+                hooks=self.bandwidth_tracker.hooks('search', session_id=self.sticky_session_id)
             )
             response.raise_for_status()
             
@@ -241,56 +262,46 @@ class IGRSpecializedScraper:
     
     def scrape_qr_codes_from_soup(self, soup: BeautifulSoup, base_url: str) -> List[Dict[str, str]]:
         """Scrape QR codes from BeautifulSoup object"""
-        images = soup.find_all('img')
-        print(f"🔍 Found {len(images)} images in response")
+        print(f"🔍 Found {len(soup.find_all('img'))} images in response")
         
-        results = []
-        for i, img in enumerate(images, 1):
-            img_url = img.get('src', '')
-            
-            if img_url:
-                full_img_url = urljoin(base_url, img_url)
-                print(f"📷 Checking image {i}/{len(images)}: {full_img_url}")
-                
-                qr_data = self.extract_qr_from_image_url(full_img_url)
-                if qr_data:
-                    results.append({
-                        'image_url': full_img_url,
-                        'qr_contents': qr_data
-                    })
-                    print(f"✅ Found QR code in image {i}!")
-                
-                time.sleep(0.5)  # Be respectful
+        results = self.qr_pipeline.run_page(soup, base_url)
+        stats = self.qr_pipeline.last_stats
+        skipped = stats['prefilter']
+        print(f"📊 {stats['images']} images in {stats['wall_seconds']}s, {stats['with_qr']} with QR codes "
+              f"(fetch {stats['fetch']['images_per_second']} img/s, "
+              f"decode {stats['decode']['images_per_second']} img/s, "
+              f"cache hit rate {stats['cache']['hit_rate']})")
+        print(f"   ⏭️  Skipped {skipped['tag'] + skipped['dimensions'] + skipped['finder']} images "
+              f"that can't hold a QR code")
+        roi = stats['roi']
+        print(f"   🎯 Template regions: {roi['hit']} hits, {roi['miss']} misses, {roi['learned']} learned")
         
         return results
     
+    def fetch_image(self, image_url: str, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Download a result image (runs on the pipeline's fetch threads)"""
+        # Result images belong to the session that ran the search, so keep
+        # the same IP instead of rotating per image
+        proxy_config = self.identity.proxies()
+        self.bandwidth_tracker.enforce(stage='qr_image')
+        self.rate_governor.acquire(image_url, image=True)
+        
+        response = self.session.get(
+            image_url,
+            headers={**self.headers, **(extra_headers or {})},
+            proxies=proxy_config,
+            verify=False,
+            timeout=30,
+            stream=True,  # the pipeline may stop after the image header
+            hooks=self.bandwidth_tracker.hooks('qr_image')
+        )
+        response.raise_for_status()
+        return response
+    
     def extract_qr_from_image_url(self, image_url: str) -> List[str]:
         """Extract QR code data from an image URL"""
         try:
-            # Get proxy configuration (can rotate IP for each image)
-            proxy_config = None
-            if self.use_proxy and hasattr(self.proxy_manager, 'get_proxy'):
-                proxy_config = self.proxy_manager.get_proxy(rotate_ip=True)
-                print(f"🔄 Downloading image with rotated IP")
-            
-            response = self.session.get(
-                image_url,
-                headers=self.headers,
-                proxies=proxy_config,
-                verify=False,
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            image = Image.open(io.BytesIO(response.content))
-            
-            if image.mode not in ['RGB', 'L']:
-                image = image.convert('RGB')
-            
-            decoded_objects = decode(image)
-            qr_data = [obj.data.decode('utf-8') for obj in decoded_objects]
-            
-            return qr_data
+            return self.qr_pipeline.decode_url(image_url)
             
         except Exception as e:
             logger.error(f"Error extracting QR code from {image_url}: {str(e)}")
@@ -314,18 +325,20 @@ class IGRSpecializedScraper:
             # Step 1: Load initial page
             print(f"\n🌐 Loading IGR website: {igr_url}")
             
-            # Get proxy configuration for initial request
-            proxy_config = None
-            if self.use_proxy and hasattr(self.proxy_manager, 'get_proxy'):
-                proxy_config = self.proxy_manager.get_proxy(rotate_ip=True)
-                print("🔄 Using proxy for initial page load")
+            # Fresh identity for each workflow; it is reused for every later step
+            self.new_identity()
+            proxy_config = self.identity.proxies()
+            if proxy_config:
+                print(f"🔄 Using proxy session {self.sticky_session_id} for this workflow")
             
+            self.rate_governor.acquire(igr_url)
             response = self.session.get(
                 igr_url,
                 headers=self.headers,
                 proxies=proxy_config,
                 verify=False,
-                timeout=30
+                timeout=30,
+                hooks=self.bandwidth_tracker.hooks('page')
             )
             response.raise_for_status()
             
@@ -0,0 +1,68 @@
+import io
+import os
+import logging
+import warnings
+from typing import Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Largest body the QR pipeline will download for one image
+MAX_IMAGE_BYTES = int(float(os.getenv('QR_MAX_IMAGE_MB', '15')) * 1024 * 1024)
+# Larger images are treated as decompression bombs and never decoded
+MAX_IMAGE_PIXELS = int(float(os.getenv('QR_MAX_MEGAPIXELS', '60')) * 1000 * 1000)
+# JPEGs are decoded at reduced resolution (DCT scaling) down to roughly this size
+DECODE_MAX_SIDE = int(os.getenv('QR_DECODE_MAX_SIDE', '2000'))
+
+
+class ImageTooLarge(Exception):
+    """Raised when an image exceeds the byte or pixel limits"""
+    pass
+
+
+def check_pixels(width: int, height: int, max_pixels: int = MAX_IMAGE_PIXELS):
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"{width}x{height} exceeds {max_pixels} pixels")
+
+
+def load_grayscale(content: bytes, max_side: Optional[int] = DECODE_MAX_SIDE,
+                   max_pixels: int = MAX_IMAGE_PIXELS) -> Tuple[Image.Image, bool]:
+    """
+    Decode image bytes straight to an 8-bit grayscale image with bounded memory
+
+    Args:
+        content: Encoded image
+        max_side: Let JPEG decode at 1/2, 1/4 or 1/8 scale while the longer side
+            stays at or above this (None = full resolution)
+        max_pixels: Reject images with more pixels before decoding them
+
+    Returns:
+        (image in mode "L", True if it was decoded at reduced resolution)
+    """
+    with warnings.catch_warnings():
+        # PIL only warns between MAX_IMAGE_PIXELS and twice that; make it fatal
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        image = Image.open(io.BytesIO(content))
+        check_pixels(*image.size, max_pixels=max_pixels)
+
+        reduced = False
+        if image.format == 'JPEG':
+            width, height = image.size
+            if max_side and max(width, height) > max_side:
+                scale = max_side / float(max(width, height))
+                image.draft('L', (int(width * scale), int(height * scale)))
+                reduced = image.size != (width, height)
+            else:
+                image.draft('L', image.size)
+
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # Transparent areas would turn black and swallow the quiet zone
+            rgba = image.convert('RGBA')
+            background = Image.new('RGBA', rgba.size, (255, 255, 255, 255))
+            image = Image.alpha_composite(background, rgba)
+        if image.mode != 'L':
+            image = image.convert('L')
+        else:
+            image.load()
+    return image, reduced
@@ -0,0 +1,250 @@
+import asyncio
+import base64
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Maximum size of a request/response head we are willing to buffer
+MAX_HEADER_BYTES = 64 * 1024
+RELAY_CHUNK_SIZE = 64 * 1024
+
+
+class UpstreamProxy:
+    def __init__(self, host: str, port: int, username: str = '', password: str = ''):
+        """
+        Authenticated upstream HTTP proxy (e.g. one ThorData sticky session)
+
+        Args:
+            host: Upstream proxy host
+            port: Upstream proxy port
+            username: Full proxy username, including any -sessid- suffix
+            password: Proxy password
+        """
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+
+    @classmethod
+    def from_proxy_manager(cls, proxy_manager, session_id: Optional[str] = None) -> "UpstreamProxy":
+        """Build an upstream from a ProxyManager/EnhancedProxyManager and optional sticky session"""
+        username = proxy_manager.proxy_username or ''
+        if session_id:
+            username = f"{username}-sessid-{session_id}"
+        return cls(proxy_manager.proxy_host, proxy_manager.proxy_port,
+                   username, proxy_manager.proxy_password or '')
+
+    def authorization_header(self) -> Optional[str]:
+        if not self.username:
+            return None
+        token = base64.b64encode(f"{self.username}:{self.password}".encode('utf-8')).decode('ascii')
+        return f"Basic {token}"
+
+    def __repr__(self) -> str:
+        return f"UpstreamProxy({self.username}@{self.host}:{self.port})"
+
+
+class LocalProxyRelay:
+    def __init__(self, listen_host: str = '127.0.0.1', connect_timeout: float = 30):
+        """
+        Local forwarding proxy that maps each localhost port to one upstream
+        proxy session and injects Proxy-Authorization.
+
+        Browsers cannot do username/password proxy auth from preferences, so
+        each browser points at its own unauthenticated local port instead.
+        Supports CONNECT tunnels (HTTPS) and absolute-form plain HTTP requests.
+        """
+        self.listen_host = listen_host
+        self.connect_timeout = connect_timeout
+        self.routes: Dict[int, UpstreamProxy] = {}
+        self._servers: Dict[int, asyncio.AbstractServer] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # ----- lifecycle for synchronous callers -----
+
+    def start(self) -> "LocalProxyRelay":
+        """Run the relay event loop in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return self
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="local-proxy-relay", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def stop(self):
+        """Close all listeners and stop the background loop"""
+        if not self._loop:
+            return
+        future = asyncio.run_coroutine_threadsafe(self.close_all(), self._loop)
+        future.result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+        self._loop = None
+        self._thread = None
+
+    def add_upstream(self, upstream: UpstreamProxy, port: int = 0) -> int:
+        """Open a local port for an upstream (thread-safe). Returns the bound port."""
+        if not self._loop:
+            self.start()
+        future = asyncio.run_coroutine_threadsafe(self.serve_upstream(upstream, port), self._loop)
+        return future.result(timeout=10)
+
+    def remove_port(self, port: int):
+        """Close a local port (thread-safe)"""
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self.close_port(port), self._loop).result(timeout=10)
+
+    # ----- asyncio API -----
+
+    async def serve_upstream(self, upstream: UpstreamProxy, port: int = 0) -> int:
+        """Start listening on a local port that relays to ``upstream``"""
+        async def handler(reader, writer):
+            await self._handle_client(reader, writer, upstream)
+
+        server = await asyncio.start_server(handler, self.listen_host, port)
+        bound_port = server.sockets[0].getsockname()[1]
+        self._servers[bound_port] = server
+        self.routes[bound_port] = upstream
+        logger.info(f"Local proxy {self.listen_host}:{bound_port} -> {upstream}")
+        return bound_port
+
+    async def close_port(self, port: int):
+        server = self._servers.pop(port, None)
+        self.routes.pop(port, None)
+        if server:
+            server.close()
+            await server.wait_closed()
+
+    async def close_all(self):
+        for port in list(self._servers):
+            await self.close_port(port)
+
+    # ----- relay internals -----
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> bytes:
+        head = await reader.readuntil(b"\r\n\r\n")
+        if len(head) > MAX_HEADER_BYTES:
+            raise ValueError("Request head too large")
+        return head
+
+    @staticmethod
+    def _rewrite_head(head: bytes, auth: Optional[str], close: bool) -> bytes:
+        """Replace client proxy headers with our Proxy-Authorization"""
+        lines = head.decode('latin-1').split("\r\n")
+        request_line, header_lines = lines[0], [l for l in lines[1:] if l]
+        kept = []
+        for line in header_lines:
+            name = line.split(":", 1)[0].strip().lower()
+            if name in ("proxy-authorization", "proxy-connection"):
+                continue
+            if close and name == "connection":
+                continue
+            kept.append(line)
+        if auth:
+            kept.append(f"Proxy-Authorization: {auth}")
+        if close:
+            # One upstream request per client connection so every request carries auth
+            kept.append("Connection: close")
+        return ("\r\n".join([request_line] + kept) + "\r\n\r\n").encode('latin-1')
+
+    async def _open_upstream(self, upstream: UpstreamProxy) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.wait_for(
+            asyncio.open_connection(upstream.host, upstream.port),
+            timeout=self.connect_timeout
+        )
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             upstream: UpstreamProxy):
+        upstream_writer = None
+        try:
+            head = await self._read_head(reader)
+            method = head.split(b" ", 1)[0].upper()
+            auth = upstream.authorization_header()
+            up_reader, upstream_writer = await self._open_upstream(upstream)
+
+            if method == b"CONNECT":
+                upstream_writer.write(self._rewrite_head(head, auth, close=False))
+                await upstream_writer.drain()
+                response_head = await self._read_head(up_reader)
+                writer.write(response_head)
+                await writer.drain()
+                status = response_head.split(b" ", 2)[1:2]
+                if status != [b"200"]:
+                    logger.warning(f"Upstream CONNECT refused: {response_head.splitlines()[0]!r}")
+                    return
+            else:
+                upstream_writer.write(self._rewrite_head(head, auth, close=True))
+                await upstream_writer.drain()
+
+            await asyncio.gather(
+                self._pipe(reader, upstream_writer),
+                self._pipe(up_reader, writer),
+            )
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError) as e:
+            logger.debug(f"Relay connection ended: {e}")
+        except Exception as e:
+            logger.error(f"Local proxy relay error: {e}")
+        finally:
+            for w in (writer, upstream_writer):
+                if w is not None:
+                    try:
+                        w.close()
+                    except Exception:
+                        pass
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                data = await reader.read(RELAY_CHUNK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            try:
+                if writer.can_write_eof():
+                    writer.write_eof()
+            except Exception:
+                pass
+
+
+def configure_firefox_proxy(options, port: int, host: str = '127.0.0.1'):
+    """Point Firefox options at a LocalProxyRelay port"""
+    options.set_preference("network.proxy.type", 1)
+    options.set_preference("network.proxy.http", host)
+    options.set_preference("network.proxy.http_port", int(port))
+    options.set_preference("network.proxy.ssl", host)
+    options.set_preference("network.proxy.ssl_port", int(port))
+    options.set_preference("network.proxy.share_proxy_settings", True)
+    options.set_preference("network.proxy.no_proxies_on", "")
+    options.set_preference("network.proxy.allow_hijacking_localhost", True)
+    return options
+
+
+_shared_relay: Optional[LocalProxyRelay] = None
+_shared_lock = threading.Lock()
+
+
+def get_local_proxy_relay() -> LocalProxyRelay:
+    """Process-wide relay so many browser workers share one event loop thread"""
+    global _shared_relay
+    with _shared_lock:
+        if _shared_relay is None:
+            _shared_relay = LocalProxyRelay().start()
+        return _shared_relay
@@ -3,8 +3,8 @@ from datetime import datetime
 import os
 # from igr_search import IGRSearcher  # No longer needed
 from igr_scraper import IGRScraper
+from rate_governor import get_rate_governor
 import json
-import time
 import requests  # Import the requests library
 
 def setup_logging():
@@ -24,6 +24,7 @@ def main():
     # Initialize components
     # searcher = IGRSearcher()  # No longer needed
     scraper = IGRScraper()
+    rate_governor = get_rate_governor()
     
     # Search parameters
     district = "Mumbai"  # Ensure this is used in the payload
@@ -62,9 +63,10 @@ def main():
     batch_size = 10
     for i in range(0, len(property_urls), batch_size):
         batch = property_urls[i:i + batch_size]
+        # One token per property instead of a fixed pause between batches
+        rate_governor.acquire(batch[0], tokens=len(batch))
         success, fails = scraper.test_batch_download(batch)
         logging.info(f"Batch {i//batch_size + 1}: Success={success}, Fails={fails}")
-        time.sleep(60)  # Wait between batches
 
 if __name__ == "__main__":
     main()
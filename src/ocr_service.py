@@ -0,0 +1,420 @@
+import io
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import logging
+import argparse
+import tempfile
+import importlib.util
+import threading
+import subprocess
+import socketserver
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .captcha_cnn import CNN_ACCEPT_CONFIDENCE, get_captcha_model
+from .rate_governor import _FileLock
+
+# Only the service process imports the engines (OCREngines); clients importing
+# this module for get_ocr_client() must not pay for torch/easyocr/transformers
+EASYOCR_AVAILABLE = importlib.util.find_spec('easyocr') is not None
+TESSERACT_AVAILABLE = importlib.util.find_spec('pytesseract') is not None
+TROCR_AVAILABLE = (importlib.util.find_spec('torch') is not None
+                   and importlib.util.find_spec('transformers') is not None)
+
+logger = logging.getLogger(__name__)
+
+UNIX_SOCKETS = hasattr(socket, 'AF_UNIX')
+DEFAULT_SOCKET = os.getenv('OCR_SERVICE_SOCKET', os.path.join(tempfile.gettempdir(), 'igr_ocr.sock'))
+# Used instead of the socket file where Unix sockets are unavailable (Windows)
+DEFAULT_PORT = int(os.getenv('OCR_SERVICE_PORT', '8766'))
+TROCR_MODEL = os.getenv('TROCR_MODEL', 'microsoft/trocr-base-printed')
+CAPTCHA_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+_LENGTHS = struct.Struct('>II')
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 16))
+        if not chunk:
+            raise ConnectionError("OCR service connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def send_message(sock: socket.socket, header: Dict[str, Any], payload: bytes = b''):
+    """Frame: header length, payload length (big-endian u32), JSON header, payload bytes"""
+    encoded = json.dumps(header).encode('utf-8')
+    sock.sendall(_LENGTHS.pack(len(encoded), len(payload)) + encoded + payload)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict[str, Any], bytes]:
+    header_size, payload_size = _LENGTHS.unpack(_recv_exact(sock, _LENGTHS.size))
+    header = json.loads(_recv_exact(sock, header_size).decode('utf-8'))
+    return header, _recv_exact(sock, payload_size) if payload_size else b''
+
+
+def _to_bytes(image: Any) -> bytes:
+    """Image path, encoded bytes, PIL image or numpy array -> encoded image bytes"""
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    if isinstance(image, str):
+        with open(image, 'rb') as f:
+            return f.read()
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class OCREngines:
+    def __init__(self, engines: Optional[List[str]] = None, torch_threads: Optional[int] = None):
+        """
+        EasyOCR, Tesseract and TrOCR loaded once for the service process
+
+        Args:
+            engines: Engines to load (default: every installed one)
+            torch_threads: Intra-op threads for the torch models
+        """
+        available = {"easyocr": EASYOCR_AVAILABLE, "tesseract": TESSERACT_AVAILABLE, "trocr": TROCR_AVAILABLE}
+        wanted = engines or [name for name, ok in available.items() if ok]
+        self.engines: Dict[str, Any] = {}
+        # EasyOCR and TrOCR both run on torch
+        if torch_threads and any(available.get(name) for name in wanted if name in ("easyocr", "trocr")):
+            import torch
+            torch.set_num_threads(torch_threads)
+
+        for name in wanted:
+            if not available.get(name):
+                logger.warning(f"OCR engine {name} is not installed")
+                continue
+            started = time.time()
+            try:
+                if name == "easyocr":
+                    import easyocr
+                    self.engines[name] = easyocr.Reader(['en'])
+                elif name == "tesseract":
+                    import pytesseract
+                    pytesseract.get_tesseract_version()
+                    self.engines[name] = pytesseract
+                elif name == "trocr":
+                    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+                    processor = TrOCRProcessor.from_pretrained(TROCR_MODEL)
+                    model = VisionEncoderDecoderModel.from_pretrained(TROCR_MODEL)
+                    model.eval()
+                    self.engines[name] = (processor, model)
+                logger.info(f"OCR engine {name} loaded in {time.time() - started:.1f}s")
+            except Exception as e:
+                logger.warning(f"OCR engine {name} failed to load: {e}")
+
+    def _easyocr(self, image: Image.Image, allowlist: Optional[str]) -> List[Tuple[str, float]]:
+        results = self.engines["easyocr"].readtext(np.asarray(image.convert('RGB')), allowlist=allowlist)
+        return [(text, float(confidence)) for _, text, confidence in results]
+
+    def _tesseract(self, image: Image.Image, allowlist: Optional[str]) -> List[Tuple[str, float]]:
+        pytesseract = self.engines["tesseract"]
+        config = '--psm 8'
+        if allowlist:
+            config += f' -c tessedit_char_whitelist={allowlist}'
+        data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
+        words = [(text, float(conf)) for text, conf in zip(data['text'], data['conf'])
+                 if text.strip() and float(conf) >= 0]
+        if not words:
+            return []
+        return [(''.join(text for text, _ in words), sum(conf for _, conf in words) / len(words) / 100.0)]
+
+    def _trocr(self, image: Image.Image, allowlist: Optional[str]) -> List[Tuple[str, float]]:
+        import torch
+
+        processor, model = self.engines["trocr"]
+        pixel_values = processor(images=image.convert('RGB'), return_tensors='pt').pixel_values
+        with torch.no_grad():
+            output = model.generate(pixel_values, max_new_tokens=16, output_scores=True,
+                                    return_dict_in_generate=True)
+            scores = model.compute_transition_scores(output.sequences, output.scores, normalize_logits=True)
+        text = processor.batch_decode(output.sequences, skip_special_tokens=True)[0]
+        # Mean per-token probability as the confidence
+        confidence = float(torch.exp(scores[0]).mean()) if scores.numel() else 0.0
+        return [(text, confidence)]
+
+    @property
+    def available(self) -> List[str]:
+        return (["cnn"] if get_captcha_model() is not None else []) + list(self.engines)
+
+    def _cnn(self, image: Image.Image, allowlist: Optional[str]) -> List[Tuple[str, float]]:
+        model = get_captcha_model()
+        if model is None:
+            return []
+        candidate = model.solve(np.asarray(image.convert('L')))
+        return [(candidate["text"], candidate["confidence"])]
+
+    def recognize(self, content: bytes, engines: Optional[List[str]] = None,
+                  allowlist: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Run the engines on an image. The trained CAPTCHA model goes first; a
+        confident model answer is returned without running the OCR engines.
+
+        Confidences of different engines are on different scales (EasyOCR's
+        own, Tesseract's word confidence / 100, TrOCR's mean token
+        probability), so candidates are ranked by the order of ``engines``
+        first and by confidence only within an engine. An unconfident model
+        answer ranks after the OCR engines.
+
+        Returns:
+            [{"text", "raw", "confidence", "engine"}], best first
+        """
+        image = Image.open(io.BytesIO(content))
+        image.load()
+        candidates = []
+        engines = engines or ["cnn"] + list(self.engines)
+        if "cnn" in engines:
+            try:
+                for raw, confidence in self._cnn(image, allowlist):
+                    if raw:
+                        candidates.append({"text": raw, "raw": raw, "confidence": round(confidence, 4),
+                                           "engine": "cnn"})
+                        if confidence >= CNN_ACCEPT_CONFIDENCE:
+                            return candidates
+            except Exception as e:
+                logger.warning(f"CAPTCHA model failed: {e}")
+        for name in engines:
+            if name not in self.engines:
+                continue
+            try:
+                for raw, confidence in getattr(self, f"_{name}")(image, allowlist):
+                    text = ''.join(c for c in raw if c.isalnum())
+                    if text:
+                        candidates.append({"text": text, "raw": raw.strip(), "confidence": round(confidence, 4),
+                                           "engine": name})
+            except Exception as e:
+                logger.warning(f"OCR engine {name} failed: {e}")
+        rank = {name: index for index, name in enumerate(name for name in engines if name != "cnn")}
+        candidates.sort(key=lambda c: (rank.get(c["engine"], len(rank)), -c["confidence"]))
+        return candidates
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        service: OCRService = self.server.service
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            send_message(self.request, service.dispatch(header, payload))
+
+
+class OCRService:
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, port: int = DEFAULT_PORT, threads: int = 2,
+                 engines: Optional[List[str]] = None):
+        """
+        Long-lived OCR process serving all automation workers over a Unix
+        socket (TCP on localhost where Unix sockets are unavailable)
+
+        Args:
+            socket_path: Unix socket file (OCR_SERVICE_SOCKET)
+            port: Localhost port when Unix sockets are unavailable (OCR_SERVICE_PORT)
+            threads: Images recognised at the same time; torch gets the remaining cores
+            engines: Engines to load (default: every installed one)
+        """
+        self.socket_path = socket_path
+        self.port = port
+        self.threads = threads
+        self._slots = threading.BoundedSemaphore(threads)
+        torch_threads = max(1, (os.cpu_count() or 2) // threads)
+        self.engines = OCREngines(engines, torch_threads=torch_threads)
+        self.started = time.time()
+        self.served = 0
+        self._lock = threading.Lock()
+
+    def dispatch(self, header: Dict[str, Any], payload: bytes) -> Dict[str, Any]:
+        op = header.get("op")
+        if op == "ping":
+            with self._lock:
+                served = self.served
+            return {"ok": True, "engines": self.engines.available, "threads": self.threads,
+                    "served": served, "uptime": round(time.time() - self.started, 1)}
+        if op != "ocr":
+            return {"error": f"unknown op {op!r}"}
+        started = time.perf_counter()
+        try:
+            with self._slots:
+                candidates = self.engines.recognize(payload, header.get("engines"), header.get("allowlist"))
+        except Exception as e:
+            return {"error": str(e), "candidates": []}
+        with self._lock:
+            self.served += 1
+        return {"candidates": candidates, "seconds": round(time.perf_counter() - started, 3)}
+
+    def serve_forever(self):
+        if UNIX_SOCKETS:
+            if os.path.exists(self.socket_path):
+                if OCRClient(self.socket_path, autostart=False).ping():
+                    logger.info(f"OCR service already running on {self.socket_path}")
+                    return
+                os.unlink(self.socket_path)  # stale socket from a crashed service
+            server = socketserver.ThreadingUnixStreamServer(self.socket_path, _Handler)
+        else:
+            server = socketserver.ThreadingTCPServer(('127.0.0.1', self.port), _Handler)
+        server.daemon_threads = True
+        server.service = self
+        print(f"🔤 OCR service ready ({', '.join(self.engines.available) or 'no engines'}, "
+              f"{self.threads} threads) on {self.socket_path if UNIX_SOCKETS else self.port}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if UNIX_SOCKETS and os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+
+class OCRClient:
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, port: int = DEFAULT_PORT, timeout: float = 60,
+                 autostart: bool = True, startup_timeout: float = 180):
+        """
+        Thin client for the OCR service; starts the service on first use if it
+        isn't running. Safe to share between threads.
+
+        Args:
+            socket_path: Unix socket file of the service
+            port: Localhost port when Unix sockets are unavailable
+            timeout: Seconds to wait for one recognition
+            autostart: Launch the service (python -m src.ocr_service) when it isn't reachable
+            startup_timeout: Seconds to wait for a launched service to load its models
+        """
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout
+        self.autostart = autostart
+        self.startup_timeout = startup_timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        if UNIX_SOCKETS:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address: Any = self.socket_path
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = ('127.0.0.1', self.port)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _request(self, header: Dict[str, Any], payload: bytes = b'') -> Dict[str, Any]:
+        # One persistent connection per thread
+        for attempt in range(2):
+            sock = getattr(self._local, 'sock', None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                send_message(sock, header, payload)
+                return recv_message(sock)[0]
+            except (ConnectionError, OSError):
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        raise ConnectionError("OCR service unreachable")
+
+    def ping(self) -> Optional[Dict[str, Any]]:
+        try:
+            return self._request({"op": "ping"})
+        except (ConnectionError, OSError):
+            return None
+
+    def _start_service(self) -> bool:
+        lock_path = (self.socket_path if UNIX_SOCKETS else os.path.join(tempfile.gettempdir(), 'igr_ocr')) + '.lock'
+        with open(lock_path, 'a+') as handle, _FileLock(handle):
+            # Another worker may have started it while we waited for the lock
+            if self.ping():
+                return True
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            os.makedirs(os.path.join(root, 'logs'), exist_ok=True)
+            with open(os.path.join(root, 'logs', 'ocr_service.log'), 'a') as log:
+                kwargs: Dict[str, Any] = {"start_new_session": True} if os.name != 'nt' else \
+                    {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+                subprocess.Popen([sys.executable, '-m', 'src.ocr_service', '--socket', self.socket_path,
+                                  '--port', str(self.port)], cwd=root, stdout=log,
+                                  stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, **kwargs)
+            print("🔤 Starting shared OCR service (models load once for all workers)...")
+            deadline = time.time() + self.startup_timeout
+            while time.time() < deadline:
+                if self.ping():
+                    return True
+                time.sleep(0.5)
+        logger.warning("OCR service did not start; see logs/ocr_service.log")
+        return False
+
+    def recognize(self, image: Any, engines: Optional[List[str]] = None,
+                  allowlist: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Ranked OCR candidates for an image (path, bytes, PIL image or numpy array)
+
+        Returns:
+            [{"text", "raw", "confidence", "engine"}], best first; [] if the service is unavailable
+        """
+        header = {"op": "ocr", "engines": engines, "allowlist": allowlist}
+        payload = _to_bytes(image)
+        try:
+            response = self._request(header, payload)
+        except (ConnectionError, OSError):
+            if not (self.autostart and self._start_service()):
+                return []
+            try:
+                response = self._request(header, payload)
+            except (ConnectionError, OSError) as e:
+                logger.warning(f"OCR service request failed: {e}")
+                return []
+        if response.get("error"):
+            logger.warning(f"OCR service error: {response['error']}")
+        return response.get("candidates", [])
+
+    def readtext(self, image: Any, engines: Optional[List[str]] = None,
+                 allowlist: Optional[str] = None) -> List[Tuple[None, str, float]]:
+        """Drop-in for easyocr.Reader.readtext: [(bbox, text, confidence)], best first (bbox is None)"""
+        return [(None, c["raw"], c["confidence"]) for c in self.recognize(image, engines, allowlist)]
+
+
+_default_client: Optional[OCRClient] = None
+_default_lock = threading.Lock()
+
+
+def get_ocr_client() -> OCRClient:
+    """Process-wide OCR client; all workers share one service process"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = OCRClient()
+        return _default_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared OCR service for the CAPTCHA automation workers')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix socket path')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Localhost port where Unix sockets are unavailable')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('OCR_SERVICE_THREADS', '2')),
+                        help='Images recognised concurrently')
+    parser.add_argument('--engines', nargs='+', choices=['easyocr', 'tesseract', 'trocr'],
+                        default=os.getenv('OCR_ENGINES', '').split() or None,
+                        help='Engines to load (default: OCR_ENGINES or all installed)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    OCRService(args.socket, args.port, args.threads, args.engines).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import Executor, as_completed
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from .qr_cascade import run_cascade, get_cascade_stats
+from .qr_roi_cache import ROI_CACHE_ENABLED, get_roi_cache
+
+try:
+    import pymupdf as fitz
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    try:
+        import fitz
+        PYMUPDF_AVAILABLE = True
+    except ImportError:
+        PYMUPDF_AVAILABLE = False
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+PDF_DIRECTORIES = [os.path.join('data', 'documents'), os.path.join('data', 'bulk_igr_pdfs'), os.path.join('data', 'pdfs')]
+
+# Where registered documents print their QR code, as (x0, y0, x1, y1) page fractions.
+# Tried in order before falling back to the whole page.
+LIKELY_REGIONS: List[Tuple[str, Tuple[float, float, float, float]]] = [
+    ("top_right", (0.5, 0.0, 1.0, 0.35)),
+    ("bottom_right", (0.5, 0.65, 1.0, 1.0)),
+    ("bottom_left", (0.0, 0.65, 0.5, 1.0)),
+    ("top_left", (0.0, 0.0, 0.5, 0.35)),
+]
+
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _embedded_image_regions(page) -> List[Tuple[str, Tuple[float, float, float, float]]]:
+    """Placements of embedded raster images (QR codes are usually one), as page fractions"""
+    width, height = page.rect.width, page.rect.height
+    regions = []
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info['bbox']
+        if min(x1 - x0, y1 - y0) < 20:
+            continue
+        # Pad so the decoder sees the quiet zone
+        pad = 0.1 * max(x1 - x0, y1 - y0)
+        regions.append(("embedded", (max(0.0, (x0 - pad) / width), max(0.0, (y0 - pad) / height),
+                                     min(1.0, (x1 + pad) / width), min(1.0, (y1 + pad) / height))))
+    return regions
+
+
+class _PageRenderer:
+    """Renders whole pages or regions of a PDF to grayscale PIL images"""
+
+    def __init__(self, path: str, dpi: int):
+        self.path = path
+        self.dpi = dpi
+        self._doc = fitz.open(path) if PYMUPDF_AVAILABLE else None
+        self._pages: Dict[int, Image.Image] = {}
+
+    @property
+    def page_count(self) -> int:
+        if self._doc is not None:
+            return self._doc.page_count
+        return int(pdfinfo_from_path(self.path)['Pages'])
+
+    def thumbnail(self, index: int) -> Image.Image:
+        """Low resolution render for template matching"""
+        if self._doc is not None:
+            pixmap = self._doc[index].get_pixmap(dpi=36, colorspace=fitz.csGRAY, alpha=False)
+            return Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+        return self.render(index)
+
+    def regions(self, index: int) -> List[Tuple[str, Tuple[float, float, float, float]]]:
+        embedded = _embedded_image_regions(self._doc[index]) if self._doc is not None else []
+        return embedded + LIKELY_REGIONS
+
+    def render(self, index: int, region: Optional[Tuple[float, float, float, float]] = None) -> Image.Image:
+        if self._doc is not None:
+            # PyMuPDF rasterises only the clipped area, so region-first is cheap
+            page = self._doc[index]
+            clip = None
+            if region:
+                rect = page.rect
+                clip = fitz.Rect(rect.x0 + region[0] * rect.width, rect.y0 + region[1] * rect.height,
+                                 rect.x0 + region[2] * rect.width, rect.y0 + region[3] * rect.height)
+            pixmap = page.get_pixmap(dpi=self.dpi, colorspace=fitz.csGRAY, clip=clip, alpha=False)
+            return Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+
+        # pdf2image renders the full page once; regions are crops of it
+        if index not in self._pages:
+            self._pages = {index: convert_from_path(self.path, dpi=self.dpi, grayscale=True,
+                                                    first_page=index + 1, last_page=index + 1)[0].convert('L')}
+        image = self._pages[index]
+        if not region:
+            return image
+        width, height = image.size
+        return image.crop((int(region[0] * width), int(region[1] * height),
+                           int(region[2] * width), int(region[3] * height)))
+
+    def close(self):
+        if self._doc is not None:
+            self._doc.close()
+        self._pages = {}
+
+
+def scan_pdf(path: str, dpi: int = 200, max_pages: Optional[int] = None,
+             order: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Extract QR codes from every page of a PDF. Runs in a pool worker.
+
+    Each page is tried region by region (where the page's template had its QR
+    codes before, embedded images, then the usual QR corners) and only rendered
+    in full when no region decodes. The template's regions only count when they
+    hold as many codes as the template's pages carry.
+
+    Returns:
+        {path, pages, qr: [{page, region, qr_contents}], stages, seconds, error}
+    """
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"path": path, "pages": 0, "qr": [], "stages": [], "error": None}
+    renderer = None
+    try:
+        renderer = _PageRenderer(path, dpi)
+        pages = renderer.page_count
+        result["pages"] = pages
+        roi_cache = get_roi_cache() if ROI_CACHE_ENABLED else None
+        for index in range(min(pages, max_pages) if max_pages else pages):
+            lookup = roi_cache.lookup(renderer.thumbnail(index)) if roi_cache else None
+            found = False
+            if lookup is not None and lookup["regions"]:
+                # The template's regions replace the page only if they held every code it carries
+                codes, hit_regions = [], []
+                for region in lookup["regions"]:
+                    qr_data, stages = run_cascade(renderer.render(index, region), order)
+                    result["stages"].extend(stages)
+                    new = [code for code in qr_data if code not in codes]
+                    if new:
+                        codes += new
+                        hit_regions.append(region)
+                    if len(codes) >= lookup["codes"]:
+                        break
+                if codes and len(codes) >= lookup["codes"]:
+                    result["qr"].append({"page": index + 1, "region": "template", "qr_contents": codes})
+                    roi_cache.record_hit(lookup, *hit_regions)
+                    found = True
+                else:
+                    roi_cache.record_miss(lookup)
+            if not found:
+                for name, region in renderer.regions(index) + [("page", None)]:
+                    image = renderer.render(index, region)
+                    qr_data, stages = run_cascade(image, order)
+                    result["stages"].extend(stages)
+                    if qr_data:
+                        result["qr"].append({"page": index + 1, "region": name, "qr_contents": qr_data})
+                        if lookup is not None:
+                            roi_cache.learn(image, lookup, within=region, codes=len(qr_data))
+                        found = True
+                        break
+            if not found:
+                logger.debug(f"No QR code on page {index + 1} of {path}")
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        if renderer is not None:
+            renderer.close()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+class PDFQRIndex:
+    def __init__(self, index_path: Optional[str] = None):
+        """
+        Scan results keyed by the SHA-256 of the PDF, so renamed or copied
+        files are not scanned twice.
+
+        Args:
+            index_path: JSON index file (PDF_QR_INDEX, default data/pdf_qr_index.json)
+        """
+        self.index_path = index_path or os.getenv('PDF_QR_INDEX', os.path.join('data', 'pdf_qr_index.json'))
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read PDF QR index {self.index_path}: {e}")
+
+    def get(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(file_hash)
+
+    def put(self, file_hash: str, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries[file_hash] = entry
+
+    def save(self):
+        """Write atomically so an interrupted run never leaves a truncated index"""
+        with self._lock:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+
+
+class PDFQRExtractor:
+    def __init__(self, index: Optional[PDFQRIndex] = None, pool: Optional[Executor] = None,
+                 dpi: int = 200, max_pages: Optional[int] = None, save_every: int = 20):
+        """
+        Offline QR extraction from downloaded PDFs across a process pool
+
+        Args:
+            index: Results index (default data/pdf_qr_index.json)
+            pool: Executor for scan_pdf (default: the shared QR decode pool)
+            dpi: Rasterisation resolution
+            max_pages: Only scan the first pages of each PDF
+            save_every: Write the index after this many scanned files
+        """
+        if not (PYMUPDF_AVAILABLE or PDF2IMAGE_AVAILABLE):
+            raise ImportError("PDF rasterising needs PyMuPDF (pip install pymupdf) or pdf2image with poppler")
+        if pool is None:
+            from .qr_pipeline import get_decode_pool
+            pool = get_decode_pool()
+        self.index = index or PDFQRIndex()
+        self.pool = pool
+        self.dpi = dpi
+        self.max_pages = max_pages
+        self.save_every = save_every
+
+    @staticmethod
+    def find_pdfs(directories: Iterable[str]) -> List[str]:
+        paths = []
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith('.pdf'))
+        return paths
+
+    def scan(self, directories: Optional[Iterable[str]] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        Scan every PDF under the directories, skipping files already in the index
+
+        Args:
+            directories: Folders to search (default: data/documents, data/bulk_igr_pdfs, data/pdfs)
+            force: Rescan files that are already indexed
+
+        Returns:
+            Run statistics
+        """
+        start = time.time()
+        stats = {"files": 0, "skipped": 0, "duplicates": 0, "scanned": 0, "failed": 0, "pages": 0,
+                 "with_qr": 0, "qr_codes": 0}
+        cascade_stats = get_cascade_stats()
+        order = cascade_stats.order()
+
+        futures = {}
+        # content hash -> every path with those bytes; copies wait for the one scan
+        inflight: Dict[str, List[str]] = {}
+        for path in self.find_pdfs(directories or PDF_DIRECTORIES):
+            stats["files"] += 1
+            file_hash = hash_file(path)
+            entry = self.index.get(file_hash)
+            # Rescan files that failed, or found nothing at a lower DPI than this run
+            if entry and not force and not entry["error"] and (entry["qr"] or entry["dpi"] >= self.dpi):
+                stats["skipped"] += 1
+                if path not in entry["paths"]:
+                    entry["paths"].append(path)
+                continue
+            if file_hash in inflight:
+                stats["duplicates"] += 1
+                inflight[file_hash].append(path)
+                continue
+            inflight[file_hash] = [path]
+            futures[self.pool.submit(scan_pdf, path, self.dpi, self.max_pages, order)] = (path, file_hash)
+
+        for done, future in enumerate(as_completed(futures), 1):
+            path, file_hash = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"path": path, "pages": 0, "qr": [], "stages": [], "seconds": 0, "error": str(e)}
+            cascade_stats.record(result.pop("stages"))
+
+            stats["scanned"] += 1
+            stats["pages"] += result["pages"]
+            if result["error"]:
+                stats["failed"] += 1
+                logger.warning(f"Could not scan {path}: {result['error']}")
+            if result["qr"]:
+                stats["with_qr"] += 1
+                stats["qr_codes"] += sum(len(found["qr_contents"]) for found in result["qr"])
+
+            previous = self.index.get(file_hash) or {}
+            paths = list(previous.get("paths", []))
+            paths += [copy for copy in inflight[file_hash] if copy not in paths]
+            self.index.put(file_hash, {
+                "paths": paths,
+                "pages": result["pages"],
+                "qr": result["qr"],
+                "dpi": self.dpi,
+                "error": result["error"],
+                "seconds": result["seconds"],
+                "scanned_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            })
+            if done % self.save_every == 0:
+                self.index.save()
+
+        self.index.save()
+        stats["elapsed_seconds"] = round(time.time() - start, 2)
+        return stats
@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .enhanced_proxy_manager import EnhancedProxyManager
+
+logger = logging.getLogger(__name__)
+
+# Request classes the router distinguishes
+SEARCH_FORM = "search_form"
+CAPTCHA = "captcha"
+DOCUMENT = "document"
+QR_IMAGE = "qr_image"
+REQUEST_CLASSES = (SEARCH_FORM, CAPTCHA, DOCUMENT, QR_IMAGE)
+
+BLOCK_STATUS_CODES = {403, 429, 503}
+BLOCK_INDICATORS = [
+    'access denied', 'too many requests', 'rate limit', 'you have been blocked',
+    'request blocked', 'please try again later',
+]
+
+
+class NoProxyAvailable(Exception):
+    """Raised when no provider may carry a request class (never falls back to a direct connection)"""
+    pass
+
+
+def looks_blocked(status_code: Optional[int], text: str = '') -> bool:
+    """Heuristic block detection shared by all callers of the router"""
+    if status_code in BLOCK_STATUS_CODES:
+        return True
+    text_lower = (text or '')[:20000].lower()
+    return any(indicator in text_lower for indicator in BLOCK_INDICATORS)
+
+
+class ProxyProvider(EnhancedProxyManager):
+    def __init__(self, name: str, proxy_config: Dict[str, str], cost_per_gb: float = 0.0,
+                 kind: str = "residential", supports_sessions: bool = True,
+                 ewma_alpha: float = 0.2):
+        """
+        One upstream proxy pool with cost and measured health
+
+        Args:
+            name: Provider name used in stats and config
+            proxy_config: Dict with keys: host, port, username, password
+            cost_per_gb: Price per GB of traffic
+            kind: 'residential' or 'datacenter'
+            supports_sessions: Whether -sessid- sticky sessions are supported
+            ewma_alpha: Smoothing factor for latency and block-rate averages
+        """
+        super().__init__(proxy_config)
+        self.name = name
+        self.cost_per_gb = float(cost_per_gb)
+        self.kind = kind
+        self.supports_sessions = supports_sessions
+        self.rotating_session = supports_sessions
+        self.ewma_alpha = ewma_alpha
+
+        self.latency_ewma: Optional[float] = None
+        self.block_rate = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.blocked = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def get_sticky_proxy(self, session_id: str) -> Optional[Dict[str, str]]:
+        if not self.supports_sessions:
+            return self.get_proxy(rotate_ip=False)
+        return super().get_sticky_proxy(session_id)
+
+    def record(self, latency: Optional[float] = None, blocked: bool = False, error: bool = False):
+        """Update health averages with the outcome of one request"""
+        a = self.ewma_alpha
+        with self._lock:
+            self.requests += 1
+            if latency is not None and not error:
+                self.latency_ewma = latency if self.latency_ewma is None else (1 - a) * self.latency_ewma + a * latency
+            self.block_rate = (1 - a) * self.block_rate + a * (1.0 if blocked else 0.0)
+            self.error_rate = (1 - a) * self.error_rate + a * (1.0 if error else 0.0)
+            if blocked:
+                self.blocked += 1
+            if error:
+                self.errors += 1
+            if blocked or error:
+                self.consecutive_failures += 1
+            else:
+                self.consecutive_failures = 0
+
+    def is_available(self) -> bool:
+        return self.proxy_configured and time.time() >= self.cooldown_until
+
+    def get_proxy_stats(self) -> Dict[str, Any]:
+        stats = super().get_proxy_stats()
+        stats.update({
+            "name": self.name,
+            "kind": self.kind,
+            "cost_per_gb": self.cost_per_gb,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "block_rate": round(self.block_rate, 3),
+            "error_rate": round(self.error_rate, 3),
+            "requests": self.requests,
+            "blocked": self.blocked,
+            "errors": self.errors,
+            "cooling_down": time.time() < self.cooldown_until,
+        })
+        return stats
+
+
+# Which provider kinds each request class may use, and how much each factor weighs.
+# Search and CAPTCHA traffic must stay on residential IPs; static downloads may go
+# through cheaper datacenter pools.
+DEFAULT_POLICY = {
+    SEARCH_FORM: {"kinds": ["residential"], "cost": 0.2, "latency": 0.3, "block": 0.5, "sticky": True},
+    CAPTCHA: {"kinds": ["residential"], "cost": 0.2, "latency": 0.4, "block": 0.4, "sticky": True},
+    DOCUMENT: {"kinds": ["datacenter", "residential"], "cost": 0.6, "latency": 0.1, "block": 0.3, "sticky": False},
+    QR_IMAGE: {"kinds": ["datacenter", "residential"], "cost": 0.7, "latency": 0.2, "block": 0.1, "sticky": False},
+}
+
+
+class ProxyRouter:
+    def __init__(self, providers: List[ProxyProvider], policy: Optional[Dict[str, Dict]] = None,
+                 degrade_block_rate: float = 0.3, max_consecutive_failures: int = 5,
+                 cooldown_seconds: float = 120, explore_probability: float = 0.05,
+                 max_sessions: int = 4096):
+        """
+        Cost/latency-aware selection between several proxy providers
+
+        Args:
+            providers: Candidate upstreams
+            policy: Per request class routing rules (see DEFAULT_POLICY)
+            degrade_block_rate: Block-rate EWMA above which a provider is cooled down
+            max_consecutive_failures: Failures in a row before cooling down
+            cooldown_seconds: How long a degraded provider is skipped
+            explore_probability: Chance of trying a non-best provider to refresh its stats
+                (only when a session starts; a session keeps its provider)
+            max_sessions: Session -> provider pins remembered (least recently used dropped first)
+        """
+        if not providers:
+            raise ValueError("ProxyRouter needs at least one provider")
+        self.providers = {p.name: p for p in providers}
+        self.policy = dict(DEFAULT_POLICY)
+        if policy:
+            self.policy.update(policy)
+        self.degrade_block_rate = degrade_block_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown_seconds = cooldown_seconds
+        self.explore_probability = explore_probability
+        self.max_sessions = max_sessions
+        self._sessions: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "ProxyRouter":
+        """
+        Load providers from JSON:
+        {"providers": [{"name": ..., "host": ..., "port": ..., "username": ...,
+                        "password": ..., "cost_per_gb": ..., "kind": ...}], "policy": {...}}
+        """
+        with open(path) as f:
+            config = json.load(f)
+        providers = []
+        for entry in config.get("providers", []):
+            password = entry.get("password") or os.getenv(entry.get("password_env", ""), "")
+            providers.append(ProxyProvider(
+                entry["name"],
+                {
+                    "host": entry["host"],
+                    "port": str(entry["port"]),
+                    "username": entry.get("username", ""),
+                    "password": password,
+                },
+                cost_per_gb=entry.get("cost_per_gb", 0.0),
+                kind=entry.get("kind", "residential"),
+                supports_sessions=entry.get("supports_sessions", True),
+            ))
+        return cls(providers, policy=config.get("policy"))
+
+    @classmethod
+    def from_env(cls, default_config: Optional[Dict[str, str]] = None) -> "ProxyRouter":
+        """
+        PROXY_PROVIDERS_FILE if set, otherwise a single provider from
+        ``default_config`` or the PROXY_* environment variables
+        """
+        path = os.getenv('PROXY_PROVIDERS_FILE')
+        if path and os.path.exists(path):
+            return cls.from_file(path)
+        if default_config is None:
+            default_config = {
+                "host": os.getenv('PROXY_HOST', '42q6t9rp.pr.thordata.net'),
+                "port": os.getenv('PROXY_PORT', '9999'),
+                "username": os.getenv('PROXY_USERNAME', 'td-customer-hdXMhtuot8ni'),
+                "password": os.getenv('PROXY_PASSWORD', ''),
+            }
+        default = ProxyProvider(
+            os.getenv('PROXY_PROVIDER_NAME', 'thordata'),
+            default_config,
+            cost_per_gb=float(os.getenv('PROXY_COST_PER_GB', '0') or 0),
+        )
+        return cls([default])
+
+    def _score(self, provider: ProxyProvider, rules: Dict, max_cost: float, max_latency: float) -> float:
+        """Lower is better"""
+        cost = provider.cost_per_gb / max_cost if max_cost else 0.0
+        # Unmeasured providers get an optimistic average latency so they are tried
+        latency = provider.latency_ewma if provider.latency_ewma is not None else max_latency / 2
+        latency = latency / max_latency if max_latency else 0.0
+        failure = provider.block_rate + provider.error_rate
+        return rules["cost"] * cost + rules["latency"] * latency + rules["block"] * failure
+
+    def candidates(self, request_class: str) -> List[ProxyProvider]:
+        """Providers allowed for a request class, best first"""
+        rules = self.policy.get(request_class)
+        if rules is None:
+            raise ValueError(f"Unknown request class: {request_class}")
+        allowed = [p for p in self.providers.values()
+                   if p.proxy_configured and p.kind in rules["kinds"]
+                   and (p.supports_sessions or not rules.get("sticky"))]
+        if not allowed:
+            return []
+        healthy = [p for p in allowed if p.is_available()]
+        # If everything is degraded, fall back to the least bad option rather than failing
+        pool = healthy or allowed
+        max_cost = max(p.cost_per_gb for p in pool)
+        measured = [p.latency_ewma for p in pool if p.latency_ewma is not None]
+        max_latency = max(measured) if measured else 1.0
+        return sorted(pool, key=lambda p: self._score(p, rules, max_cost, max_latency))
+
+    def select(self, request_class: str) -> ProxyProvider:
+        """Pick the provider for a new session or a session-less request"""
+        ranked = self.candidates(request_class)
+        if not ranked:
+            logger.error(f"No proxy provider may carry {request_class} requests; refusing a direct connection")
+            raise NoProxyAvailable(f"No proxy provider configured for {request_class} requests")
+        if len(ranked) > 1 and random.random() < self.explore_probability:
+            return random.choice(ranked[1:])
+        return ranked[0]
+
+    def provider_for_session(self, request_class: str, session_id: str) -> ProxyProvider:
+        """
+        Provider pinned to a session. The first request of a session picks it;
+        every later request (search, CAPTCHA and the documents fetched with the
+        session's cookies) goes through the same provider, so the exit IP stays
+        the same for the whole workflow.
+        """
+        with self._lock:
+            name = self._sessions.get(session_id)
+            provider = self.providers.get(name) if name else None
+            if provider is not None:
+                rules = self.policy[request_class]
+                if provider.kind in rules["kinds"] and (provider.supports_sessions or not rules.get("sticky")):
+                    self._sessions.move_to_end(session_id)
+                    return provider
+                logger.warning(
+                    f"Session {session_id} is pinned to {provider.kind} provider '{provider.name}', "
+                    f"which may not carry {request_class} requests; re-pinning"
+                )
+            provider = self.select(request_class)
+            self._sessions[session_id] = provider.name
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return provider
+
+    def release_session(self, session_id: Optional[str]):
+        """Forget a session's provider once the workflow has moved to a new session"""
+        if session_id:
+            with self._lock:
+                self._sessions.pop(session_id, None)
+
+    def get_proxy(self, request_class: str, session_id: Optional[str] = None) -> Tuple[ProxyProvider, Optional[Dict[str, str]]]:
+        """
+        Proxy dict for a request class
+
+        Raises:
+            NoProxyAvailable: No configured provider may carry the request class
+        """
+        if request_class not in self.policy:
+            raise ValueError(f"Unknown request class: {request_class}")
+        if session_id:
+            provider = self.provider_for_session(request_class, session_id)
+            return provider, provider.get_sticky_proxy(session_id)
+        provider = self.select(request_class)
+        return provider, provider.get_proxy(rotate_ip=provider.supports_sessions)
+
+    def record_result(self, provider: Optional[ProxyProvider], latency: Optional[float] = None,
+                      status_code: Optional[int] = None, text: str = '', error: bool = False):
+        """Feed a request outcome back so degraded providers lose traffic"""
+        if provider is None:
+            return
+        blocked = not error and looks_blocked(status_code, text)
+        provider.record(latency=latency, blocked=blocked, error=error)
+        if (provider.block_rate > self.degrade_block_rate
+                or provider.consecutive_failures >= self.max_consecutive_failures):
+            if time.time() >= provider.cooldown_until:
+                provider.cooldown_until = time.time() + self.cooldown_seconds
+                logger.warning(
+                    f"Proxy provider '{provider.name}' degraded (block rate {provider.block_rate:.2f}, "
+                    f"{provider.consecutive_failures} consecutive failures); cooling down for {self.cooldown_seconds}s"
+                )
+                provider.consecutive_failures = 0
+
+    def request(self, session, method: str, url: str, request_class: str,
+                session_id: Optional[str] = None, **kwargs):
+        """Perform a requests call through the selected provider and record its outcome"""
+        provider, proxies = self.get_proxy(request_class, session_id)
+        start = time.time()
+        try:
+            response = session.request(method, url, proxies=proxies, **kwargs)
+        except Exception:
+            self.record_result(provider, error=True)
+            raise
+        text = ''
+        content_type = response.headers.get('Content-Type', '')
+        if 'text' in content_type or 'html' in content_type:
+            text = response.text
+        self.record_result(provider, time.time() - start, response.status_code, text)
+        return response
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {name: p.get_proxy_stats() for name, p in self.providers.items()}
+
+
+_default_router: Optional[ProxyRouter] = None
+_default_lock = threading.Lock()
+
+
+def get_proxy_router() -> ProxyRouter:
+    """Process-wide router built from the environment"""
+    global _default_router
+    with _default_lock:
+        if _default_router is None:
+            _default_router = ProxyRouter.from_env()
+        return _default_router
@@ -0,0 +1,277 @@
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+SESSION_PATTERN = re.compile(r'-sessid-([^:]+)')
+
+BLOCK_PAGE = (b"<html><head><title>Access Denied</title></head>"
+              b"<body><h1>Access Denied</h1><p>Your IP has been blocked.</p></body></html>")
+RATE_LIMIT_PAGE = b"<html><body><h1>429 Too Many Requests</h1></body></html>"
+SEARCH_PAGE = (b"<html><body><form id='search'><select id='district_id'></select>"
+               b"<img id='captcha-img' src='/captcha'><input id='cpatchaTextBox'></form>"
+               b"<table><tr><td>Showing 1 to 10 of 10 entries</td></tr></table></body></html>")
+
+
+class ExitIPState:
+    def __init__(self, ip: str):
+        self.ip = ip
+        self.requests = 0
+        self.window_start = time.time()
+        self.window_requests = 0
+        self.blocked = False
+
+
+class ProxySimulator:
+    def __init__(self, latency_ms: float = 150, latency_jitter_ms: float = 100,
+                 failure_rate: float = 0.02, rate_limit_per_minute: int = 30,
+                 rate_429_probability: float = 0.0, block_after_requests: Optional[int] = 40,
+                 block_probability: float = 0.005, document_bytes: int = 200 * 1024,
+                 captcha_bytes: int = 4 * 1024, exit_ip_pool: int = 5000,
+                 log_path: Optional[str] = None, seed: Optional[int] = None):
+        """
+        Local stand-in for the residential proxy *and* the IGR site behind it.
+
+        Accepts sessid-style proxy usernames (``user-sessid-<id>``), gives each
+        session a fake exit IP and answers absolute-form HTTP requests itself
+        with configurable latency, connection failures, 429s and block pages.
+
+        Args:
+            latency_ms / latency_jitter_ms: Response delay (uniform jitter added)
+            failure_rate: Probability of dropping the connection without a response
+            rate_limit_per_minute: Requests per exit IP per minute before 429s
+            rate_429_probability: Extra random 429 probability
+            block_after_requests: Exit IPs get a block page after this many requests (None = never)
+            block_probability: Per-request probability an IP becomes blocked
+            document_bytes / captcha_bytes: Body size for /document and /captcha paths
+            exit_ip_pool: Number of distinct fake exit IPs sessions are hashed onto
+            log_path: NDJSON request log (one line per request)
+            seed: Random seed for reproducible runs
+        """
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.failure_rate = failure_rate
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.rate_429_probability = rate_429_probability
+        self.block_after_requests = block_after_requests
+        self.block_probability = block_probability
+        self.document_bytes = document_bytes
+        self.captcha_bytes = captcha_bytes
+        self.exit_ip_pool = exit_ip_pool
+        self.log_path = log_path
+        self.random = random.Random(seed)
+
+        self.exit_ips: Dict[str, ExitIPState] = {}
+        self.stats: Dict[str, int] = {
+            "requests": 0, "ok": 0, "blocked": 0, "rate_limited": 0,
+            "failed": 0, "auth_missing": 0, "bytes_sent": 0,
+        }
+        self._log_file = None
+        self._tasks = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.port: Optional[int] = None
+
+    # ----- lifecycle -----
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        """Run the simulator in a background thread. Returns the listening port."""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, host, port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        if self.log_path:
+            self._log_file = open(self.log_path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=run, name="proxy-simulator", daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info(f"Proxy simulator listening on {host}:{self.port}")
+        return self.port
+
+    def stop(self):
+        if self._loop:
+            async def shutdown():
+                self._server.close()
+                for task in list(self._tasks):
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                await self._server.wait_closed()
+            asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            self._loop = None
+        if self._log_file:
+            self._log_file.close()
+            self._log_file = None
+
+    def proxy_config(self, username: str = 'sim-user', password: str = 'sim') -> Dict[str, str]:
+        """Config dict compatible with EnhancedProxyManager / ProxyProvider"""
+        return {"host": "127.0.0.1", "port": str(self.port), "username": username, "password": password}
+
+    # ----- simulation -----
+
+    def exit_ip_for(self, session: str) -> ExitIPState:
+        digest = int(hashlib.sha1(session.encode('utf-8')).hexdigest(), 16) % self.exit_ip_pool
+        ip = f"10.{(digest >> 16) & 255}.{(digest >> 8) & 255}.{digest & 255}"
+        state = self.exit_ips.get(ip)
+        if state is None:
+            state = self.exit_ips[ip] = ExitIPState(ip)
+        return state
+
+    @staticmethod
+    def _parse_username(head_lines) -> Optional[str]:
+        for line in head_lines:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "proxy-authorization":
+                scheme, _, token = value.strip().partition(" ")
+                if scheme.lower() == "basic":
+                    try:
+                        return base64.b64decode(token).decode('utf-8').split(":", 1)[0]
+                    except Exception:
+                        return None
+        return None
+
+    def _body_for(self, path: str) -> Tuple[bytes, str]:
+        if path.startswith('/captcha'):
+            return self.random.randbytes(self.captcha_bytes), 'image/png'
+        if path.startswith('/document'):
+            return b"%PDF-1.4\n" + self.random.randbytes(self.document_bytes), 'application/pdf'
+        return SEARCH_PAGE, 'text/html'
+
+    def _decide(self, state: ExitIPState) -> str:
+        """Outcome for one request from an exit IP"""
+        now = time.time()
+        if now - state.window_start >= 60:
+            state.window_start = now
+            state.window_requests = 0
+        state.requests += 1
+        state.window_requests += 1
+
+        if self.random.random() < self.failure_rate:
+            return "failed"
+        if not state.blocked:
+            if self.block_after_requests is not None and state.requests > self.block_after_requests:
+                state.blocked = True
+            elif self.random.random() < self.block_probability:
+                state.blocked = True
+        if state.blocked:
+            return "blocked"
+        if state.window_requests > self.rate_limit_per_minute or self.random.random() < self.rate_429_probability:
+            return "rate_limited"
+        return "ok"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                lines = head.decode('latin-1').split("\r\n")
+                method, target, _ = (lines[0].split(" ") + ["", ""])[:3]
+                headers = {l.split(":", 1)[0].strip().lower(): l.split(":", 1)[1].strip()
+                           for l in lines[1:] if ":" in l}
+                length = int(headers.get('content-length', 0) or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                keep_alive = await self._respond(method, target, lines[1:], writer)
+                if not keep_alive:
+                    return
+        except Exception as e:
+            logger.debug(f"Simulator connection error: {e}")
+        finally:
+            self._tasks.discard(task)
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    async def _respond(self, method: str, target: str, header_lines, writer) -> bool:
+        started = time.time()
+        username = self._parse_username(header_lines)
+        self.stats["requests"] += 1
+
+        if method.upper() == "CONNECT":
+            # TLS can't be simulated meaningfully; benchmarks use http:// targets
+            self._write(writer, 501, b"CONNECT not supported by simulator", 'text/plain')
+            return False
+        if not username:
+            self.stats["auth_missing"] += 1
+            self._write(writer, 407, b"Proxy Authentication Required", 'text/plain',
+                        extra={"Proxy-Authenticate": 'Basic realm="simulator"'})
+            self._log(None, None, method, target, 407, started, 0)
+            return False
+
+        match = SESSION_PATTERN.search(username)
+        session = match.group(1) if match else f"rotating-{self.random.random()}"
+        state = self.exit_ip_for(session)
+
+        delay = (self.latency_ms + self.random.uniform(0, self.latency_jitter_ms)) / 1000.0
+        await asyncio.sleep(delay)
+
+        outcome = self._decide(state)
+        self.stats[outcome] += 1
+        if outcome == "failed":
+            self._log(session, state.ip, method, target, 0, started, 0)
+            return False
+        if outcome == "blocked":
+            status, body, ctype = 200, BLOCK_PAGE, 'text/html'
+        elif outcome == "rate_limited":
+            status, body, ctype = 429, RATE_LIMIT_PAGE, 'text/html'
+        else:
+            status = 200
+            body, ctype = self._body_for(urlsplit(target).path or '/')
+
+        self._write(writer, status, body, ctype, extra={"X-Exit-IP": state.ip})
+        await writer.drain()
+        self.stats["bytes_sent"] += len(body)
+        self._log(session, state.ip, method, target, status, started, len(body), outcome)
+        return True
+
+    @staticmethod
+    def _write(writer, status: int, body: bytes, content_type: str, extra: Optional[Dict[str, str]] = None):
+        reasons = {200: "OK", 407: "Proxy Authentication Required", 429: "Too Many Requests",
+                   501: "Not Implemented"}
+        lines = [f"HTTP/1.1 {status} {reasons.get(status, 'OK')}",
+                 f"Content-Type: {content_type}",
+                 f"Content-Length: {len(body)}"]
+        for name, value in (extra or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+
+    def _log(self, session, ip, method, target, status, started, size, outcome=None):
+        if not self._log_file:
+            return
+        entry = {
+            "ts": round(started, 3), "session": session, "exit_ip": ip, "method": method,
+            "url": target, "status": status, "outcome": outcome or ("failed" if status == 0 else None),
+            "latency_ms": round((time.time() - started) * 1000, 1), "bytes": size,
+        }
+        self._log_file.write(json.dumps(entry) + "\n")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats["exit_ips_used"] = len(self.exit_ips)
+        stats["exit_ips_blocked"] = sum(1 for s in self.exit_ips.values() if s.blocked)
+        return stats
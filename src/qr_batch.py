@@ -0,0 +1,205 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+import ipaddress
+from typing import Any, AsyncIterator, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+import requests
+import urllib3
+
+from .bandwidth_tracker import BandwidthTracker, get_bandwidth_tracker
+from .image_loader import MAX_IMAGE_BYTES
+from .proxy_manager import ProxyManager
+from .qr_pipeline import QRPipeline
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+logger = logging.getLogger(__name__)
+
+# Per-request limits so one call can't tie up the decode workers or memory
+MAX_BATCH_ITEMS = int(os.getenv('QR_API_MAX_ITEMS', '50'))
+MAX_BATCH_BYTES = int(float(os.getenv('QR_API_MAX_MB', '25')) * 1024 * 1024)
+MAX_REDIRECTS = 5
+
+
+class BlockedURL(Exception):
+    """Raised for caller-supplied URLs that point at internal or non-public addresses"""
+    pass
+
+
+def check_public_url(url: str):
+    """
+    Refuse URLs the API must not fetch on a caller's behalf: anything other
+    than http(s), and hosts resolving to loopback, private, link-local,
+    reserved, multicast or unspecified addresses (cloud metadata included)
+
+    Raises:
+        BlockedURL: If the URL is not a public http(s) URL
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise BlockedURL(f"not an http(s) URL: {url}")
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError, ValueError) as e:
+        raise BlockedURL(f"cannot resolve {parts.hostname}: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if ip.version == 6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+        if (ip.is_loopback or ip.is_private or ip.is_link_local or ip.is_reserved
+                or ip.is_multicast or ip.is_unspecified or not ip.is_global):
+            raise BlockedURL(f"{parts.hostname} resolves to non-public address {ip}")
+
+
+class QRBatchDecoder:
+    def __init__(self, pipeline: Optional[QRPipeline] = None, proxy_manager: Optional[ProxyManager] = None,
+                 bandwidth_tracker: Optional[BandwidthTracker] = None, max_total_bytes: int = MAX_BATCH_BYTES,
+                 max_image_bytes: int = MAX_IMAGE_BYTES, fetch_concurrency: int = 4):
+        """
+        Decodes a batch of image URLs and uploaded images on the shared decode
+        pool and cache, yielding each result as soon as it is ready.
+
+        Args:
+            pipeline: QR pipeline used for fetching and decoding (default: shared pool and cache)
+            proxy_manager: Proxy for URL downloads
+            bandwidth_tracker: Records download bytes under the 'qr_api' stage
+            max_total_bytes: Bytes of images (uploaded plus downloaded) one batch may process
+            max_image_bytes: Largest single image
+            fetch_concurrency: Concurrent URL downloads per batch
+        """
+        self.proxy_manager = proxy_manager or ProxyManager()
+        self.bandwidth_tracker = bandwidth_tracker or get_bandwidth_tracker()
+        self.pipeline = pipeline or QRPipeline(self.fetch_image, max_image_bytes=max_image_bytes)
+        self.max_total_bytes = max_total_bytes
+        self.max_image_bytes = max_image_bytes
+        self.fetch_concurrency = fetch_concurrency
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'image/avif,image/webp,image/apng,image/*,*/*;q=0.8',
+        }
+
+    def fetch_image(self, image_url: str, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Download a caller-supplied URL, checking it and every redirect target with check_public_url"""
+        self.bandwidth_tracker.enforce(stage='qr_api')
+        for _ in range(MAX_REDIRECTS + 1):
+            check_public_url(image_url)
+            response = requests.get(
+                image_url,
+                proxies=self.proxy_manager.get_proxy(),
+                headers={**self.headers, **(extra_headers or {})},
+                verify=False,
+                timeout=30,
+                stream=True,
+                allow_redirects=False,
+                hooks=self.bandwidth_tracker.hooks('qr_api')
+            )
+            if not response.is_redirect:
+                response.raise_for_status()
+                return response
+            image_url = urljoin(response.url, response.headers['Location'])
+            response.close()
+        raise BlockedURL(f"more than {MAX_REDIRECTS} redirects")
+
+    async def _decode_content(self, content: bytes) -> Dict[str, Any]:
+        cache = self.pipeline.cache
+        content_hash = cache.hash_bytes(content)
+        cached = cache.get(content_hash)
+        if cached is not None:
+            return {"qr_contents": cached, "cached": True, "skipped": None, "error": None}
+        pending = self._inflight.get(content_hash)
+        if pending is None:
+            # Same bytes requested again while decoding (same batch or another one): share the decode
+            pending = self._inflight[content_hash] = asyncio.ensure_future(self._decode_once(content, content_hash))
+            pending.add_done_callback(lambda _: self._inflight.pop(content_hash, None))
+        decoded = await asyncio.shield(pending)
+        return {"qr_contents": decoded["qr_contents"], "cached": False,
+                "skipped": decoded.get("skipped"), "error": decoded["error"]}
+
+    async def _decode_once(self, content: bytes, content_hash: str) -> Dict[str, Any]:
+        decoded = await asyncio.wrap_future(self.pipeline.submit_decode(content))
+        self.pipeline.cascade_stats.record(decoded.get("stages", []))
+        if decoded["error"] is not None:
+            # Details stay in the log; callers only learn that decoding failed
+            logger.error(f"QR decode failed: {decoded['error']}")
+            decoded = {**decoded, "error": "decode failed"}
+        # Finder-check skips are a guess, not a decode result: leave them uncached
+        if decoded["error"] is None and decoded.get("skipped") != "finder":
+            self.pipeline.cache.put(content_hash, decoded["qr_contents"])
+        return decoded
+
+    async def _process(self, index: int, item: Dict[str, Any], budget: Dict[str, int],
+                       fetch_slots: asyncio.Semaphore) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"index": index, "id": item.get("id"), "url": item.get("url"),
+                                  "qr_contents": [], "cached": False, "skipped": None, "error": None}
+        try:
+            content = item.get("content")
+            if content is None:
+                try:
+                    await asyncio.to_thread(check_public_url, item["url"])
+                except BlockedURL as e:
+                    logger.warning(f"Refused QR API URL: {e}")
+                    result["error"] = "url not allowed"
+                    return result
+                async with fetch_slots:
+                    if budget["used"] >= self.max_total_bytes:
+                        result["error"] = "batch byte limit reached"
+                        return result
+                    content, cached, skipped = await asyncio.to_thread(self.pipeline.fetch_one, item["url"])
+                if cached is not None:
+                    result.update(qr_contents=cached, cached=True)
+                    return result
+                if skipped:
+                    result["skipped"] = skipped
+                    return result
+                if content is None:
+                    result["error"] = "download failed"
+                    return result
+                budget["used"] += len(content)
+            elif len(content) > self.max_image_bytes:
+                result["skipped"] = "too_large"
+                return result
+            result.update(await self._decode_content(content))
+        except Exception as e:
+            logger.error(f"QR API item {index} failed: {e}")
+            result["error"] = "internal error"
+        finally:
+            result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def decode_stream(self, items: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Decode a batch, yielding {"index", "id", "url", "qr_contents", "cached",
+        "skipped", "error", "ms"} per item in completion order, then a summary
+        {"done": True, ...}.
+
+        Args:
+            items: [{"url": ...} or {"content": bytes}, optionally with "id"]
+        """
+        started = time.perf_counter()
+        # Uploads count against the byte budget up front; downloads as they arrive.
+        # Downloads already in flight may finish past the limit (at most
+        # fetch_concurrency * max_image_bytes over)
+        budget = {"used": sum(len(item["content"]) for item in items if item.get("content") is not None)}
+        fetch_slots = asyncio.Semaphore(self.fetch_concurrency)
+        tasks = [asyncio.create_task(self._process(index, item, budget, fetch_slots))
+                 for index, item in enumerate(items)]
+        with_qr = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                with_qr += int(bool(result["qr_contents"]))
+                failed += int(result["error"] is not None)
+                yield result
+        finally:
+            # Client went away mid-stream: don't keep downloading for nobody
+            for task in tasks:
+                task.cancel()
+        yield {"done": True, "items": len(items), "with_qr": with_qr, "failed": failed,
+               "bytes": budget["used"], "seconds": round(time.perf_counter() - started, 3)}
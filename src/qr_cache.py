@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class QRDecodeCache:
+    def __init__(self, db_path: Optional[str] = None, memory_entries: int = 2048,
+                 max_db_bytes: Optional[int] = None):
+        """
+        Decode results keyed by the SHA-256 of the image bytes, so the same
+        logo/stamp/QR behind different URLs is only decoded once. A second
+        table maps URL -> (hash, ETag, Last-Modified) so unchanged images can be
+        revalidated with a conditional request instead of downloaded again.
+
+        Args:
+            db_path: SQLite file for the persistent tier (QR_CACHE_DB, "" = memory only)
+            memory_entries: Size of the in-memory LRU tier
+            max_db_bytes: Evict least recently used rows above this size (QR_CACHE_MAX_MB, default 64)
+        """
+        if db_path is None:
+            db_path = os.getenv('QR_CACHE_DB', os.path.join('data', 'qr_cache.sqlite'))
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.max_db_bytes = max_db_bytes or int(float(os.getenv('QR_CACHE_MAX_MB', '64')) * 1024 * 1024)
+        self._memory: 'OrderedDict[str, List[str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "revalidated": 0, "stores": 0, "evicted": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            try:
+                directory = os.path.dirname(db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS decodes ("
+                    "hash TEXT PRIMARY KEY, qr_contents TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS decodes_last_used ON decodes(last_used)")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS urls ("
+                    "url TEXT PRIMARY KEY, hash TEXT NOT NULL, etag TEXT, last_modified TEXT, updated REAL NOT NULL)"
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"QR cache database unavailable ({e}), using memory only")
+                self._db = None
+
+    @staticmethod
+    def hash_bytes(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    def _remember(self, content_hash: str, qr_contents: List[str]):
+        self._memory[content_hash] = qr_contents
+        self._memory.move_to_end(content_hash)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, content_hash: str) -> Optional[List[str]]:
+        """Cached QR contents for an image hash ([] = decoded, no QR), or None"""
+        with self._lock:
+            if content_hash in self._memory:
+                self._memory.move_to_end(content_hash)
+                self.stats["memory_hits"] += 1
+                return self._memory[content_hash]
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT qr_contents FROM decodes WHERE hash = ?",
+                                           (content_hash,)).fetchone()
+                    if row:
+                        self._db.execute("UPDATE decodes SET last_used = ? WHERE hash = ?",
+                                         (time.time(), content_hash))
+                        self._db.commit()
+                        qr_contents = json.loads(row[0])
+                        self._remember(content_hash, qr_contents)
+                        self.stats["disk_hits"] += 1
+                        return qr_contents
+                except sqlite3.Error as e:
+                    logger.warning(f"QR cache read failed: {e}")
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, content_hash: str, qr_contents: List[str]):
+        with self._lock:
+            self._remember(content_hash, qr_contents)
+            self.stats["stores"] += 1
+            if self._db is None:
+                return
+            payload = json.dumps(qr_contents)
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO decodes (hash, qr_contents, size, last_used) VALUES (?, ?, ?, ?)",
+                    (content_hash, payload, len(content_hash) + len(payload), time.time())
+                )
+                self._db.commit()
+                self._puts_since_evict += 1
+                if self._puts_since_evict >= 100:
+                    self._puts_since_evict = 0
+                    self._evict()
+            except sqlite3.Error as e:
+                logger.warning(f"QR cache write failed: {e}")
+
+    def _evict(self):
+        """Drop least recently used rows until the table is back under 90% of max_db_bytes"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM decodes").fetchone()[0]
+        if total <= self.max_db_bytes:
+            return
+        target = total - int(self.max_db_bytes * 0.9)
+        freed = 0
+        evicted = []
+        for content_hash, size in self._db.execute("SELECT hash, size FROM decodes ORDER BY last_used"):
+            evicted.append((content_hash,))
+            freed += size
+            if freed >= target:
+                break
+        self._db.executemany("DELETE FROM decodes WHERE hash = ?", evicted)
+        self._db.executemany("DELETE FROM urls WHERE hash = ?", evicted)
+        self._db.commit()
+        self.stats["evicted"] += len(evicted)
+        logger.info(f"QR cache evicted {len(evicted)} entries ({freed} bytes)")
+
+    def url_validators(self, url: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """(hash, etag, last_modified) last seen for a URL, if any"""
+        if self._db is None:
+            return None
+        with self._lock:
+            try:
+                return self._db.execute("SELECT hash, etag, last_modified FROM urls WHERE url = ?",
+                                        (url,)).fetchone()
+            except sqlite3.Error:
+                return None
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for a previously seen URL"""
+        validators = self.url_validators(url)
+        headers = {}
+        if validators:
+            _, etag, last_modified = validators
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def remember_url(self, url: str, content_hash: str, etag: Optional[str] = None,
+                     last_modified: Optional[str] = None):
+        if self._db is None or not (etag or last_modified):
+            return
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO urls (url, hash, etag, last_modified, updated) VALUES (?, ?, ?, ?, ?)",
+                    (url, content_hash, etag, last_modified, time.time())
+                )
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"QR cache URL write failed: {e}")
+
+    def revalidated(self, url: str) -> Optional[List[str]]:
+        """Cached result for a URL the server answered 304 Not Modified for"""
+        validators = self.url_validators(url)
+        if not validators:
+            return None
+        qr_contents = self.get(validators[0])
+        if qr_contents is not None:
+            with self._lock:
+                self.stats["revalidated"] += 1
+        return qr_contents
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else None
+        return stats
+
+
+_default_cache: Optional[QRDecodeCache] = None
+_default_lock = threading.Lock()
+
+
+def get_qr_cache() -> QRDecodeCache:
+    """Process-wide cache shared by all QR scrapers"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = QRDecodeCache()
+        return _default_cache
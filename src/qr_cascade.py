@@ -0,0 +1,153 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+from pyzbar.pyzbar import decode
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+def _unique(values: List[str]) -> List[str]:
+    seen = []
+    for value in values:
+        if value and value not in seen:
+            seen.append(value)
+    return seen
+
+
+def _pyzbar(gray: np.ndarray) -> List[str]:
+    return _unique([obj.data.decode('utf-8', errors='replace') for obj in decode(gray)])
+
+
+def _opencv_multi(gray: np.ndarray) -> List[str]:
+    found, decoded_info, _, _ = cv2.QRCodeDetector().detectAndDecodeMulti(gray)
+    return _unique(list(decoded_info)) if found else []
+
+
+def _binarized(gray: np.ndarray) -> np.ndarray:
+    # Adaptive threshold handles stamps/shadows that a global threshold washes out
+    block = max(11, (min(gray.shape[:2]) // 20) | 1)
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 5)
+
+
+def _upscaled(gray: np.ndarray) -> np.ndarray:
+    factor = 2 if max(gray.shape[:2]) >= 600 else 3
+    return cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
+
+
+# Fast decoders on the image as-is, tried first
+PRIMARY_STAGES: Dict[str, Callable[[np.ndarray], List[str]]] = {
+    "pyzbar_gray": _pyzbar,
+}
+# Retries on preprocessed copies, only after every primary stage missed
+RETRY_STAGES: Dict[str, Callable[[np.ndarray], List[str]]] = {}
+
+if CV2_AVAILABLE:
+    PRIMARY_STAGES["opencv_multi"] = _opencv_multi
+    RETRY_STAGES["pyzbar_binarized"] = lambda gray: _pyzbar(_binarized(gray))
+    RETRY_STAGES["pyzbar_upscaled"] = lambda gray: _pyzbar(_upscaled(gray))
+    RETRY_STAGES["opencv_upscaled"] = lambda gray: _opencv_multi(_upscaled(gray))
+
+DEFAULT_ORDER = list(PRIMARY_STAGES) + list(RETRY_STAGES)
+
+
+def run_cascade(image: Image.Image, order: Optional[List[str]] = None) -> Tuple[List[str], List[Tuple[str, float, bool]]]:
+    """
+    Try decoders in order until one finds a QR code
+
+    Returns:
+        (QR contents, [(stage, seconds, hit), ...] for every stage that ran)
+    """
+    gray = np.asarray(image if image.mode == 'L' else image.convert('L'))
+    stages = []
+    for name in order or DEFAULT_ORDER:
+        decoder = PRIMARY_STAGES.get(name) or RETRY_STAGES.get(name)
+        if decoder is None:
+            continue
+        start = time.perf_counter()
+        try:
+            qr_data = decoder(gray)
+        except Exception as e:
+            logger.debug(f"QR decoder {name} failed: {e}")
+            qr_data = []
+        stages.append((name, time.perf_counter() - start, bool(qr_data)))
+        if qr_data:
+            return qr_data, stages
+    return [], stages
+
+
+class CascadeStats:
+    def __init__(self, min_samples: int = 20):
+        """
+        Per-stage timing and hit counts, used to order the cascade: within the
+        primary and the retry group, stages with the lowest expected time per
+        hit run first once they have min_samples attempts.
+        """
+        self.min_samples = min_samples
+        self.stages: Dict[str, Dict[str, float]] = {
+            name: {"attempts": 0, "hits": 0, "seconds": 0.0} for name in DEFAULT_ORDER
+        }
+        self.images = 0
+        self.decoded = 0
+        self._lock = threading.Lock()
+
+    def record(self, stages: List[Tuple[str, float, bool]]):
+        if not stages:
+            return
+        with self._lock:
+            self.images += 1
+            self.decoded += int(any(hit for _, _, hit in stages))
+            for name, seconds, hit in stages:
+                stage = self.stages.setdefault(name, {"attempts": 0, "hits": 0, "seconds": 0.0})
+                stage["attempts"] += 1
+                stage["hits"] += int(hit)
+                stage["seconds"] += seconds
+
+    def _cost(self, name: str) -> float:
+        stage = self.stages[name]
+        if stage["attempts"] < self.min_samples:
+            return -1.0  # keep the default position until there is data
+        hit_rate = (stage["hits"] + 1) / (stage["attempts"] + 2)
+        return (stage["seconds"] / stage["attempts"]) / hit_rate
+
+    def order(self) -> List[str]:
+        with self._lock:
+            primary = sorted(PRIMARY_STAGES, key=lambda n: (self._cost(n), DEFAULT_ORDER.index(n)))
+            retries = sorted(RETRY_STAGES, key=lambda n: (self._cost(n), DEFAULT_ORDER.index(n)))
+        return primary + retries
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                attempts = stage["attempts"]
+                stages[name] = {
+                    "attempts": attempts,
+                    "hits": stage["hits"],
+                    "hit_rate": round(stage["hits"] / attempts, 3) if attempts else None,
+                    "avg_ms": round(stage["seconds"] / attempts * 1000, 2) if attempts else None,
+                }
+            images, decoded = self.images, self.decoded
+        return {"images": images, "decoded": decoded, "stages": stages, "order": self.order()}
+
+
+_default_stats: Optional[CascadeStats] = None
+_default_lock = threading.Lock()
+
+
+def get_cascade_stats() -> CascadeStats:
+    """Process-wide stage statistics (decode workers report back to the parent)"""
+    global _default_stats
+    with _default_lock:
+        if _default_stats is None:
+            _default_stats = CascadeStats()
+        return _default_stats
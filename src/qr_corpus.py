@@ -0,0 +1,147 @@
+import os
+import json
+import random
+import logging
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VERSIONS = [1, 4, 10, 20]
+CORRECTION_LEVELS = {
+    "L": cv2.QRCODE_ENCODER_CORRECT_LEVEL_L,
+    "M": cv2.QRCODE_ENCODER_CORRECT_LEVEL_M,
+    "Q": cv2.QRCODE_ENCODER_CORRECT_LEVEL_Q,
+    "H": cv2.QRCODE_ENCODER_CORRECT_LEVEL_H,
+}
+# Byte-mode capacity at level H, so any payload of this length fits every level
+BYTE_CAPACITY_H = {1: 7, 4: 34, 10: 119, 20: 382}
+MODULE_PIXELS = [2, 3, 6]
+NOISE_SIGMAS = [0, 12]
+ROTATIONS = [0, 8, 90]
+FORMATS = [("png", None), ("jpg", 90), ("jpg", 40)]
+
+PAYLOAD_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/-"
+
+
+def _payload(rng: random.Random, version: int) -> str:
+    length = max(4, int(BYTE_CAPACITY_H[version] * 0.8))
+    prefix = "IGR/"
+    return prefix + ''.join(rng.choice(PAYLOAD_ALPHABET) for _ in range(length - len(prefix)))
+
+
+def _document_background(rng: random.Random, width: int, height: int) -> np.ndarray:
+    """Off-white page with text lines, table rules and a stamp, like a scanned IGR document"""
+    page = np.full((height, width), rng.randint(225, 250), dtype=np.uint8)
+    y = 40
+    while y < height - 20:
+        if rng.random() < 0.15:
+            cv2.line(page, (30, y), (width - 30, y), 60, 1)
+        else:
+            words = ' '.join(''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+                             for _ in range(rng.randint(4, 12)))
+            cv2.putText(page, words, (30, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, rng.randint(20, 80), 1, cv2.LINE_AA)
+        y += rng.randint(18, 30)
+    if rng.random() < 0.5:
+        center = (rng.randint(80, width - 80), rng.randint(80, height - 80))
+        cv2.circle(page, center, rng.randint(35, 60), rng.randint(90, 140), 2)
+    return page
+
+
+def _qr_image(payload: str, version: int, level: str, module_pixels: int) -> np.ndarray:
+    params = cv2.QRCodeEncoder.Params()
+    params.version = version
+    params.correction_level = CORRECTION_LEVELS[level]
+    qr = cv2.QRCodeEncoder.create(params).encode(payload)
+    qr = cv2.resize(qr, None, fx=module_pixels, fy=module_pixels, interpolation=cv2.INTER_NEAREST)
+    quiet = 4 * module_pixels
+    return cv2.copyMakeBorder(qr, quiet, quiet, quiet, quiet, cv2.BORDER_CONSTANT, value=255)
+
+
+def _rotate(image: np.ndarray, angle: int, fill: int) -> np.ndarray:
+    if angle == 0:
+        return image
+    if angle == 90:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    height, width = image.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width, new_height = int(height * sin + width * cos), int(height * cos + width * sin)
+    matrix[0, 2] += new_width / 2 - width / 2
+    matrix[1, 2] += new_height / 2 - height / 2
+    return cv2.warpAffine(image, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR, borderValue=fill)
+
+
+def _encode(image: np.ndarray, fmt: str, quality: Optional[int]) -> bytes:
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if fmt == 'jpg' else []
+    ok, buffer = cv2.imencode('.' + fmt, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode {fmt} image")
+    return buffer.tobytes()
+
+
+def generate_corpus(directory: str, count: int = 200, seed: int = 42,
+                    negative_ratio: float = 0.2) -> List[Dict[str, Any]]:
+    """
+    Write a deterministic corpus of document-like images, most carrying one QR
+    code, and return its manifest. An existing corpus with the same parameters
+    is reused.
+
+    Args:
+        directory: Output folder (manifest.json plus the images)
+        count: Number of images
+        seed: Random seed; the same seed always produces the same corpus
+        negative_ratio: Share of images without a QR code (for false-positive and pre-filter checks)
+
+    Returns:
+        [{file, qr_contents, version, level, module_pixels, noise, rotation, format, quality}, ...]
+    """
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            existing = json.load(f)
+        if existing.get("seed") == seed and existing.get("count") == count \
+                and existing.get("negative_ratio") == negative_ratio:
+            return existing["images"]
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    noise = np.random.default_rng(seed)
+    images = []
+    for index in range(count):
+        width, height = rng.choice([(850, 1100), (1240, 1754)])
+        page = _document_background(rng, width, height)
+        fmt, quality = rng.choice(FORMATS)
+        entry: Dict[str, Any] = {"qr_contents": [], "format": fmt, "quality": quality}
+
+        if rng.random() >= negative_ratio:
+            version = rng.choice(VERSIONS)
+            level = rng.choice(list(CORRECTION_LEVELS))
+            module_pixels = rng.choice(MODULE_PIXELS)
+            rotation = rng.choice(ROTATIONS)
+            payload = _payload(rng, version)
+            qr = _rotate(_qr_image(payload, version, level, module_pixels), rotation, int(page[0, 0]))
+            top = rng.randint(10, height - qr.shape[0] - 10)
+            left = rng.randint(10, width - qr.shape[1] - 10)
+            page[top:top + qr.shape[0], left:left + qr.shape[1]] = qr
+            entry.update({"qr_contents": [payload], "version": version, "level": level,
+                          "module_pixels": module_pixels, "rotation": rotation,
+                          "box": [left, top, qr.shape[1], qr.shape[0]]})
+
+        sigma = rng.choice(NOISE_SIGMAS)
+        if sigma:
+            page = np.clip(page.astype(np.int16) + noise.normal(0, sigma, page.shape).astype(np.int16),
+                           0, 255).astype(np.uint8)
+        entry["noise"] = sigma
+
+        entry["file"] = f"qr_{index:04d}.{fmt}"
+        with open(os.path.join(directory, entry["file"]), 'wb') as f:
+            f.write(_encode(page, fmt, quality))
+        images.append(entry)
+
+    with open(manifest_path, 'w') as f:
+        json.dump({"seed": seed, "count": count, "negative_ratio": negative_ratio, "images": images}, f, indent=2)
+    logger.info(f"Generated QR corpus of {count} images in {directory}")
+    return images
@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+from .enhanced_qr_scraper import EnhancedQRScraper
+from .identity import httpx_proxy_kwargs
+
+logger = logging.getLogger(__name__)
+
+# Links that are never HTML pages
+SKIP_LINK_EXTENSIONS = (
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg', '.ico', '.zip', '.rar',
+    '.doc', '.docx', '.xls', '.xlsx', '.csv', '.mp4', '.mp3', '.css', '.js', '.xml', '.json',
+)
+PAGINATION_TEXT = re.compile(r'^\s*(next|next page|more|older|›|»|>|>>|\d{1,4})\s*$', re.IGNORECASE)
+PAGINATION_CONTAINER = re.compile(r'pagination|paginate|pager|page-nav|paging', re.IGNORECASE)
+
+
+def normalize_url(url: str) -> str:
+    """Drop the fragment and default ports so the same page isn't crawled twice"""
+    parts = urlsplit(url)
+    netloc = parts.netloc.lower()
+    if (parts.scheme == 'http' and netloc.endswith(':80')) or (parts.scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path or '/', parts.query, ''))
+
+
+def is_pagination_link(link) -> bool:
+    if 'next' in (link.get('rel') or []):
+        return True
+    for parent in link.parents:
+        classes = ' '.join(parent.get('class') or []) + ' ' + (parent.get('id') or '')
+        if PAGINATION_CONTAINER.search(classes):
+            return True
+        if parent.name in ('body', 'html'):
+            break
+    return bool(PAGINATION_TEXT.match(link.get_text() or '')) and 'page' in (link.get('href') or '').lower()
+
+
+class QRCrawler:
+    def __init__(self, scraper: Optional[EnhancedQRScraper] = None, max_depth: int = 2, max_pages: int = 1000,
+                 allowed_domains: Optional[Iterable[str]] = None, page_concurrency: int = 4,
+                 per_host_limit: int = 2, include_patterns: Optional[List[str]] = None,
+                 exclude_patterns: Optional[List[str]] = None, output_path: Optional[str] = None,
+                 timeout: float = 30):
+        """
+        Asynchronous multi-page QR crawler. Pages are fetched with httpx under
+        per-host limits; each page's images go through the scraper's QR
+        pipeline (prefilter, cache, process-pool decode) and every page is
+        written to an NDJSON file as soon as it is done.
+
+        Args:
+            scraper: EnhancedQRScraper providing headers, cookies, proxy, rate governor and QR pipeline
+            max_depth: Link depth to follow from the start URLs (pagination links don't add depth)
+            max_pages: Stop after this many pages
+            allowed_domains: Hosts to stay on (default: hosts of the start URLs, subdomains included)
+            page_concurrency: Pages processed at the same time
+            per_host_limit: Concurrent page requests per host
+            include_patterns: Only follow links matching one of these regexes
+            exclude_patterns: Never follow links matching one of these regexes
+            output_path: NDJSON output (default data/crawls/qr_crawl_<timestamp>.ndjson)
+            timeout: Page request timeout in seconds
+        """
+        self.scraper = scraper or EnhancedQRScraper()
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.allowed_domains: Set[str] = {d.lower() for d in (allowed_domains or [])}
+        self.page_concurrency = page_concurrency
+        self.per_host_limit = per_host_limit
+        self.include_patterns = [re.compile(p) for p in (include_patterns or [])]
+        self.exclude_patterns = [re.compile(p) for p in (exclude_patterns or [])]
+        self.output_path = output_path or os.path.join(
+            'data', 'crawls', f"qr_crawl_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+        )
+        self.timeout = timeout
+
+        self._seen: Set[str] = set()
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._output = None
+        self.stats: Dict[str, Any] = {
+            "pages": 0, "failed": 0, "captcha": 0, "skipped_non_html": 0,
+            "images_with_qr": 0, "qr_codes": 0, "queued": 0,
+        }
+
+    # ----- frontier -----
+
+    def _allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            return False
+        host = (parts.hostname or '').lower()
+        if self.allowed_domains and not any(host == d or host.endswith('.' + d) for d in self.allowed_domains):
+            return False
+        if parts.path.lower().endswith(SKIP_LINK_EXTENSIONS):
+            return False
+        if self.include_patterns and not any(p.search(url) for p in self.include_patterns):
+            return False
+        if any(p.search(url) for p in self.exclude_patterns):
+            return False
+        return True
+
+    def _enqueue(self, url: str, depth: int, referer: Optional[str]) -> bool:
+        url = normalize_url(url)
+        if url in self._seen or len(self._seen) >= self.max_pages or not self._allowed(url):
+            return False
+        self._seen.add(url)
+        self.stats["queued"] += 1
+        self._queue.put_nowait((url, depth, referer))
+        return True
+
+    def extract_links(self, soup: BeautifulSoup, base_url: str) -> List[Tuple[str, bool]]:
+        """[(absolute url, is pagination link)] for every <a href> on the page"""
+        links = []
+        for link in soup.find_all('a', href=True):
+            href = link['href'].strip()
+            if not href or href.startswith(('#', 'javascript:', 'mailto:', 'tel:')):
+                continue
+            links.append((urljoin(base_url, href), is_pagination_link(link)))
+        return links
+
+    # ----- fetching -----
+
+    def _slot_for(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[host]
+
+    def _client(self) -> httpx.AsyncClient:
+        proxies = self.scraper.proxy_manager.get_proxy() or {}
+        proxy_url = proxies.get('https') or proxies.get('http')
+        headers = {k: v for k, v in self.scraper.headers.items() if k != 'Referer'}
+        limits = httpx.Limits(max_connections=self.page_concurrency * 2,
+                              max_keepalive_connections=self.page_concurrency)
+        return httpx.AsyncClient(headers=headers, cookies=httpx.Cookies(self.scraper.session.cookies),
+                                 verify=False, follow_redirects=True, timeout=self.timeout,
+                                 limits=limits, **httpx_proxy_kwargs(proxy_url))
+
+    async def _fetch_page(self, client: httpx.AsyncClient, url: str, referer: Optional[str]) -> httpx.Response:
+        bandwidth = self.scraper.bandwidth_tracker
+        bandwidth.enforce(stage='page')
+        await asyncio.to_thread(self.scraper.rate_governor.acquire, url)
+        async with self._slot_for(url):
+            headers = {'Referer': referer} if referer else {}
+            response = await client.get(url, headers=headers)
+        bandwidth.record('page', request_bytes=len(url) + 200, response_bytes=len(response.content),
+                         decoded_bytes=len(response.content))
+        return response
+
+    def _sync_cookies(self, client: httpx.AsyncClient):
+        """Image requests use the scraper's requests session; give it the crawl's cookies"""
+        for cookie in client.cookies.jar:
+            self.scraper.session.cookies.set_cookie(cookie)
+
+    # ----- crawl -----
+
+    def _write(self, record: Dict[str, Any]):
+        self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._output.flush()
+
+    async def _process(self, client: httpx.AsyncClient, url: str, depth: int, referer: Optional[str]):
+        started = time.time()
+        record: Dict[str, Any] = {"url": url, "depth": depth, "referer": referer}
+        try:
+            response = await self._fetch_page(client, url, referer)
+            record["status"] = response.status_code
+            response.raise_for_status()
+            if 'html' not in response.headers.get('Content-Type', 'text/html').lower():
+                self.stats["skipped_non_html"] += 1
+                return
+
+            soup = BeautifulSoup(response.text, 'html.parser')
+            if self.scraper.detect_captcha(soup):
+                # Nothing can be scanned behind a CAPTCHA; report it and move on
+                self.stats["captcha"] += 1
+                record["captcha"] = True
+            else:
+                self._sync_cookies(client)
+                results = await asyncio.to_thread(self.scraper.qr_pipeline.run_page, soup, str(response.url))
+                record["qr"] = results
+                self.stats["images_with_qr"] += len(results)
+                self.stats["qr_codes"] += sum(len(r['qr_contents']) for r in results)
+
+            for link, pagination in self.extract_links(soup, str(response.url)):
+                if pagination:
+                    self._enqueue(link, depth, url)
+                elif depth < self.max_depth:
+                    self._enqueue(link, depth + 1, url)
+            self.stats["pages"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            record["error"] = str(e)
+            logger.warning(f"Crawl failed for {url}: {e}")
+        finally:
+            record["elapsed_ms"] = round((time.time() - started) * 1000)
+            if "status" in record or "error" in record:
+                self._write(record)
+
+    async def _worker(self, client: httpx.AsyncClient):
+        while True:
+            url, depth, referer = await self._queue.get()
+            try:
+                await self._process(client, url, depth, referer)
+            finally:
+                self._queue.task_done()
+
+    async def crawl(self, start_urls: List[str]) -> Dict[str, Any]:
+        """Crawl from the start URLs until the frontier is empty or max_pages is reached"""
+        if not self.allowed_domains:
+            self.allowed_domains = {(urlsplit(u).hostname or '').lower() for u in start_urls}
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        started = time.time()
+        self._queue = asyncio.Queue()
+        for url in start_urls:
+            self._enqueue(url, 0, None)
+
+        with open(self.output_path, 'a', encoding='utf-8') as self._output:
+            async with self._client() as client:
+                workers = [asyncio.create_task(self._worker(client)) for _ in range(self.page_concurrency)]
+                await self._queue.join()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                self._sync_cookies(client)
+
+        elapsed = time.time() - started
+        self.stats["elapsed_seconds"] = round(elapsed, 2)
+        self.stats["pages_per_hour"] = round(self.stats["pages"] / elapsed * 3600) if elapsed else 0
+        self.stats["output"] = self.output_path
+        return self.stats
+
+    def run(self, start_urls: List[str]) -> Dict[str, Any]:
+        """Blocking wrapper around crawl()"""
+        return asyncio.run(self.crawl(start_urls))
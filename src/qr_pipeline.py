@@ -0,0 +1,397 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from .image_loader import MAX_IMAGE_BYTES, ImageTooLarge, check_pixels, load_grayscale
+from .qr_cache import QRDecodeCache, get_qr_cache
+from .qr_cascade import CascadeStats, get_cascade_stats, run_cascade
+from .qr_prefilter import HEADER_BYTES, QRPrefilter, dimensions_from_header, may_contain_qr
+from .qr_roi_cache import ROI_CACHE_ENABLED, get_roi_cache
+
+logger = logging.getLogger(__name__)
+
+# Skip the decoder cascade for images without finder patterns
+FINDER_CHECK = os.getenv('QR_FINDER_CHECK', 'true').lower() == 'true'
+
+
+def decode_qr_bytes(content: bytes, order: Optional[List[str]] = None, templates: bool = False) -> Dict[str, Any]:
+    """
+    Decode QR codes from raw image bytes. Runs in the decode worker processes,
+    so it only takes and returns picklable values.
+
+    Args:
+        content: Image bytes
+        order: Decoder cascade order (stage names); defaults to qr_cascade.DEFAULT_ORDER
+        templates: The image is a document page; try its template's learned QR regions first
+
+    Returns:
+        {"qr_contents": [...], "seconds": decode time, "error": message or None,
+         "skipped": "finder" if the finder-pattern check ruled the image out,
+         "stages": [(stage, seconds, hit), ...],
+         "roi": "hit"/"miss"/"learned" for known or newly learned templates, else None}
+    """
+    start = time.perf_counter()
+    try:
+        # Grayscale, JPEGs at reduced DCT scale, bombs rejected before decoding
+        image, reduced = load_grayscale(content)
+
+        # Known document template: decode just where its QR codes usually are
+        roi_status, lookup = None, None
+        if templates and ROI_CACHE_ENABLED:
+            roi_cache = get_roi_cache()
+            qr_data, lookup = roi_cache.decode(image, order)
+            if qr_data:
+                return {"qr_contents": qr_data, "seconds": time.perf_counter() - start, "error": None,
+                        "skipped": None, "stages": [], "roi": "hit"}
+            roi_status = "miss" if lookup["regions"] else None
+
+        if FINDER_CHECK and not may_contain_qr(image):
+            return {"qr_contents": [], "seconds": time.perf_counter() - start, "error": None,
+                    "skipped": "finder", "stages": [], "roi": roi_status}
+
+        qr_data, stages = run_cascade(image, order)
+        if not qr_data and reduced:
+            # Finder patterns are there but the code may be too small at reduced scale
+            image, _ = load_grayscale(content, max_side=None)
+            qr_data, full_stages = run_cascade(image, order)
+            stages += full_stages
+        if qr_data and lookup is not None and roi_cache.learn(image, lookup, codes=len(qr_data)):
+            roi_status = "learned"
+        return {"qr_contents": qr_data, "seconds": time.perf_counter() - start, "error": None,
+                "skipped": None, "stages": stages, "roi": roi_status}
+    except ImageTooLarge:
+        return {"qr_contents": [], "seconds": time.perf_counter() - start, "error": None,
+                "skipped": "too_large", "stages": []}
+    except Exception as e:
+        return {"qr_contents": [], "seconds": time.perf_counter() - start, "error": str(e),
+                "skipped": None, "stages": []}
+
+
+def decode_document_bytes(content: bytes, order: Optional[List[str]] = None) -> Dict[str, Any]:
+    """decode_qr_bytes for document page images (QRPipeline decoder with the template ROI cache)"""
+    return decode_qr_bytes(content, order, templates=True)
+
+
+_decode_pool: Optional[ProcessPoolExecutor] = None
+_decode_pool_lock = threading.Lock()
+
+
+def get_decode_pool() -> ProcessPoolExecutor:
+    """Process pool shared by all scrapers in this process (QR_DECODE_WORKERS)"""
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            workers = int(os.getenv('QR_DECODE_WORKERS', '0')) or max(1, (os.cpu_count() or 2) - 1)
+            _decode_pool = ProcessPoolExecutor(max_workers=workers)
+        return _decode_pool
+
+
+def _reset_decode_pool():
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is not None:
+            _decode_pool.shutdown(wait=False)
+        _decode_pool = None
+
+
+class _StageStats:
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.bytes = 0
+        self.busy_seconds = 0.0
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+        self.lock = threading.Lock()
+
+    def add(self, started: float, ended: float, busy: float, size: int = 0, failed: bool = False):
+        with self.lock:
+            self.count += 1
+            self.failed += int(failed)
+            self.bytes += size
+            self.busy_seconds += busy
+            self.first_start = started if self.first_start is None else min(self.first_start, started)
+            self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    def as_dict(self) -> Dict[str, Any]:
+        wall = (self.last_end - self.first_start) if self.count else 0.0
+        return {
+            "count": self.count,
+            "failed": self.failed,
+            "bytes": self.bytes,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wall_seconds": round(wall, 3),
+            "images_per_second": round(self.count / wall, 2) if wall > 0 else None,
+        }
+
+
+class QRPipeline:
+    def __init__(self, fetch: Callable[[str, Dict[str, str]], Any], fetch_workers: Optional[int] = None,
+                 per_host_limit: Optional[int] = None, decoder: Callable[[bytes], Dict[str, Any]] = decode_qr_bytes,
+                 decode_pool: Optional[ProcessPoolExecutor] = None, cache: Optional[QRDecodeCache] = None,
+                 prefilter: Optional[QRPrefilter] = None, cascade_stats: Optional[CascadeStats] = None,
+                 max_image_bytes: int = MAX_IMAGE_BYTES):
+        """
+        Two-stage image pipeline: a thread pool downloads images concurrently
+        (bounded per host) and hands each body to a process pool for decoding
+        as soon as it arrives. Images already decoded (same bytes, or a 304 on
+        a URL seen before) are answered from the decode cache, and images whose
+        tag or header dimensions rule out a QR code are never fully downloaded.
+
+        Args:
+            fetch: fetch(url, extra_headers) returns a streamed (stream=True) requests.Response
+            fetch_workers: Concurrent downloads in total (QR_FETCH_WORKERS, default 8)
+            per_host_limit: Concurrent downloads per host (QR_FETCH_PER_HOST, default 4)
+            decoder: Picklable decoder(content, order) run in the process pool on the image bytes
+            decode_pool: Process pool to use; defaults to the shared get_decode_pool()
+            cache: Decode cache; defaults to the shared get_qr_cache()
+            prefilter: Tag/dimension checks; defaults to QRPrefilter()
+            cascade_stats: Decoder stage statistics that pick the cascade order; defaults to get_cascade_stats()
+            max_image_bytes: Abort downloads larger than this (QR_MAX_IMAGE_MB)
+        """
+        self.fetch = fetch
+        self.fetch_workers = fetch_workers or int(os.getenv('QR_FETCH_WORKERS', '8'))
+        self.per_host_limit = per_host_limit or int(os.getenv('QR_FETCH_PER_HOST', '4'))
+        self.decoder = decoder
+        self.decode_pool = decode_pool
+        self.cache = cache or get_qr_cache()
+        self.prefilter = prefilter or QRPrefilter()
+        self.cascade_stats = cascade_stats or get_cascade_stats()
+        self.max_image_bytes = max_image_bytes
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+        self.last_stats: Dict[str, Any] = {}
+
+    def _slot_for(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    def submit_decode(self, content: bytes) -> Future:
+        """Decode image bytes on the process pool with the current cascade order"""
+        pool = self.decode_pool or get_decode_pool()
+        order = self.cascade_stats.order()
+        try:
+            return pool.submit(self.decoder, content, order)
+        except (BrokenProcessPool, RuntimeError) as e:
+            # Pool died (worker killed) or was shut down; decode inline rather than lose the image
+            logger.warning(f"Decode pool unavailable ({e}), decoding on the calling thread")
+            if self.decode_pool is None:
+                _reset_decode_pool()
+            future = Future()
+            future.set_result(self.decoder(content, order))
+            return future
+
+    def _read_body(self, response) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Read a streamed image body, stopping after the header if its
+        dimensions can't hold a QR code
+
+        Returns:
+            (body, None) or (None, skip reason)
+        """
+        chunks = response.iter_content(chunk_size=8192)
+        head = b''
+        for chunk in chunks:
+            head += chunk
+            size = dimensions_from_header(head)
+            if size is not None:
+                reason = self.prefilter.check_dimensions(*size)
+                if reason:
+                    return None, reason
+                try:
+                    check_pixels(*size)
+                except ImageTooLarge:
+                    return None, 'too_large'
+                break
+            if len(head) >= HEADER_BYTES:
+                break
+
+        # Never hold more than max_image_bytes of one image in memory
+        body = bytearray(head)
+        for chunk in chunks:
+            body += chunk
+            if len(body) > self.max_image_bytes:
+                return None, 'too_large'
+        return bytes(body), None
+
+    def fetch_one(self, url: str, fetch_stats: Optional[_StageStats] = None) -> Tuple[Optional[bytes], Optional[List[str]], Optional[str]]:
+        """
+        Download one image with cache revalidation and the header pre-filter
+
+        Returns:
+            (image bytes, None, None) for a fresh download, (None, cached QR contents, None)
+            when the server confirmed the cached copy with 304 Not Modified, or
+            (None, None, reason) when the header showed the image can't be a QR code
+        """
+        with self._slot_for(url):
+            started = time.time()
+            content, cached, skipped = None, None, None
+            response = None
+            try:
+                response = self.fetch(url, self.cache.conditional_headers(url))
+                if response.status_code == 304:
+                    cached = self.cache.revalidated(url)
+                    if cached is None:
+                        # Validators outlived the decode entry; download it properly
+                        response.close()
+                        response = self.fetch(url, {})
+                if cached is None:
+                    content, skipped = self._read_body(response)
+                    if content is not None:
+                        self.cache.remember_url(url, self.cache.hash_bytes(content), response.headers.get('ETag'),
+                                                response.headers.get('Last-Modified'))
+            except Exception as e:
+                logger.error(f"Error fetching image {url}: {e}")
+            finally:
+                if response is not None:
+                    response.close()
+            ended = time.time()
+        if fetch_stats is not None:
+            fetch_stats.add(started, ended, ended - started, len(content or b''),
+                            failed=content is None and cached is None and skipped is None)
+        return content, cached, skipped
+
+    def run(self, image_urls: List[str]) -> List[Dict[str, Any]]:
+        """
+        Fetch and decode all images
+
+        Returns:
+            [{'image_url': ..., 'qr_contents': [...]}] for images containing QR codes, in input order
+        """
+        fetch_stats = _StageStats()
+        decode_stats = _StageStats()
+        cache_before = self.cache.get_stats()
+        started = time.time()
+        cached_results: Dict[int, List[str]] = {}
+        decode_futures: Dict[int, Tuple[Future, float, str]] = {}
+        lock = threading.Lock()
+        recorded = set()
+        inflight: Dict[str, Tuple[Future, float]] = {}
+        duplicates = [0]
+        skipped = {"tag": 0, "dimensions": 0, "finder": 0, "too_large": 0}
+        roi = {"hit": 0, "miss": 0, "learned": 0}
+
+        def record_decode(future: Future, submitted: float, content_hash: str):
+            # Called from the done callback, or from the collector if it got there first
+            with lock:
+                if content_hash in recorded:
+                    return
+                recorded.add(content_hash)
+            try:
+                decoded = future.result()
+                decode_stats.add(submitted, time.time(), decoded["seconds"], failed=decoded["error"] is not None)
+                with lock:
+                    if decoded.get("skipped"):
+                        skipped[decoded["skipped"]] += 1
+                    if decoded.get("roi"):
+                        roi[decoded["roi"]] += 1
+                self.cascade_stats.record(decoded.get("stages", []))
+                # Same bytes always decode the same way, so unreadable images are cached too;
+                # a finder-check skip is only a guess and a decode error (broken pool, missing
+                # zbar, out of memory) says nothing about the image, so both are left for a retry
+                if decoded.get("skipped") != "finder" and decoded["error"] is None:
+                    self.cache.put(content_hash, decoded["qr_contents"])
+            except Exception:
+                decode_stats.add(submitted, time.time(), 0.0, failed=True)
+
+        def fetch_and_submit(index: int, url: str):
+            content, cached, reason = self.fetch_one(url, fetch_stats)
+            if reason:
+                with lock:
+                    skipped[reason] += 1
+            if cached is None and content:
+                content_hash = self.cache.hash_bytes(content)
+                cached = self.cache.get(content_hash)
+                if cached is None:
+                    with lock:
+                        # The same image repeated on the page is decoded once
+                        pending = inflight.get(content_hash)
+                        if pending is None:
+                            pending = inflight[content_hash] = (self.submit_decode(content), time.time())
+                            submit_new = True
+                        else:
+                            submit_new = False
+                            duplicates[0] += 1
+                        decode_futures[index] = (pending[0], pending[1], content_hash)
+                    if submit_new:
+                        pending[0].add_done_callback(lambda f: record_decode(f, pending[1], content_hash))
+            if cached is not None:
+                with lock:
+                    cached_results[index] = cached
+
+        with ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix="qr-fetch") as executor:
+            list(executor.map(fetch_and_submit, range(len(image_urls)), image_urls))
+
+        results = []
+        for index, url in enumerate(image_urls):
+            if index in cached_results:
+                qr_contents = cached_results[index]
+            elif index in decode_futures:
+                future, submitted, content_hash = decode_futures[index]
+                try:
+                    decoded = future.result()
+                except Exception as e:
+                    decoded = {"qr_contents": [], "seconds": 0.0, "error": str(e)}
+                record_decode(future, submitted, content_hash)
+                if decoded["error"]:
+                    logger.error(f"Error extracting QR code from {url}: {decoded['error']}")
+                qr_contents = decoded["qr_contents"]
+            else:
+                continue
+            if qr_contents:
+                logger.info(f"Found {len(qr_contents)} QR codes in image: {url}")
+                results.append({'image_url': url, 'qr_contents': qr_contents})
+
+        cache_after = self.cache.get_stats()
+        hits = sum(cache_after[k] - cache_before[k] for k in ("memory_hits", "disk_hits"))
+        lookups = hits + cache_after["misses"] - cache_before["misses"]
+        self.last_stats = {
+            "images": len(image_urls),
+            "with_qr": len(results),
+            "wall_seconds": round(time.time() - started, 3),
+            "fetch": fetch_stats.as_dict(),
+            "decode": decode_stats.as_dict(),
+            "prefilter": skipped,
+            "decoders": self.cascade_stats.get_stats(),
+            "roi": roi,
+            "cache": {
+                "hits": hits,
+                "revalidated": cache_after["revalidated"] - cache_before["revalidated"],
+                "duplicates_in_run": duplicates[0],
+                "lookups": lookups,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+            },
+        }
+        logger.info(f"QR pipeline: {self.last_stats}")
+        return results
+
+    def run_page(self, soup, base_url: str) -> List[Dict[str, Any]]:
+        """Run the pipeline on a page's <img> tags, dropping tags that can't be QR codes first"""
+        candidates = []
+        tag_skipped = 0
+        for img in soup.find_all('img'):
+            if not img.get('src'):
+                continue
+            url = urljoin(base_url, img.get('src'))
+            if self.prefilter.check_tag(img, url):
+                tag_skipped += 1
+            else:
+                candidates.append(url)
+        results = self.run(candidates)
+        self.last_stats["images"] += tag_skipped
+        self.last_stats["prefilter"]["tag"] = tag_skipped
+        return results
+
+    def decode_url(self, url: str) -> List[str]:
+        """QR contents of a single image (cached like a page run)"""
+        results = self.run([url])
+        return results[0]['qr_contents'] if results else []
+
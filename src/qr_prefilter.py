@@ -0,0 +1,147 @@
+import os
+import re
+import logging
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+from PIL import Image, ImageFile
+
+from .image_loader import DECODE_MAX_SIDE
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Anything mentioning QR is always a candidate
+QR_HINT = re.compile(r'(?:^|[^a-z])qr(?:[^a-z]|$)|qrcode|barcode', re.IGNORECASE)
+# Page furniture that never carries a QR code
+SKIP_HINT = re.compile(
+    r'spacer|pixel|blank|transparent|favicon|icon|sprite|loader|loading|spinner|'
+    r'arrow|bullet|button|banner|logo|captcha|avatar|emblem|flag',
+    re.IGNORECASE
+)
+SKIP_EXTENSIONS = ('.svg', '.ico')
+
+HEADER_BYTES = 64 * 1024
+
+# The finder check runs once at the decoder's working size: shrinking pages
+# further turns 2-3 px modules into mush and rejects readable codes
+FINDER_MAX_SIDE = int(os.getenv('QR_FINDER_MAX_SIDE') or DECODE_MAX_SIDE)
+
+
+def _int_attr(value) -> Optional[int]:
+    try:
+        return int(str(value).strip().lower().replace('px', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+class QRPrefilter:
+    def __init__(self, min_side: Optional[int] = None, max_aspect: float = 4.0):
+        """
+        Cheap checks that rule images out before they are downloaded or decoded.
+
+        Args:
+            min_side: Smallest width/height that can hold a readable QR code (QR_MIN_SIDE, default 32)
+            max_aspect: Skip images more elongated than this (banners, rules)
+        """
+        self.min_side = min_side or int(os.getenv('QR_MIN_SIDE', '32'))
+        self.max_aspect = max_aspect
+
+    def check_tag(self, img, url: str) -> Optional[str]:
+        """
+        Stage 1: URL, alt text and width/height attributes of an <img> tag
+
+        Returns:
+            Reason to skip, or None if the image is a candidate
+        """
+        if url.startswith('data:'):
+            return 'inline'
+        text = ' '.join(str(img.get(attr) or '') for attr in ('alt', 'title', 'id', 'class'))
+        path = urlsplit(url).path
+        if QR_HINT.search(path) or QR_HINT.search(text):
+            return None
+        if path.lower().endswith(SKIP_EXTENSIONS):
+            return 'url'
+        if SKIP_HINT.search(os.path.basename(path)) or SKIP_HINT.search(text):
+            return 'url'
+        width, height = _int_attr(img.get('width')), _int_attr(img.get('height'))
+        if width and height:
+            return self.check_dimensions(width, height)
+        if (width and width < self.min_side) or (height and height < self.min_side):
+            return 'dimensions'
+        return None
+
+    def check_dimensions(self, width: int, height: int) -> Optional[str]:
+        """Stage 2: real or declared pixel size"""
+        if min(width, height) < self.min_side:
+            return 'dimensions'
+        if max(width, height) / max(min(width, height), 1) > self.max_aspect:
+            return 'dimensions'
+        return None
+
+
+def dimensions_from_header(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the first bytes of an image, or None if not known yet"""
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except Exception:
+        return None
+    if parser.image is not None:
+        return parser.image.size
+    return None
+
+
+def count_finder_patterns(gray: np.ndarray, max_side: Optional[int] = FINDER_MAX_SIDE) -> int:
+    """
+    Count QR finder-pattern candidates (a dark square inside a light ring
+    inside a dark ring) on a grayscale copy no larger than max_side using
+    contour nesting.
+    max_side=None counts at full resolution.
+    """
+    height, width = gray.shape[:2]
+    scale = 1.0 if max_side is None else min(1.0, max_side / float(max(height, width)))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    contours, hierarchy = cv2.findContours(binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return 0
+
+    hierarchy = hierarchy[0]
+    found = 0
+    for index, contour in enumerate(contours):
+        depth = 0
+        child = hierarchy[index][2]
+        while child != -1 and depth < 3:
+            depth += 1
+            child = hierarchy[child][2]
+        if depth < 2:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        if w >= 7 and h >= 7 and 0.6 <= w / float(h) <= 1.67:
+            found += 1
+    return found
+
+
+def may_contain_qr(image: Image.Image) -> bool:
+    """
+    Stage 3: fast finder-pattern check before the full decoder, a single
+    contour pass on the image as loaded for decoding. Errs on the side of
+    letting images through (any doubt -> True).
+    """
+    if not CV2_AVAILABLE:
+        return True
+    try:
+        gray = np.asarray(image if image.mode == 'L' else image.convert('L'))
+        return count_finder_patterns(gray) >= 2
+    except Exception as e:
+        logger.debug(f"Finder pattern check failed: {e}")
+        return True
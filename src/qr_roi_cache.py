@@ -0,0 +1,405 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .qr_cascade import run_cascade
+
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ROI_CACHE_ENABLED = CV2_AVAILABLE and os.getenv('QR_ROI_CACHE', 'true').lower() != 'false'
+
+# Region as (x0, y0, x1, y1) fractions of the frame, so it holds at any DPI or scale
+Region = Tuple[float, float, float, float]
+
+LAYOUT_SIDE = 24
+
+
+def layout_fingerprint(gray: np.ndarray) -> Tuple[str, bytes]:
+    """
+    (aspect bucket, 24x24 layout thumbnail) of a page. At this size the text
+    averages out to grey blocks while rules, boxes, logos and the QR code
+    itself stay visible, so pages of one template correlate strongly.
+    """
+    height, width = gray.shape[:2]
+    aspect = f"{round(width / float(height) * 20)}"
+    small = cv2.resize(gray, (LAYOUT_SIDE, LAYOUT_SIDE), interpolation=cv2.INTER_AREA)
+    return aspect, small.tobytes()
+
+
+def _normalized(layout: bytes) -> np.ndarray:
+    vector = np.frombuffer(layout, dtype=np.uint8).astype(np.float32)
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def locate_qr(gray: np.ndarray) -> List[Tuple[int, int, int, int]]:
+    """Pixel boxes (x0, y0, x1, y1) of the QR codes in an image that is known to contain some"""
+    boxes = []
+    try:
+        from pyzbar.pyzbar import decode
+        for obj in decode(gray):
+            left, top, width, height = obj.rect
+            boxes.append((left, top, left + width, top + height))
+    except Exception as e:
+        logger.debug(f"pyzbar could not locate QR code: {e}")
+    if not boxes and CV2_AVAILABLE:
+        found, points = cv2.QRCodeDetector().detectMulti(gray)
+        if found and points is not None:
+            for corners in points:
+                xs, ys = corners[:, 0], corners[:, 1]
+                boxes.append((int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())))
+    return boxes
+
+
+def region_to_pixels(region: Region, size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    width, height = size
+    return (int(region[0] * width), int(region[1] * height),
+            int(np.ceil(region[2] * width)), int(np.ceil(region[3] * height)))
+
+
+def _overlap(a: Region, b: Region) -> float:
+    """Intersection over the smaller region"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    smaller = min((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]))
+    return width * height / smaller if smaller else 0.0
+
+
+class QRROICache:
+    def __init__(self, db_path: Optional[str] = None, min_similarity: float = 0.85, max_regions: int = 4,
+                 padding: float = 0.5, refresh_seconds: float = 30.0, max_templates: Optional[int] = None):
+        """
+        Where QR codes sit on each document template. Pages are matched to a
+        template by layout fingerprint; the learned regions of interest are
+        decoded first and the full frame only on a miss. Each full-frame hit
+        teaches the template where its QR codes are and how many there are.
+
+        Meant for document pages (PDFs and IGR result scans), not arbitrary
+        web images: every unmatched page with a QR code becomes a template.
+
+        Args:
+            db_path: SQLite file shared by the decode worker processes (QR_ROI_DB, "" = memory only)
+            min_similarity: Smallest layout correlation for a page to count as a known template
+            max_regions: Regions kept per template (least hit dropped)
+            padding: Margin around a learned QR box, as a fraction of its size
+            refresh_seconds: How often a worker checks for templates learned by other processes
+            max_templates: Templates kept (QR_ROI_MAX_TEMPLATES, default 500); least recently used dropped first
+        """
+        if db_path is None:
+            db_path = os.getenv('QR_ROI_DB', os.path.join('data', 'qr_roi_templates.sqlite'))
+        self.db_path = db_path
+        self.min_similarity = min_similarity
+        self.max_regions = max_regions
+        self.padding = padding
+        self.refresh_seconds = refresh_seconds
+        self.max_templates = max_templates or int(os.getenv('QR_ROI_MAX_TEMPLATES', '500'))
+        self._lock = threading.Lock()
+        # template id -> {"aspect", "layout", "codes", "used", "regions": [[x0, y0, x1, y1, hits]]}
+        self._templates: Dict[int, Dict[str, Any]] = {}
+        # aspect bucket -> (template ids, stacked layouts) for one matrix product per lookup
+        self._index: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 1
+        self._checked_at = 0.0
+        self._data_version: Optional[int] = None
+        self.stats = {"lookups": 0, "matched": 0, "roi_hits": 0, "roi_misses": 0, "learned": 0, "evicted": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            try:
+                directory = os.path.dirname(db_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS templates ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, aspect TEXT NOT NULL, layout BLOB NOT NULL, created REAL NOT NULL, "
+                    "codes INTEGER NOT NULL DEFAULT 1, last_used REAL)"
+                )
+                for column in ("codes INTEGER NOT NULL DEFAULT 1", "last_used REAL"):
+                    try:
+                        self._db.execute(f"ALTER TABLE templates ADD COLUMN {column}")
+                    except sqlite3.OperationalError:
+                        pass  # column already there
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS regions ("
+                    "template_id INTEGER NOT NULL, x0 REAL, y0 REAL, x1 REAL, y1 REAL, "
+                    "hits INTEGER NOT NULL DEFAULT 0, last_hit REAL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS regions_template ON regions(template_id)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"QR ROI database unavailable ({e}), using memory only")
+                self._db = None
+
+    # ----- templates -----
+
+    def _refresh(self):
+        """Reload templates, but only when another process has written to the database"""
+        if self._db is None or time.time() - self._checked_at < self.refresh_seconds:
+            return
+        self._checked_at = time.time()
+        try:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            templates = {}
+            for template_id, aspect, layout, codes, last_used in self._db.execute(
+                    "SELECT id, aspect, layout, codes, last_used FROM templates"):
+                templates[template_id] = {"aspect": aspect, "layout": _normalized(layout), "codes": codes or 1,
+                                          "used": last_used or 0.0, "regions": []}
+            for template_id, x0, y0, x1, y1, hits in self._db.execute(
+                    "SELECT template_id, x0, y0, x1, y1, hits FROM regions ORDER BY hits DESC"):
+                if template_id in templates and len(templates[template_id]["regions"]) < self.max_regions:
+                    templates[template_id]["regions"].append([x0, y0, x1, y1, hits])
+            self._templates = templates
+            self._data_version = data_version
+            self._index = {}
+        except sqlite3.Error as e:
+            logger.warning(f"QR ROI read failed: {e}")
+
+    def _index_for(self, aspect: str) -> Tuple[List[int], np.ndarray]:
+        if aspect not in self._index:
+            ids = [template_id for template_id, template in self._templates.items() if template["aspect"] == aspect]
+            layouts = (np.stack([self._templates[template_id]["layout"] for template_id in ids]) if ids
+                       else np.zeros((0, LAYOUT_SIDE * LAYOUT_SIDE), dtype=np.float32))
+            self._index[aspect] = (ids, layouts)
+        return self._index[aspect]
+
+    def lookup(self, image: Image.Image) -> Dict[str, Any]:
+        """
+        Match a page against the known templates
+
+        Returns:
+            {"fingerprint": (aspect, layout), "template_id": id or None, "regions": [Region, ...],
+             "codes": QR codes the template's pages carry}
+        """
+        gray = np.asarray(image if image.mode == 'L' else image.convert('L'))
+        aspect, layout = layout_fingerprint(gray)
+        vector = _normalized(layout)
+        best = None
+        with self._lock:
+            self._refresh()
+            self.stats["lookups"] += 1
+            ids, layouts = self._index_for(aspect)
+            if ids:
+                similarities = layouts @ vector
+                index = int(np.argmax(similarities))
+                if similarities[index] >= self.min_similarity:
+                    best = ids[index]
+            regions, codes = [], 1
+            if best is not None:
+                template = self._templates[best]
+                regions = [tuple(r[:4]) for r in template["regions"]]
+                codes = template["codes"]
+                template["used"] = time.time()
+                self.stats["matched"] += 1
+        return {"fingerprint": (aspect, layout), "template_id": best, "regions": regions, "codes": codes}
+
+    def _create_template(self, fingerprint: Tuple[str, bytes], codes: int) -> int:
+        aspect, layout = fingerprint
+        now = time.time()
+        template_id = None
+        if self._db is not None:
+            try:
+                cursor = self._db.execute(
+                    "INSERT INTO templates (aspect, layout, created, codes, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (aspect, layout, now, codes, now)
+                )
+                self._db.commit()
+                template_id = cursor.lastrowid
+            except sqlite3.Error as e:
+                logger.warning(f"QR ROI write failed: {e}")
+        if template_id is None:
+            template_id = self._next_id
+            self._next_id += 1
+        self._templates[template_id] = {"aspect": aspect, "layout": _normalized(layout), "codes": codes,
+                                        "used": now, "regions": []}
+        self._index.pop(aspect, None)
+        self._evict()
+        return template_id
+
+    def _evict(self):
+        """Drop least recently used templates above max_templates"""
+        excess = len(self._templates) - self.max_templates
+        if excess <= 0:
+            return
+        evicted = sorted(self._templates, key=lambda template_id: self._templates[template_id]["used"])[:excess]
+        for template_id in evicted:
+            self._index.pop(self._templates.pop(template_id)["aspect"], None)
+        self.stats["evicted"] += len(evicted)
+        if self._db is not None:
+            try:
+                self._db.executemany("DELETE FROM regions WHERE template_id = ?", [(i,) for i in evicted])
+                self._db.executemany("DELETE FROM templates WHERE id = ?", [(i,) for i in evicted])
+                # Templates only other processes used recently are still in the table; trim it too
+                self._db.execute(
+                    "DELETE FROM templates WHERE id NOT IN "
+                    "(SELECT id FROM templates ORDER BY COALESCE(last_used, created) DESC LIMIT ?)",
+                    (self.max_templates,)
+                )
+                self._db.execute("DELETE FROM regions WHERE template_id NOT IN (SELECT id FROM templates)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"QR ROI write failed: {e}")
+
+    # ----- regions -----
+
+    def decode(self, image: Image.Image, order: Optional[List[str]] = None) -> Tuple[List[str], Dict[str, Any]]:
+        """
+        Decode only the learned regions of the page's template
+
+        Returns:
+            (QR contents, lookup for learn()). The contents are only returned when
+            the regions held as many codes as the template's pages carry, so a
+            partial result never replaces the full-frame decode; otherwise [].
+        """
+        lookup = self.lookup(image)
+        found: List[str] = []
+        hit_regions = []
+        for region in lookup["regions"]:
+            qr_data, _ = run_cascade(image.crop(region_to_pixels(region, image.size)), order)
+            new = [code for code in qr_data if code not in found]
+            if new:
+                found += new
+                hit_regions.append(region)
+                if len(found) >= lookup["codes"]:
+                    self.record_hit(lookup, *hit_regions)
+                    return found, lookup
+        if lookup["regions"]:
+            self.record_miss(lookup)
+        return [], lookup
+
+    def record_hit(self, lookup: Dict[str, Any], *regions: Region):
+        """A page decoded from its template's regions (one hit, however many regions it took)"""
+        with self._lock:
+            self.stats["roi_hits"] += 1
+            hit = {tuple(region) for region in regions}
+            for stored in self._templates.get(lookup["template_id"], {}).get("regions", []):
+                if tuple(stored[:4]) in hit:
+                    stored[4] += 1
+            if self._db is not None:
+                try:
+                    now = time.time()
+                    self._db.executemany(
+                        "UPDATE regions SET hits = hits + 1, last_hit = ? "
+                        "WHERE template_id = ? AND x0 = ? AND y0 = ? AND x1 = ? AND y1 = ?",
+                        [(now, lookup["template_id"], *region) for region in regions]
+                    )
+                    self._db.execute("UPDATE templates SET last_used = ? WHERE id = ?", (now, lookup["template_id"]))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"QR ROI write failed: {e}")
+
+    def record_miss(self, lookup: Dict[str, Any]):
+        with self._lock:
+            self.stats["roi_misses"] += 1
+
+    def learn(self, image: Image.Image, lookup: Dict[str, Any], within: Optional[Region] = None,
+              codes: Optional[int] = None) -> List[Region]:
+        """
+        Remember where the QR codes are after a full-frame hit
+
+        Args:
+            image: The frame the QR code was decoded from
+            lookup: Result of lookup()/decode() for the page
+            within: Part of the page the image covers, if it is a crop
+            codes: QR codes the full decode found on the page (default: codes located in the image)
+
+        Returns:
+            Regions added
+        """
+        gray = np.asarray(image if image.mode == 'L' else image.convert('L'))
+        boxes = locate_qr(gray)
+        if not boxes:
+            return []
+        codes = max(codes or 0, len(boxes))
+        height, width = gray.shape[:2]
+        offset_x, offset_y, span_x, span_y = 0.0, 0.0, 1.0, 1.0
+        if within:
+            offset_x, offset_y = within[0], within[1]
+            span_x, span_y = within[2] - within[0], within[3] - within[1]
+
+        added = []
+        with self._lock:
+            template_id = lookup["template_id"]
+            if template_id is None or template_id not in self._templates:
+                template_id = lookup["template_id"] = self._create_template(lookup["fingerprint"], codes)
+            template = self._templates[template_id]
+            if codes > template["codes"]:
+                template["codes"] = codes
+                self._execute("UPDATE templates SET codes = ? WHERE id = ?", (codes, template_id))
+            regions = template["regions"]
+            for x0, y0, x1, y1 in boxes:
+                pad_x, pad_y = (x1 - x0) * self.padding, (y1 - y0) * self.padding
+                region = (
+                    round(offset_x + max(0.0, (x0 - pad_x) / width) * span_x, 4),
+                    round(offset_y + max(0.0, (y0 - pad_y) / height) * span_y, 4),
+                    round(offset_x + min(1.0, (x1 + pad_x) / width) * span_x, 4),
+                    round(offset_y + min(1.0, (y1 + pad_y) / height) * span_y, 4),
+                )
+                if any(_overlap(region, tuple(r[:4])) > 0.8 for r in regions):
+                    continue
+                regions.append([*region, 1])
+                added.append(region)
+                self._execute(
+                    "INSERT INTO regions (template_id, x0, y0, x1, y1, hits, last_hit) VALUES (?, ?, ?, ?, ?, 1, ?)",
+                    (template_id, *region, time.time())
+                )
+            regions.sort(key=lambda r: -r[4])
+            if len(regions) > self.max_regions:
+                del regions[self.max_regions:]
+                # Keep the table in step with memory instead of growing it on every lesson
+                self._execute(
+                    "DELETE FROM regions WHERE template_id = ? AND rowid NOT IN "
+                    "(SELECT rowid FROM regions WHERE template_id = ? ORDER BY hits DESC LIMIT ?)",
+                    (template_id, template_id, self.max_regions)
+                )
+            self.stats["learned"] += len(added)
+        return added
+
+    def _execute(self, sql: str, parameters: tuple):
+        """One write, committed; failures only cost the persistence"""
+        if self._db is None:
+            return
+        try:
+            self._db.execute(sql, parameters)
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"QR ROI write failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["templates"] = len(self._templates)
+        attempts = stats["roi_hits"] + stats["roi_misses"]
+        stats["roi_hit_rate"] = round(stats["roi_hits"] / attempts, 3) if attempts else None
+        return stats
+
+
+_default_cache: Optional[QRROICache] = None
+_default_lock = threading.Lock()
+
+
+def get_roi_cache() -> QRROICache:
+    """Per-process ROI cache; worker processes share templates through the SQLite file"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = QRROICache()
+        return _default_cache
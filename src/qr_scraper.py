@@ -1,12 +1,11 @@
 import requests
 from bs4 import BeautifulSoup
-from PIL import Image
-from pyzbar.pyzbar import decode
-import io
 import logging
 from typing import List, Dict, Optional
-from urllib.parse import urljoin, urlparse
 from .proxy_manager import ProxyManager
+from .bandwidth_tracker import BandwidthTracker, get_bandwidth_tracker
+from .rate_governor import RateGovernor, get_rate_governor
+from .qr_pipeline import QRPipeline
 import urllib3
 
 # Disable SSL warnings
@@ -15,8 +14,14 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
 class QRScraper:
-    def __init__(self, proxy_manager: Optional[ProxyManager] = None):
+    def __init__(self, proxy_manager: Optional[ProxyManager] = None,
+                 bandwidth_tracker: Optional[BandwidthTracker] = None,
+                 rate_governor: Optional[RateGovernor] = None):
         self.proxy_manager = proxy_manager or ProxyManager()
+        self.bandwidth_tracker = bandwidth_tracker or get_bandwidth_tracker()
+        self.rate_governor = rate_governor or get_rate_governor()
+        # Concurrent downloads feeding a process pool of decoders
+        self.qr_pipeline = QRPipeline(self.fetch_image)
         
         # Headers to mimic a real browser
         self.headers = {
@@ -27,37 +32,33 @@ class QRScraper:
             'Connection': 'keep-alive',
         }
         
+    def fetch_image(self, image_url: str, extra_headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Download an image (runs on the pipeline's fetch threads)"""
+        # Get proxy configuration if available
+        proxies = self.proxy_manager.get_proxy()
+        self.bandwidth_tracker.enforce(stage='qr_image')
+        self.rate_governor.acquire(image_url, image=True)
+        
+        # Download the image with SSL verification disabled and headers
+        response = requests.get(
+            image_url, 
+            proxies=proxies,
+            headers={**self.headers, **(extra_headers or {})},
+            verify=False,  # Disable SSL verification
+            timeout=30,
+            stream=True,  # the pipeline may stop after the image header
+            hooks=self.bandwidth_tracker.hooks('qr_image')
+        )
+        response.raise_for_status()
+        return response
+        
     def extract_qr_from_image_url(self, image_url: str) -> List[str]:
         """
         Extract QR code data from an image URL
         Returns a list of decoded QR code contents
         """
         try:
-            # Get proxy configuration if available
-            proxies = self.proxy_manager.get_proxy()
-            
-            # Download the image with SSL verification disabled and headers
-            response = requests.get(
-                image_url, 
-                proxies=proxies,
-                headers=self.headers,
-                verify=False,  # Disable SSL verification
-                timeout=30
-            )
-            response.raise_for_status()
-            
-            # Open the image using PIL
-            image = Image.open(io.BytesIO(response.content))
-            
-            # Convert to RGB if necessary for better QR detection
-            if image.mode not in ['RGB', 'L']:
-                image = image.convert('RGB')
-            
-            # Decode QR codes
-            decoded_objects = decode(image)
-            
-            # Extract and return QR code data
-            qr_data = [obj.data.decode('utf-8') for obj in decoded_objects]
+            qr_data = self.qr_pipeline.decode_url(image_url)
             
             if qr_data:
                 logger.info(f"Found {len(qr_data)} QR codes in image: {image_url}")
@@ -78,6 +79,7 @@ class QRScraper:
         try:
             # Get proxy configuration if available
             proxies = self.proxy_manager.get_proxy()
+            self.rate_governor.acquire(url)
             
             # Fetch the webpage with SSL verification disabled and headers
             response = requests.get(
@@ -85,30 +87,16 @@ class QRScraper:
                 proxies=proxies,
                 headers=self.headers,
                 verify=False,  # Disable SSL verification
-                timeout=30
+                timeout=30,
+                hooks=self.bandwidth_tracker.hooks('page')
             )
             response.raise_for_status()
             
             # Parse HTML
             soup = BeautifulSoup(response.text, 'html.parser')
             
-            # Find all image tags
-            images = soup.find_all('img')
-            
-            results = []
-            for img in images:
-                img_url = img.get('src', '')
-                
-                if img_url:
-                    # Use urljoin to properly handle relative URLs
-                    full_img_url = urljoin(url, img_url)
-                    
-                    qr_data = self.extract_qr_from_image_url(full_img_url)
-                    if qr_data:
-                        results.append({
-                            'image_url': full_img_url,
-                            'qr_contents': qr_data
-                        })
+            # Fetch and decode all images concurrently; results keep page order
+            results = self.qr_pipeline.run_page(soup, url)
             
             logger.info(f"Found QR codes in {len(results)} images on {url}")
             return results
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    _HAS_FCNTL = False
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitTimeout(Exception):
+    """Raised when tokens could not be acquired within the timeout"""
+    pass
+
+
+class _FileLock:
+    """Exclusive lock on an open file, shared by threads and processes"""
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def __enter__(self):
+        if _HAS_FCNTL:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        else:
+            self.handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self.handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        if _HAS_FCNTL:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+        else:
+            self.handle.seek(0)
+            msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class RateGovernor:
+    def __init__(self, state_dir: Optional[str] = None, default_rate: Optional[float] = None,
+                 default_burst: Optional[int] = None, limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 recovery_seconds: float = 120, image_rate: Optional[float] = None,
+                 image_burst: Optional[int] = None, strict_domains: Optional[Tuple[str, ...]] = None):
+        """
+        Token-bucket rate governor per upstream host, shared across threads and
+        processes through a locked state file per host.
+
+        Args:
+            state_dir: Directory for bucket state files (RATE_GOVERNOR_DIR)
+            default_rate: Tokens per second for hosts without an explicit limit (RATE_LIMIT_RPS)
+            default_burst: Bucket size for hosts without an explicit limit (RATE_LIMIT_BURST)
+            limits: {host: (rate, burst)} overrides
+            recovery_seconds: Time for a penalized rate to recover back to full speed
+            image_rate: Tokens per second for image fetches from other hosts (RATE_LIMIT_IMAGE_RPS)
+            image_burst: Bucket size for image fetches from other hosts (RATE_LIMIT_IMAGE_BURST)
+            strict_domains: Domains whose images share the page bucket (RATE_LIMIT_STRICT_DOMAINS)
+        """
+        self.state_dir = state_dir or os.getenv(
+            'RATE_GOVERNOR_DIR', os.path.join(tempfile.gettempdir(), 'igr_rate_governor')
+        )
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.default_rate = default_rate if default_rate is not None else float(os.getenv('RATE_LIMIT_RPS', '2'))
+        self.default_burst = default_burst if default_burst is not None else int(os.getenv('RATE_LIMIT_BURST', '4'))
+        self.limits: Dict[str, Tuple[float, int]] = dict(limits or {})
+        self.recovery_seconds = recovery_seconds
+        self.image_rate = image_rate if image_rate is not None else float(os.getenv('RATE_LIMIT_IMAGE_RPS', '20'))
+        self.image_burst = image_burst if image_burst is not None else int(os.getenv('RATE_LIMIT_IMAGE_BURST', '20'))
+        if strict_domains is None:
+            strict_domains = tuple(d.strip().lower() for d in
+                                   os.getenv('RATE_LIMIT_STRICT_DOMAINS', 'igrmaharashtra.gov.in').split(',')
+                                   if d.strip())
+        self.strict_domains = strict_domains
+        self._thread_lock = threading.Lock()
+
+    @staticmethod
+    def host_key(host_or_url: str) -> str:
+        if '://' in host_or_url:
+            return urlsplit(host_or_url).hostname or host_or_url
+        return host_or_url
+
+    def configure(self, host: str, rate: float, burst: int):
+        """Set the rate (tokens/second) and burst for a host"""
+        self.limits[self.host_key(host)] = (float(rate), int(burst))
+
+    def _limit_for(self, host: str) -> Tuple[float, int]:
+        return self.limits.get(host, (self.default_rate, self.default_burst))
+
+    def _bucket(self, host: str, image: bool) -> Tuple[str, Optional[Tuple[float, int]]]:
+        """
+        Bucket key and limit for a request. Images from the site itself (strict
+        domains) or from hosts with an explicit limit count against the host's
+        bucket; images from other hosts (CDNs) get their own, faster bucket.
+        """
+        if not image or host in self.limits:
+            return host, None
+        lowered = host.lower()
+        if any(lowered == d or lowered.endswith('.' + d) for d in self.strict_domains):
+            return host, None
+        return f"{host}#images", (self.image_rate, self.image_burst)
+
+    def _state_path(self, host: str) -> str:
+        safe = ''.join(c if c.isalnum() or c in '.-' else '_' for c in host)
+        return os.path.join(self.state_dir, f"{safe}.bucket")
+
+    def _update(self, host: str, tokens: float, penalize: Optional[float] = None,
+                limit: Optional[Tuple[float, int]] = None) -> float:
+        """
+        Refill and try to take ``tokens`` under the file lock
+
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        rate, burst = limit or self._limit_for(host)
+        path = self._state_path(host)
+        with self._thread_lock, open(path, 'a+') as handle, _FileLock(handle):
+            handle.seek(0)
+            raw = handle.read()
+            now = time.time()
+            try:
+                state = json.loads(raw) if raw.strip() else {}
+            except ValueError:
+                state = {}
+            available = float(state.get('tokens', burst))
+            updated = float(state.get('updated', now))
+            scale = float(state.get('scale', 1.0))
+
+            # Penalized rates recover linearly back to full speed
+            scale = min(1.0, scale + (now - updated) / self.recovery_seconds)
+            if penalize is not None:
+                scale = max(0.05, scale * penalize)
+                available = min(available, 0.0)
+            effective_rate = rate * scale
+            available = min(float(burst), available + (now - updated) * effective_rate)
+
+            # Requests larger than the bucket go into debt instead of waiting forever
+            needed = min(tokens, burst)
+            wait = 0.0
+            if penalize is None:
+                if available >= needed:
+                    available -= tokens
+                else:
+                    wait = (needed - available) / effective_rate
+
+            handle.seek(0)
+            handle.truncate()
+            handle.write(json.dumps({'tokens': available, 'updated': now, 'scale': scale}))
+            handle.flush()
+            return wait
+
+    def acquire(self, host_or_url: str, tokens: float = 1, timeout: Optional[float] = None,
+                image: bool = False) -> float:
+        """
+        Block until ``tokens`` are available for the host
+
+        Args:
+            image: Image fetch (uses the image bucket unless the host is a strict domain)
+
+        Returns:
+            Seconds spent waiting
+        """
+        host = self.host_key(host_or_url)
+        bucket, limit = self._bucket(host, image)
+        start = time.time()
+        while True:
+            wait = self._update(bucket, tokens, limit=limit)
+            if wait <= 0:
+                waited = time.time() - start
+                if waited > 1:
+                    logger.debug(f"Rate governor delayed {host} by {waited:.2f}s")
+                return waited
+            if timeout is not None and time.time() - start + wait > timeout:
+                raise RateLimitTimeout(f"Could not acquire {tokens} token(s) for {host} within {timeout}s")
+            time.sleep(min(wait, 1.0))
+
+    def try_acquire(self, host_or_url: str, tokens: float = 1, image: bool = False) -> bool:
+        """Take tokens only if available right now"""
+        bucket, limit = self._bucket(self.host_key(host_or_url), image)
+        return self._update(bucket, tokens, limit=limit) <= 0
+
+    def penalize(self, host_or_url: str, factor: float = 0.5):
+        """Slow a host down after a 429/block; the rate recovers over recovery_seconds"""
+        host = self.host_key(host_or_url)
+        self._update(host, 0, penalize=factor)
+        logger.info(f"Rate governor slowed down {host} (x{factor})")
+
+
+_default_governor: Optional[RateGovernor] = None
+_default_lock = threading.Lock()
+
+
+def get_rate_governor() -> RateGovernor:
+    """Process-wide governor; state is shared with other processes via RATE_GOVERNOR_DIR"""
+    global _default_governor
+    with _default_lock:
+        if _default_governor is None:
+            _default_governor = RateGovernor()
+        return _default_governor
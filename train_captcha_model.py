@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+CAPTCHA Model Trainer
+Trains the small CNN CAPTCHA solver on labelled CAPTCHAs (data/captchas) and
+saves it where the automation scripts and the OCR service pick it up as their
+first-choice solver.
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+from src.captcha_cnn import CAPTCHA_DATA_DIR, CAPTCHA_MODEL_PATH, CaptchaCNN, load_labelled, prepare, split_labelled
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the CNN CAPTCHA solver on labelled CAPTCHAs')
+    parser.add_argument('--data-dir', default=CAPTCHA_DATA_DIR,
+                        help='Folder with labels.csv and/or labelled/<TEXT>.png images')
+    parser.add_argument('--model', default=CAPTCHA_MODEL_PATH, help='Output model file (.npz)')
+    parser.add_argument('--epochs', type=int, default=40, help='Training epochs')
+    parser.add_argument('--batch-size', type=int, default=32, help='Batch size')
+    parser.add_argument('--lr', type=float, default=1e-3, help='Adam learning rate')
+    parser.add_argument('--validation', type=float, default=0.1, help='Share of samples held out for validation')
+    parser.add_argument('--seed', type=int, default=0, help='Split, initialisation and augmentation seed')
+    parser.add_argument('--min-accuracy', type=float, default=0.0,
+                        help='Do not replace the model if validation accuracy ends below this')
+    args = parser.parse_args()
+
+    print("🧠 CAPTCHA MODEL TRAINER")
+    print("=" * 70)
+
+    labelled = load_labelled(args.data_dir)
+    if len(labelled) < 20:
+        print(f"❌ Only {len(labelled)} labelled CAPTCHAs in {args.data_dir} (need at least 20)")
+        print("   Add labels.csv (file,label) or images named labelled/<TEXT>.png")
+        sys.exit(1)
+
+    # Split on the files, not the decoded images, so benchmark_captcha.py can
+    # rebuild the same held-out set from the seed and share saved with the model
+    skipped = 0
+    training, validation = [], []
+    for part, samples in zip(split_labelled(labelled, args.validation, args.seed), (training, validation)):
+        for path, text in part:
+            try:
+                samples.append((prepare(path), text))
+            except Exception as e:
+                skipped += 1
+                print(f"   ⚠️ Skipping {path}: {e}")
+    if not training:
+        print(f"❌ No readable training CAPTCHAs left after holding out {args.validation:.0%}")
+        sys.exit(1)
+
+    alphabet = ''.join(sorted({char for _, text in training + validation for char in text}))
+    max_length = max(len(text) for _, text in training + validation)
+
+    print(f"   Samples: {len(training)} training, {len(validation)} validation ({skipped} unreadable)")
+    print(f"   Alphabet: {alphabet} ({len(alphabet)} characters), up to {max_length} per CAPTCHA")
+    print("=" * 70)
+
+    model = CaptchaCNN(alphabet, seed=args.seed)
+    started = time.time()
+    report = model.fit(training, epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.lr,
+                       validation=validation or None, seed=args.seed)
+    accuracy = report['best_accuracy']
+
+    # Inference speed on one CAPTCHA at a time, as the solvers use it
+    probe = [path for path, _ in labelled[:50]]
+    timer = time.perf_counter()
+    for path in probe:
+        model.solve(path)
+    ms_per_captcha = (time.perf_counter() - timer) / len(probe) * 1000
+
+    print("=" * 70)
+    if accuracy is not None:
+        print(f"✅ Best validation accuracy: {accuracy:.3f} (epoch {report['best_epoch']})")
+    print(f"⚡ Inference: {ms_per_captcha:.1f} ms per CAPTCHA (including decode), "
+          f"training took {time.time() - started:.0f}s")
+
+    if accuracy is not None and accuracy < args.min_accuracy:
+        print(f"❌ Below --min-accuracy {args.min_accuracy}; keeping the existing model")
+        sys.exit(1)
+
+    model.save(args.model, metadata={
+        "trained_at": datetime.now().isoformat(),
+        "samples": len(training),
+        "validation_samples": len(validation),
+        "validation_share": args.validation,
+        "data_dir": args.data_dir,
+        "validation_accuracy": accuracy,
+        "epochs": args.epochs,
+        "seed": args.seed,
+    })
+    print(f"📁 Model saved to: {os.path.abspath(args.model)}")
+
+
+if __name__ == "__main__":
+    main()